@@ -16,6 +16,7 @@ from quodlibet.const import MinVersions
 from quodlibet import config
 from quodlibet.util import is_osx, is_windows, i18n
 from quodlibet.util.dprint import print_e, PrintHandler
+from quodlibet.util.tracing import trace
 from quodlibet.util.urllib import install_urllib2_ca_file
 
 from ._main import get_base_dir, is_release, get_image_dir, get_cache_dir
@@ -52,10 +53,13 @@ def init(no_translations=False, no_excepthook=False, config_file=None):
         return
 
     init_cli(no_translations=no_translations, config_file=config_file)
-    _init_gtk()
-    _init_gtk_debug(no_excepthook=no_excepthook)
-    _init_gst()
-    _init_dbus()
+    with trace("init_gtk"):
+        _init_gtk()
+        _init_gtk_debug(no_excepthook=no_excepthook)
+    with trace("init_gst"):
+        _init_gst()
+    with trace("init_dbus"):
+        _init_dbus()
 
     _initialized = True
 
@@ -124,13 +128,18 @@ def init_cli(no_translations=False, config_file=None):
     if _cli_initialized:
         return
 
-    _init_python()
-    config.init_defaults()
-    if config_file is not None:
-        config.init(config_file)
-    _init_gettext(no_translations)
-    _init_formats()
-    _init_g()
+    with trace("init_python"):
+        _init_python()
+    with trace("init_config"):
+        config.init_defaults()
+        if config_file is not None:
+            config.init(config_file)
+    with trace("init_gettext"):
+        _init_gettext(no_translations)
+    with trace("init_formats"):
+        _init_formats()
+    with trace("init_g"):
+        _init_g()
 
     _cli_initialized = True
 
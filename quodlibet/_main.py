@@ -220,7 +220,8 @@ def init_plugins(no_plugins=False):
                for kind in PLUGIN_DIRS]
     folders.append(os.path.join(get_user_dir(), "plugins"))
     print_d("Scanning folders: %s" % folders)
-    pm = plugins.init(folders, no_plugins)
+    manifest_path = os.path.join(get_cache_dir(), "plugins.json")
+    pm = plugins.init(folders, no_plugins, manifest_path)
     pm.rescan()
 
     from quodlibet.qltk.edittags import EditTags
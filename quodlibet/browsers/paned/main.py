@@ -25,6 +25,7 @@ from quodlibet.qltk.searchbar import SearchBarBox
 from quodlibet.qltk.x import ScrolledWindow, Align
 from quodlibet.util.library import background_filter
 from quodlibet.util import connect_destroy
+from quodlibet.util.thread import Cancellable
 from quodlibet.qltk.paned import ConfigMultiRHPaned
 
 from .prefs import PreferencesButton, ColumnMode
@@ -71,6 +72,9 @@ class PanedBrowser(Browser, util.InstanceTracker):
 
         self._filter = lambda s: False
         self._library = library
+        self._cancellable = Cancellable()
+        # songs added or changed while searching, None if not searching
+        self.__searching = None
 
         self.set_spacing(6)
         self.set_orientation(Gtk.Orientation.VERTICAL)
@@ -114,6 +118,7 @@ class PanedBrowser(Browser, util.InstanceTracker):
             child.show_all()
 
     def __destroy(self, *args):
+        self._cancellable.cancel()
         del self._sb_box
 
     def set_column_mode(self, mode):
@@ -165,6 +170,8 @@ class PanedBrowser(Browser, util.InstanceTracker):
         self._panes[-1].get_selection().emit('changed')
 
     def __added(self, library, songs):
+        if self.__searching is not None:
+            self.__searching.update(songs)
         songs = list(filter(self._filter, songs))
         for pane in self._panes:
             pane.add(songs)
@@ -193,16 +200,41 @@ class PanedBrowser(Browser, util.InstanceTracker):
         return True
 
     def activate(self):
+        self.__search(False)
+
+    def __search(self, inhibit):
         star = dict.fromkeys(SongList.star)
         star.update(self.__star)
         query = self._sb_box.get_query(star.keys())
         if query.is_parsable:
-            self._filter = query.search
-            songs = list(filter(self._filter, self._library))
-            bg = background_filter()
-            if bg:
-                songs = list(filter(bg, songs))
-            self._panes[0].fill(songs)
+            # a newer query replaces the one still being searched for
+            self._cancellable.cancel()
+            self._cancellable = Cancellable()
+            self.__searching = set()
+            self._library.filter_query_async(
+                query, self._cancellable,
+                lambda songs: self.__fill(query, songs, inhibit))
+
+    def __fill(self, query, songs, inhibit):
+        # the library could have changed while searching in a thread
+        changed = self.__searching
+        self.__searching = None
+        library = self._library
+        songs = [s for s in songs if s in library and
+                 (s not in changed or query.search(s))]
+        found = set(songs)
+        songs.extend(s for s in changed if s not in found and
+                     s in library and query.search(s))
+        self._filter = query.search
+
+        bg = background_filter()
+        if bg:
+            songs = list(filter(bg, songs))
+        if inhibit:
+            self._panes[-1].inhibit()
+        self._panes[0].fill(songs)
+        if inhibit:
+            self._panes[-1].uninhibit()
 
     def scroll(self, song):
         for pane in self._panes:
@@ -242,9 +274,7 @@ class PanedBrowser(Browser, util.InstanceTracker):
                                            ColumnMode.SMALL))
 
     def fill_panes(self):
-        self._panes[-1].inhibit()
-        self.activate()
-        self._panes[-1].uninhibit()
+        self.__search(True)
 
     def make_pane_widths_equal(self):
         self.multi_paned.make_pane_widths_equal()
@@ -118,8 +118,23 @@ class PaneModel(ObjectStore):
         super(PaneModel, self).__init__()
         self.__sort_cache = {} # text to sort text cache
         self.__key_cache = {} # song to key cache
+        self.__song_entries = {} # song to the entries containing it
+        self.__empty = set() # entries without songs which are kept
         self.config = pattern_config
 
+    def clear(self):
+        super(PaneModel, self).clear()
+        self.__song_entries.clear()
+        self.__empty.clear()
+
+    def __index(self, entry, songs):
+        self.__empty.discard(entry)
+        song_entries = self.__song_entries
+        for song in songs:
+            entries = song_entries.setdefault(song, [])
+            if entry not in entries:
+                entries.append(entry)
+
     def get_format_keys(self, song):
         try:
             return self.__key_cache[song]
@@ -167,25 +182,45 @@ class PaneModel(ObjectStore):
         If remove_if_empty == True, entries with no songs will be removed.
         """
 
-        songs = set(songs)
+        key_cache = self.__key_cache
+        song_entries = self.__song_entries
 
-        for song in songs:
-            if song in self.__key_cache:
-                del self.__key_cache[song]
+        # entry -> removed songs, only for the entries containing them
+        affected = {}
+        for song in set(songs):
+            key_cache.pop(song, None)
+            for entry in song_entries.pop(song, ()):
+                affected.setdefault(entry, []).append(song)
+
+        empty = self.__empty
+        for entry, removed in affected.items():
+            entry.songs.difference_update(removed)
+            entry.update(removed=removed)
+            if not entry.songs:
+                empty.add(entry)
 
+        if not remove_if_empty:
+            empty = set()
+        if not affected and not empty:
+            return
+
+        changed = []
         to_remove = []
         for iter_, entry in self.iterrows():
-            if isinstance(entry, AllEntry):
-                continue
-            entry.songs -= songs
-            entry.finalize()
-            self.row_changed(self.get_path(iter_), iter_)
-            if not entry.songs:
+            if entry in empty:
                 to_remove.append(iter_)
+            elif entry in affected:
+                changed.append(iter_)
+
+        # emit all changes after the entries are updated
+        for iter_ in changed:
+            self.row_changed(self.get_path(iter_), iter_)
 
         if not remove_if_empty:
             return
 
+        self.__empty.clear()
+
         # remove from cache and the model
         for iter_ in to_remove:
             try:
@@ -232,9 +267,11 @@ class PaneModel(ObjectStore):
         # fast path
         if not len(self):
             if unknown.songs:
+                self.__index(unknown, unknown.songs)
                 self.insert(0, [unknown])
             entries = []
             for key, (val, sort_key, srtp) in items:
+                self.__index(val, val.songs)
                 entries.append(val)
             self.insert_many(0, reversed(entries))
             if len(self) > 1:
@@ -256,11 +293,14 @@ class PaneModel(ObjectStore):
                 key, (val, sort_key, srtp) = items.pop(-1)
 
             if key == entry.key: # Display strings the same
-                entry.songs |= val.songs
-                entry.finalize()
+                added = val.songs - entry.songs
+                entry.songs |= added
+                entry.update(added=added)
+                self.__index(entry, added)
                 self.row_changed(self.get_path(iter_), iter_)
                 key = None
             elif sort_key < entry.sort:
+                self.__index(val, val.songs)
                 self.insert_before(iter_, row=[val])
                 key = None
 
@@ -272,6 +312,7 @@ class PaneModel(ObjectStore):
         if items:
             entries = []
             for key, (val, srt, srtp) in items:
+                self.__index(val, val.songs)
                 entries.append(val)
             if isinstance(self[-1][0], UnknownEntry):
                 self.insert_many(len(self) - 1, entries)
@@ -287,10 +328,13 @@ class PaneModel(ObjectStore):
             last_row = self[-1]
             entry = last_row[0]
             if isinstance(entry, UnknownEntry):
-                entry.songs |= unknown.songs
-                entry.finalize()
+                added = unknown.songs - entry.songs
+                entry.songs |= added
+                entry.update(added=added)
+                self.__index(entry, added)
                 self.row_changed(last_row.path, last_row.iter)
             else:
+                self.__index(unknown, unknown.songs)
                 self.append(row=[unknown])
 
     def matches(self, paths, song):
@@ -306,17 +350,26 @@ class PaneModel(ObjectStore):
         if isinstance(self[paths[0]][0], AllEntry):
             return True
 
+        entries = self.__song_entries.get(song)
+        if entries is not None:
+            # the song is in the model, look for one of its entries
+            get_value = self.get_value
+            get_iter = self.get_iter
+            for path in paths:
+                if get_value(get_iter(path)) in entries:
+                    return True
+            return False
+
         keys = self.get_format_keys(song)
 
         # empty key -> unknown
         if not keys and isinstance(self[paths[-1]][0], UnknownEntry):
             return True
 
-        for path in paths:
-            entry = self.get_value(self.get_iter(path))
-            for key in keys:
-                if entry.key == (key[0] if isinstance(key, tuple) else key):
-                    return True
+        selected = self.get_keys(paths)
+        for key in keys:
+            if (key[0] if isinstance(key, tuple) else key) in selected:
+                return True
 
         return False
 
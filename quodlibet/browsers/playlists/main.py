@@ -34,7 +34,7 @@ from quodlibet.qltk.information import Information
 from quodlibet.qltk.properties import SongProperties
 from quodlibet.util import connect_obj
 from quodlibet.util.dprint import print_d, print_w
-from quodlibet.util.collection import FileBackedPlaylist
+from quodlibet.util.collection import FileBackedPlaylist, Playlist
 from quodlibet.util.urllib import urlopen
 
 from .util import parse_m3u, parse_pls, PLAYLISTS,\
@@ -53,6 +53,8 @@ class PlaylistsBrowser(Browser, DisplayPatternMixin):
     __last_render = None
     _PATTERN_FN = os.path.join(quodlibet.get_user_dir(), "playlist_pattern")
     _DEFAULT_PATTERN_TEXT = DEFAULT_PATTERN_TEXT
+    # playlists to write once idle
+    __pending = set()
 
     def pack(self, songpane):
         self._main_box.pack1(self, True, False)
@@ -75,9 +77,13 @@ class PlaylistsBrowser(Browser, DisplayPatternMixin):
         klass.library = library
         model = klass.__lists.get_model()
         for playlist in os.listdir(PLAYLISTS):
+            if FileBackedPlaylist.is_summary_file(playlist):
+                continue
             try:
+                # songs get read once needed
                 playlist = FileBackedPlaylist(PLAYLISTS,
-                      FileBackedPlaylist.unquote(playlist), library=library)
+                      FileBackedPlaylist.unquote(playlist), library=library,
+                      lazy=True)
                 model.append(row=[playlist])
             except EnvironmentError:
                 print_w("Invalid Playlist '%s'" % playlist)
@@ -92,6 +98,7 @@ class PlaylistsBrowser(Browser, DisplayPatternMixin):
 
     @classmethod
     def deinit(cls, library):
+        cls.write_pending()
         model = cls.__lists.get_model()
         model.clear()
 
@@ -105,38 +112,85 @@ class PlaylistsBrowser(Browser, DisplayPatternMixin):
 
     @classmethod
     def changed(klass, playlist, refresh=True):
+        klass.__playlists_changed([playlist], refresh)
+
+    @classmethod
+    def __playlists_changed(klass, playlists, refresh=True):
+        """Refreshes the rows of `playlists` (adding missing ones) and
+        writes them once idle"""
+
+        playlists = set(playlists)
+        missing = set(playlists)
         model = klass.__lists
         for row in model:
-            if row[0] is playlist:
+            playlist = row[0]
+            if playlist in playlists:
+                missing.discard(playlist)
                 if refresh:
-                    print_d("Refreshing playlist %s..." % row[0])
-                    klass.__lists.row_changed(row.path, row.iter)
-                playlist.write()
-                break
-        else:
+                    print_d("Refreshing playlist %s..." % playlist)
+                    model.row_changed(row.path, row.iter)
+                if not missing:
+                    break
+        for playlist in missing:
             model.get_model().append(row=[playlist])
-            playlist.write()
+
+        if not klass.__pending:
+            GLib.idle_add(klass.write_pending, priority=GLib.PRIORITY_LOW)
+        klass.__pending.update(playlists)
+
+    @classmethod
+    def write_pending(klass):
+        """Writes the playlists which have changed since the last call.
+        Playlists whose songs haven't changed don't get written."""
+
+        pending = klass.__pending
+        if pending:
+            print_d("Writing %d changed playlist(s)" % len(pending))
+            klass.__pending = set()
+            for playlist in klass.playlists():
+                if playlist in pending:
+                    playlist.write()
+        return False
+
+    @classmethod
+    def __featuring(klass, items, load=True):
+        """The playlists of the browser containing any of `items`.
+        With `load` False playlists not read yet are left out."""
+
+        featuring = set()
+        for item in items:
+            featuring.update(Playlist.playlists_featuring(item, load))
+        if featuring:
+            featuring.intersection_update(klass.playlists())
+        return featuring
 
     @classmethod
     def __removed(klass, library, songs):
-        for playlist in klass.playlists():
-            if playlist.remove_songs(songs):
-                klass.changed(playlist)
+        # playlists not read yet leave out songs missing from the library
+        # once they get read
+        changed = [playlist for playlist in klass.__featuring(songs, False)
+                   if playlist.remove_songs(songs)]
+        if changed:
+            klass.__playlists_changed(changed)
 
     @classmethod
     def __added(klass, library, songs):
+        # masked songs are in the playlists by filename, playlists not
+        # read yet will find them in the library
         filenames = {song("~filename") for song in songs}
-        for playlist in klass.playlists():
-            if playlist.add_songs(filenames, library):
-                klass.changed(playlist)
+        changed = [playlist
+                   for playlist in klass.__featuring(filenames, False)
+                   if playlist.add_songs(filenames, library)]
+        if changed:
+            klass.__playlists_changed(changed)
 
     @classmethod
     def __changed(klass, library, songs):
-        for playlist in klass.playlists():
-            for song in songs:
-                if song in playlist.songs:
-                    klass.changed(playlist)
-                    break
+        # the summary of playlists not read yet might get outdated, but
+        # reading all of them for each change would be too slow
+        changed = klass.__featuring(songs, False)
+        if changed:
+            klass.__playlists_changed(changed)
 
     def cell_data(self, col, cell, model, iter, data):
         playlist = model[iter][0]
@@ -20,6 +20,7 @@ from quodlibet.qltk.searchbar import MultiSearchBarBox
 from quodlibet.qltk.songlist import SongList
 from quodlibet.qltk.x import SymbolicIconImage
 from quodlibet.qltk import Icons
+from quodlibet.util.thread import Cancellable
 
 
 class PreferencesButton(Gtk.HBox):
@@ -71,6 +72,7 @@ class SearchBar(Browser):
 
         self._query = None
         self._library = library
+        self._cancellable = Cancellable()
 
         completion = LibraryTagCompletion(library.librarian)
         self.accelerators = Gtk.AccelGroup()
@@ -101,21 +103,32 @@ class SearchBar(Browser):
         self._sb_box.set_text(text)
 
     def __destroy(self, *args):
+        self._cancellable.cancel()
         self._sb_box = None
 
     def __focus(self, widget, *args):
         qltk.get_top_parent(widget).songlist.grab_focus()
 
-    def _get_songs(self):
+    def activate(self):
+        # a newer query replaces the one still being searched for
+        self._cancellable.cancel()
+        self._cancellable = Cancellable()
+
         self._query = self._sb_box.get_query(SongList.star)
-        return self._query.filter(self._library) if self._query else None
+        if not self._query:
+            return
 
-    def activate(self):
-        songs = self._get_songs()
-        if songs is not None:
+        def found(songs):
             songs = self._sb_box.limit(songs)
             GLib.idle_add(self.songs_selected, songs)
 
+        def found_partial(songs):
+            self.songs_selected(songs)
+
+        partial = None if self._sb_box.has_limit else found_partial
+        self._library.filter_query_async(
+            self._query, self._cancellable, found, partial)
+
     def __text_parse(self, bar, text):
         self.activate()
 
@@ -47,6 +47,33 @@ INITIAL: Dict[str, Dict[str, str]] = {
     "library": {
         "exclude": "",
         "refresh_on_start": "true",
+
+        # only append changes to a journal on save instead of writing
+        # the whole library file each time
+        "journal": "false",
+
+        # number of threads reading new files while scanning,
+        # 0 or 1 reads them one by one
+        "scan_workers": "0",
+
+        # save the library in a binary format which is faster to load
+        # than the default pickle, but can't be read by older versions
+        "compact_cache": "false",
+
+        # with compact_cache, only decode songs when they are needed
+        "lazy_load": "false",
+
+        # keep an index of tag values for faster library queries,
+        # at the cost of memory
+        "query_index": "false",
+
+        # remember the results of recent queries and only check the
+        # remembered songs when a query gets refined
+        "query_cache": "true",
+
+        # collect library changes for a short time and tell the rest of
+        # the program about them at once
+        "coalesce_signals": "true",
     },
 
     # State about the player, to restore on startup
@@ -219,6 +246,13 @@ INITIAL: Dict[str, Dict[str, str]] = {
 
         # Force fontconfig as PangoCairo backend
         "pangocairo_force_fontconfig": "false",
+
+        # number of compiled tag patterns to keep around
+        "pattern_cache_size": "500",
+
+        # number of formatted pattern results to keep around,
+        # 0 disables remembering them
+        "pattern_format_cache_size": "50000",
     },
 
     "rename": {
@@ -274,6 +308,10 @@ INITIAL: Dict[str, Dict[str, str]] = {
         "force_filename": "false",
         "filename": "folder.jpg",
         "search_filenames": "cover.jpg,folder.jpg,.folder.jpg",
+
+        # create the cover thumbnails of all albums in the background
+        # after startup, so browsers showing covers don't have to
+        "pregenerate_thumbnails": "false",
     },
 
     "display": {
@@ -16,7 +16,7 @@ import shutil
 import time
 from typing import List
 from collections import OrderedDict
-from itertools import zip_longest
+from itertools import zip_longest, count
 
 from senf import fsn2uri, fsnative, fsn2text, devnull, bytes2fsn, path2fsn
 
@@ -62,6 +62,9 @@ NUMERIC_ZERO_DEFAULT.update(SIZE_TAGS)
 FILESYSTEM_TAGS = {"~filename", "~basename", "~dirname", "~mountpoint"}
 """Values are bytes in Linux instead of unicode"""
 
+VOLATILE_TAGS = {"~#rating", "~rating", "~lyrics", "~playlists"}
+"""Values don't only depend on the tags of the song"""
+
 SORT_TO_TAG = dict([(v, k) for (k, v) in TAG_TO_SORT.items()])
 """Reverse map, so sort tags can fall back to the normal ones"""
 
@@ -72,6 +75,9 @@ VARIOUS_ARTISTS_VALUES = 'V.A.', 'various artists', 'Various Artists'
 """Values for ~people representing lots of people, most important last"""
 
 
+_generations = count(1)
+
+
 def decode_value(tag, value):
     """Returns a unicode representation of the passed value, based on
     the type and the tag it originated from.
@@ -154,22 +160,51 @@ class AudioFile(dict, ImageContainer):
     def sort_key(self):
         return [self.album_key, self.__song_key()]
 
+    @property
+    def generation(self):
+        """A number which changes each time a tag gets set or removed.
+
+        Numbers are never reused, also not by other songs, so it can be
+        used as a key for values computed from the tags.
+        """
+
+        try:
+            return self.__dict__["_generation"]
+        except KeyError:
+            generation = self.__dict__["_generation"] = next(_generations)
+            return generation
+
     @staticmethod
-    def sort_by_func(tag):
+    def sort_by_func(tag, human_keys=None):
         """Returns a fast sort function for a specific tag (or pattern).
-        Some keys are already in the sort cache, so we can use them."""
+        Some keys are already in the sort cache, so we can use them.
+
+        If a dict is passed as `human_keys` it is used to remember the
+        human sort keys of the values, which is faster if many songs
+        share the same value.
+        """
         def artist_sort(song):
             return song.sort_key[1][2]
 
+        if human_keys is None:
+            human_key = human
+        else:
+            def human_key(text):
+                try:
+                    return human_keys[text]
+                except KeyError:
+                    key = human_keys[text] = human(text)
+                    return key
+
         if callable(tag):
-            return lambda song: human(tag(song))
+            return lambda song: human_key(tag(song))
         elif tag == "artistsort":
             return artist_sort
         elif tag in FILESYSTEM_TAGS:
             return lambda song: fsn2text(song(tag))
         elif tag.startswith("~#") and "~" not in tag[2:]:
             return lambda song: song(tag, 0)
-        return lambda song: human(song(tag))
+        return lambda song: human_key(song(tag))
 
     def __getstate__(self):
         """Don't pickle anything from __dict__"""
@@ -199,6 +234,7 @@ class AudioFile(dict, ImageContainer):
         pop = self.__dict__.pop
         pop("album_key", None)
         pop("sort_key", None)
+        pop("_generation", None)
 
     def __delitem__(self, key):
         dict.__delitem__(self, key)
@@ -206,6 +242,7 @@ class AudioFile(dict, ImageContainer):
         pop = self.__dict__.pop
         pop("album_key", None)
         pop("sort_key", None)
+        pop("_generation", None)
 
     @property
     def key(self):
@@ -331,7 +368,7 @@ class AudioFile(dict, ImageContainer):
                 else:
                     return util.format_time_display(length)
             elif key == "#rating":
-                return dict.get(self, "~" + key, config.RATINGS.default)
+                return self.get("~" + key, config.RATINGS.default)
             elif key == "rating":
                 return util.format_rating(self("~#rating"))
             elif key == "people":
@@ -479,10 +516,10 @@ class AudioFile(dict, ImageContainer):
                         except ValueError:
                             return default
             else:
-                return dict.get(self, "~" + key, default)
+                return self.get("~" + key, default)
 
         elif key == "title":
-            title = dict.get(self, "title")
+            title = self.get("title")
             if title is None:
                 basename = self("~basename")
                 return "%s [%s]" % (
@@ -494,7 +531,7 @@ class AudioFile(dict, ImageContainer):
                 return self[key]
             except KeyError:
                 key = SORT_TO_TAG[key]
-        return dict.get(self, key, default)
+        return self.get(key, default)
 
     def _role_call(self, role_tag, sub_keys=None):
         role_tag_keys = self.prefixkeys(role_tag)
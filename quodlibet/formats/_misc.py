@@ -7,23 +7,161 @@
 
 import os
 import sys
+import importlib
+import threading
 import contextlib
 
 import mutagen
 
 from quodlibet import util
-from quodlibet.util import print_w, print_d, reraise
-from quodlibet.util.importhelper import load_dir_modules
+from quodlibet.util import print_w, reraise
 from quodlibet.const import MinVersions
 
 
-mimes = set()
+FORMAT_MODULES = {
+    "aac": [".aac", ".adif", ".adts"],
+    "aiff": [".aif", ".aiff", ".aifc"],
+    "dsf": [".dsf"],
+    "midi": [".mid"],
+    "mod": [".669", ".amf", ".ams", ".dsm", ".far", ".it", ".med", ".mod",
+            ".mt2", ".mtm", ".okt", ".s3m", ".stm", ".ult", ".gdm", ".xm"],
+    "monkeysaudio": [".ape"],
+    "mp3": [".mp3", ".mp2", ".mp1", ".mpg", ".mpeg"],
+    "mp4": [".mp4", ".m4a", ".m4v", ".3gp", ".3g2", ".3gp2"],
+    "mpc": [".mpc", ".mp+"],
+    "remote": [],
+    "spc": [".spc"],
+    "trueaudio": [".tta"],
+    "vgm": [".vgm"],
+    "wav": [".wav"],
+    "wavpack": [".wv"],
+    "wma": [".wma", ".asf", ".wmv"],
+    "xiph": [".ogg", ".oga", ".flac", ".oggflac", ".spx", ".ogv", ".opus"],
+}
+"""Format modules and the file extensions they might support, so they
+only need to be imported once a file with one of them gets loaded. Has to
+be kept in sync with the `extensions` of the modules."""
+
+_RENAMED_MODULES = {
+    "flac": "xiph",
+    "oggvorbis": "xiph",
+}
+
+_module_names = {ext: name for name, exts in FORMAT_MODULES.items()
+                 for ext in exts}
+_loaded = set()
+_load_lock = threading.RLock()
+_initialized = False
+
+
+def _load_module(name):
+    if name in _loaded:
+        return
+
+    with _load_lock:
+        # another thread might have imported it while we waited
+        if name in _loaded:
+            return
+
+        try:
+            format = importlib.import_module("." + name, __package__)
+        except Exception:
+            util.print_exc()
+        else:
+            _register_module(format)
+        # only now, so other threads wait for the loaders to be registered
+        _loaded.add(name)
+
+
+def _register_module(format):
+    # Migrate pre-0.16 library, which was using an undocumented "feature".
+    sys.modules[format.__name__.replace(".", "/")] = format
+    # Migrate old layout
+    sys.modules[format.__name__.split(".", 1)[1]] = format
+
+    for ext in format.extensions:
+        dict.__setitem__(loaders, ext, format.loader)
+    set.update(types, format.types)
+    if format.extensions:
+        for type_ in format.types:
+            set.update(mimes, type_.mimes)
+
+
+def _load_all():
+    if len(_loaded) == len(FORMAT_MODULES) or not _initialized:
+        return
+    for name in FORMAT_MODULES:
+        _load_module(name)
+    if not dict.__len__(loaders):
+        raise SystemExit("No formats found!")
+
+
+class _Loaders(dict):
+    # Imports the format module of an extension on first lookup, and all
+    # of them if all extensions are needed.
+
+    def _load(self, ext):
+        if not dict.__contains__(self, ext) and _initialized:
+            name = _module_names.get(ext)
+            if name is not None:
+                _load_module(name)
+
+    def __getitem__(self, ext):
+        self._load(ext)
+        return dict.__getitem__(self, ext)
+
+    def get(self, ext, default=None):
+        self._load(ext)
+        return dict.get(self, ext, default)
+
+    def __contains__(self, ext):
+        self._load(ext)
+        return dict.__contains__(self, ext)
+
+    def __iter__(self):
+        _load_all()
+        return dict.__iter__(self)
+
+    def __len__(self):
+        _load_all()
+        return dict.__len__(self)
+
+    def keys(self):
+        _load_all()
+        return dict.keys(self)
+
+    def values(self):
+        _load_all()
+        return dict.values(self)
+
+    def items(self):
+        _load_all()
+        return dict.items(self)
+
+
+class _AllFormatsSet(set):
+    # Imports all format modules before being looked at
+
+    def __iter__(self):
+        _load_all()
+        return set.__iter__(self)
+
+    def __len__(self):
+        _load_all()
+        return set.__len__(self)
+
+    def __contains__(self, item):
+        _load_all()
+        return set.__contains__(self, item)
+
+
+mimes = _AllFormatsSet()
 """A set of supported mime types"""
 
-loaders = {}
+loaders = _Loaders()
 """A dict mapping file extensions to loaders (func returning an AudioFile)"""
 
-types = set()
+types = _AllFormatsSet()
 """A set of AudioFile subclasses/implementations"""
 
 
@@ -52,48 +190,32 @@ def translate_errors():
 
 
 def init():
-    """Load/Import all formats.
+    """Set up the formats.
 
-    Before this is called loading a file and unpickling will not work.
+    Before this is called loading a file will not work. The format modules
+    get imported once they are needed (see `FORMAT_MODULES`).
     """
 
-    global mimes, loaders, types
+    global _initialized
 
     MinVersions.MUTAGEN.check(mutagen.version)
 
-    base = util.get_module_dir()
-    formats = load_dir_modules(base, package=__package__)
-
-    module_names = []
-    for format in formats:
-        name = format.__name__
-
-        for ext in format.extensions:
-            loaders[ext] = format.loader
-
-        types.update(format.types)
+    _initialized = True
 
-        if format.extensions:
-            for type_ in format.types:
-                mimes.update(type_.mimes)
-            module_names.append(name.split(".")[-1])
 
-        # Migrate pre-0.16 library, which was using an undocumented "feature".
-        sys.modules[name.replace(".", "/")] = format
-        # Migrate old layout
-        if name.startswith("quodlibet."):
-            sys.modules[name.split(".", 1)[1]] = format
+def get_module_name(name):
+    """Returns the current name of a format module, for module names
+    found in old libraries"""
 
-    # This can be used for the quodlibet.desktop file
-    desktop_mime_types = "MimeType=" + \
-        ";".join(sorted({m.split(";")[0] for m in mimes})) + ";"
-    print_d(desktop_mime_types)
-
-    s = ", ".join(sorted(module_names))
-    print_d("Supported formats: %s" % s)
-
-    if not loaders:
-        raise SystemExit("No formats found!")
+    # pre-0.16 libraries use "quodlibet/formats/mp3", later ones
+    # "formats.mp3" before the move to the quodlibet package
+    name = name.replace("/", ".")
+    if name.startswith("formats."):
+        name = "quodlibet." + name
+    package, dot, module = name.rpartition(".")
+    if package == __package__:
+        module = _RENAMED_MODULES.get(module, module)
+    return package + dot + module
 
 
 def get_loader(filename):
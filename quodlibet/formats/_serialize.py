@@ -7,12 +7,21 @@
 
 """Code for serializing AudioFile instances"""
 
+import gc
+import sys
 import pickle
+import struct
+import importlib
+import threading
+import weakref
+from array import array
+
 from senf import bytes2fsn, fsn2bytes
 
 from quodlibet.util.picklehelper import pickle_loads, pickle_dumps
 from quodlibet.util import is_windows
-from ._audio import AudioFile
+from ._audio import AudioFile, PEOPLE, PEOPLE_SORT
+from ._misc import get_module_name
 
 
 class SerializationError(Exception):
@@ -63,8 +72,13 @@ def _py3_to_py2(items):
 
     new_list = []
     for i in items:
-        inst = dict.__new__(i.__class__)
-        for key, value in i.items():
+        if isinstance(i, LazyAudioFile):
+            inst = dict.__new__(i._real_type)
+            pairs = i._lazy_items()
+        else:
+            inst = dict.__new__(i.__class__)
+            pairs = i.items()
+        for key, value in pairs:
             if key in ("~filename", "~mountpoint") and not is_win:
                 value = fsn2bytes(value, None)
             try:
@@ -76,10 +90,15 @@ def _py3_to_py2(items):
     return new_list
 
 
-def load_audio_files(data, process=True):
+def load_audio_files(data, process=True, lazy=False):
     """unpickles the item list and if some class isn't found unpickle
     as a dict and filter them out afterwards.
 
+    Data written by dump_audio_files_compact() gets detected and loaded
+    as well, `process` doesn't apply there. If `lazy` is True the songs in
+    it stay in `data` until needed (see `LazyAudioFile`), `data` can also
+    be a mmap for this.
+
     In case everything gets filtered out will raise SerializationError
     (because then likely something larger went wrong)
 
@@ -87,17 +106,23 @@ def load_audio_files(data, process=True):
         data (bytes)
         process (bool): if the dict key/value types should be converted,
             either to be usable from py3 or to convert to newer types
+        lazy (bool)
     Returns:
         List[AudioFile]
     Raises:
         SerializationError
     """
 
+    if data[:len(COMPACT_MAGIC)] == COMPACT_MAGIC:
+        return _load_audio_files_compact(data, lazy)
+    data = bytes(data)
+
     dummy = type("dummy", (dict,), {})
     error_occured = []
     temp_type_cache = {}
 
     def lookup_func(base, module, name):
+        module = get_module_name(module)
         try:
             real_type = base(module, name)
         except (ImportError, AttributeError):
@@ -159,3 +184,419 @@ def dump_audio_files(item_list, process=True):
         return pickle_dumps(item_list, 2)
     except pickle.PicklingError as e:
         raise SerializationError(e)
+
+
+COMPACT_MAGIC = b"QLSONGS\0"
+"""Start of data written by dump_audio_files_compact()"""
+
+_COMPACT_VERSION = 1
+_COMPACT_HEADER = struct.Struct("<8sI")
+_COMPACT_SECTION = struct.Struct("<Q")
+_COMPACT_REF = struct.Struct("<I")
+
+
+def _pack_array(typecode, values):
+    a = array(typecode, values)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a.tobytes()
+
+
+def _unpack_array(typecode, data):
+    a = array(typecode)
+    a.frombytes(data)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a
+
+
+def _pack_strings(strings):
+    for s in strings:
+        if "\0" in s:
+            raise SerializationError("can't store null character")
+    return "\0".join(strings).encode("utf-8", "surrogatepass")
+
+
+def _unpack_strings(data):
+    if not data:
+        return []
+    return data.decode("utf-8", "surrogatepass").split("\0")
+
+
+def dump_audio_files_compact(item_list):
+    """Serializes a list of AudioFiles into a compact binary format, which
+    is a lot faster to load than a pickle.
+
+    All tag keys, strings and numbers are stored once in tables and each
+    song is a list of (key, value) indices into them.
+
+    Returns:
+        bytes
+    Raises:
+        SerializationError: in case a value type isn't supported
+    """
+
+    assert isinstance(item_list, list)
+    assert not item_list or isinstance(item_list[0], AudioFile)
+
+    types = {}
+    keys = {}
+    strings = {}
+    ints = {}
+    floats = {}
+
+    # the lowest two bits of each reference tell the table it points to
+    song_types = []
+    offsets = [0]
+    refs = []
+    append = refs.append
+    for item in item_list:
+        if isinstance(item, LazyAudioFile):
+            cls = item._real_type
+            pairs = item._lazy_items()
+        else:
+            cls = type(item)
+            pairs = dict.items(item)
+        song_types.append(types.setdefault(
+            "%s:%s" % (cls.__module__, cls.__name__), len(types)))
+        for key, value in pairs:
+            if not isinstance(key, str):
+                raise SerializationError("unsupported key: %r" % key)
+            append(keys.setdefault(key, len(keys)) << 2)
+            if isinstance(value, str):
+                append(strings.setdefault(value, len(strings)) << 2 | 1)
+            elif isinstance(value, float):
+                append(floats.setdefault(value, len(floats)) << 2 | 3)
+            elif isinstance(value, int):
+                append(ints.setdefault(int(value), len(ints)) << 2 | 2)
+            else:
+                raise SerializationError("unsupported value: %r" % value)
+        offsets.append(len(refs))
+
+    # all tables get concatenated on load: keys, strings, ints, floats
+    bases = [0, len(keys)]
+    bases.append(bases[-1] + len(strings))
+    bases.append(bases[-1] + len(ints))
+    refs = [bases[r & 3] + (r >> 2) for r in refs]
+
+    try:
+        sections = [
+            _pack_strings(types),
+            _pack_strings(keys),
+            _pack_strings(strings),
+            _pack_array("q", ints),
+            _pack_array("d", floats),
+            _pack_array("I", song_types),
+            _pack_array("Q", offsets),
+            _pack_array("I", refs),
+        ]
+    except OverflowError as e:
+        raise SerializationError(e)
+
+    data = [_COMPACT_HEADER.pack(COMPACT_MAGIC, _COMPACT_VERSION)]
+    for section in sections:
+        data.append(_COMPACT_SECTION.pack(len(section)))
+        data.append(section)
+    return b"".join(data)
+
+
+def _lookup_type(name):
+    module, name = name.split(":", 1)
+    if module.split(".")[0] not in ("quodlibet", "tests"):
+        raise ImportError(module)
+    real_type = getattr(importlib.import_module(module), name)
+    if not issubclass(real_type, AudioFile):
+        raise AttributeError(name)
+    return real_type
+
+
+_MISSING = object()
+
+
+class _LazyStore(object):
+    """Gives access to the songs in data written by
+    dump_audio_files_compact() without decoding them.
+
+    `data` can be a mmap. Songs which aren't in the store (anymore) raise
+    KeyError.
+    """
+
+    def __init__(self, data, refs_offset, offsets, table, key_ids):
+        self._data = data
+        self._refs_offset = refs_offset
+        self._offsets = offsets
+        self._table = table
+        self._patterns = {
+            k: _COMPACT_REF.pack(i) for k, i in key_ids.items()}
+        # an instance attribute would cost more than the dict entry here,
+        # entries go away with the songs
+        self._indices = weakref.WeakKeyDictionary()
+
+    def add(self, song, index):
+        self._indices[song] = index
+
+    def remove(self, song):
+        del self._indices[song]
+
+    def _range(self, song):
+        index = self._indices[song]
+        offsets = self._offsets
+        start = self._refs_offset + offsets[index] * _COMPACT_REF.size
+        end = self._refs_offset + offsets[index + 1] * _COMPACT_REF.size
+        return start, end
+
+    def get(self, song, key):
+        """Returns the value for `key` or _MISSING"""
+
+        pattern = self._patterns.get(key)
+        if pattern is None:
+            return _MISSING
+
+        data = self._data
+        start, end = self._range(song)
+        pos = data.find(pattern, start, end)
+        # keys are at even positions, values can't be equal to key indices,
+        # but the bytes could still match across two values
+        while pos != -1 and (pos - start) % (2 * _COMPACT_REF.size):
+            pos = data.find(pattern, pos + 1, end)
+        if pos == -1:
+            return _MISSING
+        return self._table[
+            _COMPACT_REF.unpack_from(data, pos + _COMPACT_REF.size)[0]]
+
+    def items(self, song):
+        """Returns a list of (key, value) tuples"""
+
+        start, end = self._range(song)
+        refs = _unpack_array("I", self._data[start:end])
+        it = map(self._table.__getitem__, refs)
+        return list(zip(it, it))
+
+    def keys(self, song):
+        return [k for k, v in self.items(song)]
+
+    def pop(self, song):
+        """Returns all (key, value) tuples and forgets the song"""
+
+        items = self.items(song)
+        self.remove(song)
+        return items
+
+
+LAZY_TAGS = frozenset(
+    PEOPLE + PEOPLE_SORT +
+    ["title", "titlesort", "version", "album", "albumsort",
+     "albumartistsort", "album_grouping_key", "labelid",
+     "musicbrainz_albumid", "musicbrainz_artistid", "tracknumber",
+     "discnumber", "discsubtitle", "date", "originaldate", "genre",
+     "performer", "grouping", "website"])
+"""Tags which can be read from songs loaded lazily without turning them into
+normal dicts, in addition to all internal ones"""
+
+
+def _is_lazy_tag(key):
+    # internal tags get looked up a lot by __call__ and are rarely present
+    return key in LAZY_TAGS or key[:1] == "~" or (
+        ":" in key and key.split(":", 1)[0] in LAZY_TAGS)
+
+
+_materialize_lock = threading.Lock()
+
+
+def _materialize(song):
+    # not a method, the song can be materialized by another thread
+    # in between and no longer have it
+    with _materialize_lock:
+        if isinstance(song, LazyAudioFile):
+            store = song._store
+            dict.update(song, store.items(song))
+            song.__class__ = song._real_type
+            store.remove(song)
+
+
+class LazyAudioFile(object):
+    """Mixin for AudioFile types which keeps the song data in a `_LazyStore`
+    until a tag gets written, the whole dict is needed or a tag not in
+    LAZY_TAGS gets read. The instance then gets filled and changed to its
+    real type.
+
+    Songs can get searched in a thread while being materialized, so the
+    store entry only goes away once the instance is complete. Readers which
+    then don't find it (or the store) retry with the real type.
+    """
+
+    _real_type = None
+    _store = None
+
+    def _lazy_items(self):
+        try:
+            return self._store.items(self)
+        except (KeyError, AttributeError):
+            return list(dict.items(self))
+
+    def __bool__(self):
+        # don't fall back to __len__, songs are never empty
+        return True
+
+    def __getitem__(self, key):
+        if _is_lazy_tag(key):
+            try:
+                value = self._store.get(self, key)
+            except (KeyError, AttributeError):
+                return self[key]
+            if value is _MISSING:
+                raise KeyError(key)
+            return value
+        _materialize(self)
+        return self[key]
+
+    def get(self, key, default=None):
+        if _is_lazy_tag(key):
+            try:
+                value = self._store.get(self, key)
+            except (KeyError, AttributeError):
+                return self.get(key, default)
+            return default if value is _MISSING else value
+        _materialize(self)
+        return self.get(key, default)
+
+    def __contains__(self, key):
+        if _is_lazy_tag(key):
+            try:
+                return self._store.get(self, key) is not _MISSING
+            except (KeyError, AttributeError):
+                return key in self
+        _materialize(self)
+        return key in self
+
+    def prefixkeys(self, prefix):
+        try:
+            keys = self._store.keys(self)
+        except (KeyError, AttributeError):
+            return self.prefixkeys(prefix)
+        return [k for k in keys
+                if k == prefix or k.startswith(prefix + ":")]
+
+
+def _materializing(name):
+
+    def method(self, *args, **kwargs):
+        _materialize(self)
+        return getattr(self, name)(*args, **kwargs)
+
+    method.__name__ = name
+    return method
+
+
+for name in ["__iter__", "__len__", "__setitem__", "__delitem__", "__repr__",
+             "__reduce__", "__reduce_ex__", "__sizeof__", "keys", "values",
+             "items", "copy", "setdefault", "pop", "popitem", "update",
+             "clear"]:
+    setattr(LazyAudioFile, name, _materializing(name))
+del name
+
+
+def _get_lazy_type(store, real_type):
+    """Returns a type for lazy instances of `real_type` or None if the type
+    customizes item access and can't be loaded lazily"""
+
+    for name in ["__getitem__", "get", "__contains__"]:
+        if getattr(real_type, name) is not getattr(dict, name):
+            return None
+
+    return type("Lazy" + real_type.__name__, (LazyAudioFile, real_type),
+                {"_real_type": real_type, "_store": store})
+
+
+def _load_audio_files_compact(data, lazy=False):
+    try:
+        magic, version = _COMPACT_HEADER.unpack_from(data, 0)
+    except struct.error as e:
+        raise SerializationError(e)
+    if magic != COMPACT_MAGIC or version != _COMPACT_VERSION:
+        raise SerializationError("unsupported version %r" % version)
+
+    sections = []
+    offset = _COMPACT_HEADER.size
+    try:
+        for i in range(8):
+            size, = _COMPACT_SECTION.unpack_from(data, offset)
+            offset += _COMPACT_SECTION.size
+            if offset + size > len(data):
+                raise SerializationError("truncated data")
+            sections.append((offset, size))
+            offset += size
+
+        def get_section(i):
+            offset, size = sections[i]
+            return data[offset:offset + size]
+
+        type_names = _unpack_strings(get_section(0))
+        keys = [sys.intern(k) for k in _unpack_strings(get_section(1))]
+        strings = _unpack_strings(get_section(2))
+        ints = _unpack_array("q", get_section(3)).tolist()
+        floats = _unpack_array("d", get_section(4)).tolist()
+        song_types = _unpack_array("I", get_section(5)).tolist()
+        offsets = _unpack_array("Q", get_section(6))
+        if not lazy:
+            refs = _unpack_array("I", get_section(7))
+    except (struct.error, ValueError, UnicodeDecodeError) as e:
+        raise SerializationError(e)
+
+    types = []
+    for name in type_names:
+        try:
+            types.append(_lookup_type(name))
+        except (ImportError, AttributeError, ValueError):
+            types.append(None)
+
+    if len(offsets) != len(song_types) + 1:
+        raise SerializationError("song count mismatch")
+
+    table = keys + strings + ints + floats
+    if lazy:
+        store = _LazyStore(data, sections[7][0], offsets, table,
+                           {k: i for i, k in enumerate(keys)})
+        lazy_types = [t and _get_lazy_type(store, t) for t in types]
+    else:
+        try:
+            values = list(map(table.__getitem__, refs))
+        except IndexError as e:
+            raise SerializationError(e)
+        offsets = offsets.tolist()
+
+    items = []
+    new = dict.__new__
+    update = dict.update
+    # nothing here can create reference cycles, but all the new dicts
+    # would trigger many useless collections
+    gc_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        for i, type_index in enumerate(song_types):
+            cls = types[type_index]
+            if cls is None:
+                continue
+            if lazy:
+                lazy_cls = lazy_types[type_index]
+                if lazy_cls is not None:
+                    inst = new(lazy_cls)
+                    store.add(inst, i)
+                else:
+                    inst = new(cls)
+                    store.add(inst, i)
+                    update(inst, store.pop(inst))
+            else:
+                inst = new(cls)
+                it = iter(values[offsets[i]:offsets[i + 1]])
+                update(inst, zip(it, it))
+            items.append(inst)
+    finally:
+        if gc_enabled:
+            gc.enable()
+
+    if song_types and not items:
+        raise SerializationError(
+            "all class lookups failed. something is wrong")
+
+    return items
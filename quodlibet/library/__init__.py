@@ -16,10 +16,11 @@ also be queried in various ways.
 import time
 
 from quodlibet import print_d
+from quodlibet import config
 
-from quodlibet.library.libraries import SongFileLibrary, SongLibrary
+from quodlibet.library.libraries import SongFileLibrary, SongLibrary, \
+    JournaledSongFileLibrary
 from quodlibet.library.librarians import SongLibrarian
-from quodlibet.util.path import mtime
 
 
 def init(cache_fn=None):
@@ -29,8 +30,20 @@ def init(cache_fn=None):
     all future SongLibraries.
     """
 
-    SongFileLibrary.librarian = SongLibrary.librarian = SongLibrarian()
-    library = SongFileLibrary("main")
+    librarian = SongLibrarian()
+    librarian.coalesce_signals = config.getboolean(
+        "library", "coalesce_signals", True)
+    SongFileLibrary.librarian = SongLibrary.librarian = librarian
+    if config.getboolean("library", "journal", False):
+        library = JournaledSongFileLibrary("main")
+    else:
+        library = SongFileLibrary("main")
+    library.compact_format = config.getboolean(
+        "library", "compact_cache", False)
+    library.lazy = config.getboolean("library", "lazy_load", False)
+    library.use_index = config.getboolean("library", "query_index", False)
+    library.use_query_cache = config.getboolean(
+        "library", "query_cache", True)
     if cache_fn:
         library.load(cache_fn)
     return library
@@ -51,5 +64,6 @@ def save(save_period=None):
         if not filename or not lib.dirty:
             continue
 
-        if not save_period or abs(time.time() - mtime(filename)) > save_period:
+        last_save = lib.get_save_time()
+        if not save_period or abs(time.time() - last_save) > save_period:
             lib.save()
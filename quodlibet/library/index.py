@@ -0,0 +1,249 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""An inverted index of tag values, so queries don't have to look at
+every song in a library."""
+
+import unicodedata
+from bisect import bisect_left, insort
+
+from quodlibet.query._match import Regex
+from quodlibet.util import re_literal
+from quodlibet.util.dprint import print_d
+
+
+class _FoldTable(dict):
+    """A str.translate() table which maps each character to the same one as
+    all characters matching it with re.IGNORECASE (the same lower case or
+    the same upper case of that)"""
+
+    def __missing__(self, code):
+        folded = self[code] = chr(code).lower()[0].upper()[0]
+        return folded
+
+
+_FOLD_TABLE = _FoldTable()
+
+
+def _fold(text):
+    # like unisearch.compile(), which normalizes both the pattern and the
+    # text. One character per character, so prefixes stay prefixes
+    return unicodedata.normalize("NFC", text).translate(_FOLD_TABLE)
+
+
+def _get_literal(value):
+    """Returns a (text, exact) tuple if `value` only matches text lines
+    starting with (or, if exact is True, equal to) `text`, ignoring case.
+    Otherwise returns None.
+    """
+
+    if not isinstance(value, Regex) or "d" in value.mod_string:
+        return None
+
+    pattern = value.pattern
+    if not pattern.startswith("^"):
+        return None
+    pattern = pattern[1:]
+
+    # "\$" is an escaped "$", which re_literal() takes care of
+    exact = False
+    if pattern.endswith("$") and not pattern.endswith("\\$"):
+        exact = True
+        pattern = pattern[:-1]
+
+    text = re_literal(pattern)
+    if text is None:
+        return None
+    return text, exact
+
+
+class _TagValues(object):
+    """All values of one tag, and the songs they belong to"""
+
+    def __init__(self, tag, songs):
+        self.tag = tag
+        # text -> [songs]
+        self._songs = {}
+        # song -> text
+        self._texts = {}
+        # sorted [(folded line, text)], built on first use
+        self._lines = None
+        self.add(songs)
+
+    def _get_text(self, song):
+        # the same as Tag.search() looks at
+        text = song.get(self.tag)
+        if text is None:
+            text = song.get("~" + self.tag, u"")
+        return text
+
+    def _add_lines(self, text):
+        lines = self._lines
+        if lines is not None:
+            for line in set(text.split("\n")):
+                insort(lines, (_fold(line), text))
+
+    def _remove_lines(self, text):
+        lines = self._lines
+        if lines is not None:
+            for line in set(text.split("\n")):
+                entry = (_fold(line), text)
+                del lines[bisect_left(lines, entry)]
+
+    def _add(self, song, text):
+        self._texts[song] = text
+        songs = self._songs.get(text)
+        if songs is None:
+            self._songs[text] = [song]
+            self._add_lines(text)
+        else:
+            songs.append(song)
+
+    def _remove(self, song, text):
+        songs = self._songs[text]
+        songs.remove(song)
+        if not songs:
+            del self._songs[text]
+            self._remove_lines(text)
+
+    def add(self, songs):
+        get_text = self._get_text
+        for song in songs:
+            self._add(song, get_text(song))
+
+    def remove(self, songs):
+        texts = self._texts
+        for song in songs:
+            text = texts.pop(song, None)
+            if text is not None:
+                self._remove(song, text)
+
+    def change(self, songs):
+        get_text = self._get_text
+        texts = self._texts
+        for song in songs:
+            text = get_text(song)
+            old = texts.get(song)
+            if old is None:
+                self._add(song, text)
+            elif old != text:
+                self._remove(song, old)
+                self._add(song, text)
+
+    def _get_lines(self):
+        if self._lines is None:
+            self._lines = sorted(
+                {(_fold(line), text) for text in self._songs
+                 for line in text.split("\n")})
+        return self._lines
+
+    def _find_literal(self, text, exact):
+        """Yields all texts which might have a line starting with or
+        equal to `text`"""
+
+        text = _fold(text)
+        lines = self._get_lines()
+        for i in range(bisect_left(lines, (text,)), len(lines)):
+            line, value = lines[i]
+            if exact:
+                if line != text:
+                    break
+            elif not line.startswith(text):
+                break
+            yield value
+
+    def search(self, value):
+        """Returns a set of songs for which `value.search()` is True"""
+
+        literal = _get_literal(value)
+        if literal is not None:
+            texts = set(self._find_literal(*literal))
+        else:
+            texts = self._songs
+
+        search = value.search
+        songs = self._songs
+        result = set()
+        for text in texts:
+            if search(text):
+                result.update(songs[text])
+        return result
+
+
+class TagIndex(object):
+    """Keeps track of the values of tags in a library, so queries can
+    look up matching songs by value (see `Node.search_index`).
+
+    Tags get indexed on first use and kept up to date through the library
+    signals.
+    """
+
+    SCAN_RATIO = 8
+    """Checking each song of a result directly is faster than a lookup if
+    the result is smaller than the library by at least this factor"""
+
+    def __init__(self, library):
+        print_d("Initializing tag index for %r" % library._name)
+
+        self.songs = set(library.values())
+        """All songs in the library"""
+
+        self._tags = {}
+        self._library = library
+        self._sigs = [
+            library.connect('added', self.__added),
+            library.connect('removed', self.__removed),
+            library.connect('changed', self.__changed),
+        ]
+
+    def destroy(self):
+        for sig in self._sigs:
+            self._library.disconnect(sig)
+        self._tags.clear()
+
+    def can_index(self, tag):
+        """If search_tag() can be used for `tag`"""
+
+        # these need a conversion from fsnative, numeric ones aren't text
+        return tag not in ("filename", "mountpoint") and tag[:1] != "#"
+
+    def search_tag(self, tag, value):
+        """Returns a set of songs for which the value of `tag` matches
+        `value` (a query node for text, see `Tag`)
+        """
+
+        values = self._tags.get(tag)
+        if values is None:
+            print_d("Indexing %r" % tag)
+            values = self._tags[tag] = _TagValues(tag, self.songs)
+        return values.search(value)
+
+    def query(self, query):
+        """Returns a list of songs matching `query`, in library order like
+        `Query.filter` would"""
+
+        songs = self._library.values()
+        result = query.search_index(self)
+        if result is None:
+            return list(filter(query.search, songs))
+        elif not result:
+            return []
+        return [s for s in songs if s in result]
+
+    def __added(self, library, songs):
+        self.songs.update(songs)
+        for values in self._tags.values():
+            values.add(songs)
+
+    def __removed(self, library, songs):
+        self.songs.difference_update(songs)
+        for values in self._tags.values():
+            values.remove(songs)
+
+    def __changed(self, library, songs):
+        # changed can also be emitted for songs not in the library
+        songs = [s for s in songs if s in self.songs]
+        for values in self._tags.values():
+            values.change(songs)
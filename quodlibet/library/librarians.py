@@ -12,12 +12,30 @@ Librarians for libraries.
 """
 
 import itertools
+from collections import OrderedDict
 
-from gi.repository import GObject
+from gi.repository import GObject, GLib
 
 from quodlibet.util.dprint import print_d
 
 
+def _merge_signals(pending, signal):
+    """Returns the signal to emit for an item with `pending` (or None)
+    not emitted yet followed by `signal`, or None if there is nothing
+    left to emit."""
+
+    if pending is None or pending == signal:
+        return signal
+    elif pending == 'added':
+        # the songs of the added signal are current anyway
+        return None if signal == 'removed' else 'added'
+    elif pending == 'changed':
+        return signal
+    else:
+        # removed, re-added maybe with different content
+        return 'changed' if signal == 'added' else 'removed'
+
+
 class Librarian(GObject.GObject):
     """The librarian is a nice interface to all active libraries.
 
@@ -29,8 +47,16 @@ class Librarian(GObject.GObject):
 
     Attributes:
     libraries -- a dict mapping library names to libraries
+    coalesce_signals -- if True the signals of the libraries get collected
+        and emitted together (see flush()), except for changes made
+        through the librarian
     """
 
+    coalesce_signals = False
+
+    COALESCE_DELAY = 50
+    """Milliseconds to collect library signals before emitting them"""
+
     __gsignals__ = {
         'changed': (GObject.SignalFlags.RUN_LAST, None, (object,)),
         'removed': (GObject.SignalFlags.RUN_LAST, None, (object,)),
@@ -41,9 +67,17 @@ class Librarian(GObject.GObject):
         super(Librarian, self).__init__()
         self.libraries = {}
         self.__signals = {}
+        # item -> signal, in the order they came in, merged across
+        # libraries as an item can be moved from one to another
+        self.__pending = OrderedDict()
+        # libraries the pending signals came from
+        self.__pending_libraries = set()
+        self.__flush_id = None
+        self.__received = self.__emitted = 0
+        self.__items_received = self.__items_emitted = 0
 
     def destroy(self):
-        pass
+        self.flush()
 
     def register(self, library, name):
         """Register a library with this librarian."""
@@ -60,32 +94,99 @@ class Librarian(GObject.GObject):
         # This function, unlike register, should be private.
         # Libraries get unregistered at the discretion of the
         # librarian, not the libraries.
+        if library in self.__pending_libraries:
+            self.flush()
         del(self.libraries[name])
         for signal_id in self.__signals[library]:
             library.disconnect(signal_id)
         del(self.__signals[library])
 
-    # FIXME: We can be smarter about this -- queue a list of items
-    # and fire the signal after a short wait, to take advantage of
-    # a case where many libraries fire a signal at the same time (or
-    # one fires a signal often).
-
     def __changed(self, library, items):
-        self.emit('changed', items)
+        self.__queue(library, 'changed', items)
 
     def __added(self, library, items):
-        self.emit('added', items)
+        self.__queue(library, 'added', items)
 
     def __removed(self, library, items):
-        self.emit('removed', items)
+        self.__queue(library, 'removed', items)
+
+    def __queue(self, library, signal, items):
+        if not self.coalesce_signals:
+            self.emit(signal, items)
+            return
+
+        pending = self.__pending
+        self.__pending_libraries.add(library)
+        self.__received += 1
+        for item in items:
+            self.__items_received += 1
+            merged = _merge_signals(pending.get(item), signal)
+            if merged is None:
+                del pending[item]
+            else:
+                pending[item] = merged
+
+        if self.__flush_id is None:
+            self.__flush_id = GLib.timeout_add(
+                self.COALESCE_DELAY, self.__flush_timeout)
+
+    def __flush_timeout(self):
+        self.__flush_id = None
+        self.flush()
+        return False
+
+    def flush(self):
+        """Emits the collected library signals, one per signal type.
+
+        Items added and removed again in between don't get emitted at
+        all, items removed and added again (also to another library) as
+        changed.
+        """
+
+        if self.__flush_id is not None:
+            GLib.source_remove(self.__flush_id)
+            self.__flush_id = None
+
+        pending, self.__pending = self.__pending, OrderedDict()
+        self.__pending_libraries.clear()
+        batches = OrderedDict(
+            (signal, []) for signal in ['removed', 'added', 'changed'])
+        for item, signal in pending.items():
+            batches[signal].append(item)
+
+        for signal, items in batches.items():
+            if items:
+                self.__emitted += 1
+                self.__items_emitted += len(items)
+                self.emit(signal, items)
+
+    def signal_stats(self):
+        """Returns a dict with the number of library signals received
+        and emitted (and items in them) while coalescing.
+
+        Each signal saved is one call less for every connected handler.
+        """
+
+        return {
+            "received": self.__received,
+            "emitted": self.__emitted,
+            "saved": self.__received - self.__emitted,
+            "items_received": self.__items_received,
+            "items_emitted": self.__items_emitted,
+        }
 
     def changed(self, items):
-        """Triage the items and inform their real libraries."""
+        """Triage the items and inform their real libraries.
+
+        The signals get emitted before this returns, also if they would
+        be collected otherwise.
+        """
 
         for library in self.libraries.values():
             in_library = set(item for item in items if item in library)
             if in_library:
                 library._changed(in_library)
+        self.flush()
 
     def __getitem__(self, key):
         """Find a item given its key."""
@@ -104,9 +205,13 @@ class Librarian(GObject.GObject):
             return default
 
     def remove(self, items):
-        """Remove items from all libraries."""
+        """Remove items from all libraries.
+
+        Like for changed() the signals get emitted before this returns.
+        """
         for library in self.libraries.values():
             library.remove(items)
+        self.flush()
 
     def __contains__(self, item):
         """Check if a key or item is in the library."""
@@ -158,6 +263,7 @@ class SongLibrarian(Librarian):
         # changed. So, it needs to reimplement the method.
         re_add = []
         print_d("Renaming %r to %r" % (song.key, newname), self)
+        old_key = song.key
         for library in self.libraries.values():
             try:
                 del library._contents[song.key]
@@ -168,6 +274,7 @@ class SongLibrarian(Librarian):
         song.rename(newname)
         for library in re_add:
             library._contents[song.key] = song
+            library._renamed(song, old_key)
             if changed is None:
                 library._changed({song})
             else:
@@ -14,25 +14,34 @@ least useful but most content-agnostic.
 """
 
 import os
+import mmap
 import shutil
+import struct
 import time
 
-from gi.repository import GObject
+from gi.repository import GObject, GLib
 from senf import fsn2text, fsnative
 
 from quodlibet import _
-from quodlibet.formats import MusicFile, AudioFileError, load_audio_files, \
-    dump_audio_files, SerializationError
+from quodlibet.formats import MusicFile, AudioFile, AudioFileError, \
+    load_audio_files, dump_audio_files, dump_audio_files_compact, \
+    SerializationError
 from quodlibet.query import Query
+from quodlibet.library.index import TagIndex
+from quodlibet.library.query_cache import QueryCache
 from quodlibet.qltk.notif import Task
 from quodlibet.util.atomic import atomic_save
+from quodlibet.util.picklehelper import pickle_dumps, pickle_loads, \
+    PickleError
+from quodlibet.util.thread import call_async, call_async_background, \
+    Cancellable, map_parallel
 from quodlibet.util.collection import Album
 from quodlibet.util.collections import DictMixin
 from quodlibet import util
 from quodlibet import formats
 from quodlibet.util.dprint import print_d, print_w
 from quodlibet.util.path import unexpand, mkdir, normalize_path, ishidden, \
-    ismount
+    ismount, mtime
 
 
 class Library(GObject.GObject, DictMixin):
@@ -165,6 +174,18 @@ class Library(GObject.GObject, DictMixin):
         for item in items:
             content[item.key] = item
 
+    def _lookup_content(self, key):
+        """Returns the item for `key` including hidden ones or None
+           (see `get_content`)
+        """
+
+        return self._contents.get(key)
+
+    def _renamed(self, item, old_key):
+        """Called after `item` was renamed and is stored under its new key"""
+
+        pass
+
     def add(self, items):
         """Add items. This causes an 'added' signal.
 
@@ -203,21 +224,33 @@ class Library(GObject.GObject, DictMixin):
         return items
 
 
-def _load_items(filename):
+def _load_items(filename, lazy=False):
     """Load items from disk.
 
+    If `lazy` is True and the file is in the compact format the items are
+    loaded lazily from a memory map of the file.
+
     In case of an error returns default or an empty list.
     """
 
     try:
         with open(filename, "rb") as fp:
-            data = fp.read()
+            data = None
+            # Windows can't replace files which are mapped
+            if lazy and not util.is_windows():
+                try:
+                    data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # empty file
+                    pass
+            if data is None:
+                data = fp.read()
     except EnvironmentError:
         print_w("Couldn't load library file from: %r" % filename)
         return []
 
     try:
-        items = load_audio_files(data)
+        items = load_audio_files(data, lazy=lazy)
     except SerializationError:
         # there are too many ways this could fail
         util.print_exc()
@@ -233,21 +266,141 @@ def _load_items(filename):
     return items
 
 
+_JOURNAL_MAGIC = b"QLJOURNAL1\n"
+_JOURNAL_HEADER = struct.Struct(">cI")
+_JOURNAL_SET = b"+"
+_JOURNAL_DELETE = b"-"
+
+
+def _journal_path(filename):
+    return filename + ".journal"
+
+
+def _replay_journal(filename, items):
+    """Apply all records of the journal at `filename` to `items`.
+
+    A missing journal leaves the items untouched, a broken or truncated
+    record (e.g. from a crash while appending) ends the replay.
+
+    Returns:
+        List[AudioFile]
+    """
+
+    try:
+        with open(filename, "rb") as fp:
+            data = fp.read()
+    except EnvironmentError:
+        return items
+
+    if not data.startswith(_JOURNAL_MAGIC):
+        print_w("Ignoring invalid library journal: %r" % filename)
+        return items
+
+    contents = {item.key: item for item in items}
+    offset = len(_JOURNAL_MAGIC)
+    count = 0
+    while offset + _JOURNAL_HEADER.size <= len(data):
+        op, size = _JOURNAL_HEADER.unpack_from(data, offset)
+        offset += _JOURNAL_HEADER.size
+        payload = data[offset:offset + size]
+        offset += size
+        if len(payload) != size:
+            print_w("Library journal truncated: %r" % filename)
+            break
+
+        try:
+            if op == _JOURNAL_SET:
+                for item in load_audio_files(payload):
+                    contents[item.key] = item
+            elif op == _JOURNAL_DELETE:
+                for key in pickle_loads(payload):
+                    contents.pop(key, None)
+            else:
+                raise SerializationError("unknown record %r" % op)
+        except (SerializationError, PickleError):
+            util.print_exc()
+            break
+        count += 1
+
+    print_d("Replayed %d journal records from %r" % (count, filename))
+    return list(contents.values())
+
+
+def _append_journal(filename, items, keys):
+    """Append records for changed/added `items` and removed `keys`
+
+    Raises:
+        SerializationError
+        EnvironmentError
+    """
+
+    records = []
+    if items:
+        records.append((_JOURNAL_SET, dump_audio_files(items)))
+    if keys:
+        try:
+            records.append((_JOURNAL_DELETE, pickle_dumps(keys, 2)))
+        except PickleError as e:
+            raise SerializationError(e)
+
+    with open(filename, "ab") as fileobj:
+        if fileobj.tell() == 0:
+            fileobj.write(_JOURNAL_MAGIC)
+        for op, payload in records:
+            fileobj.write(_JOURNAL_HEADER.pack(op, len(payload)))
+            fileobj.write(payload)
+        fileobj.flush()
+        os.fsync(fileobj.fileno())
+
+
+def _truncate_journal(filename, offset):
+    """Drop all journal records before `offset`, they are part of the
+    library file now.
+
+    Raises:
+        EnvironmentError
+    """
+
+    with open(filename, "rb") as fp:
+        fp.seek(offset)
+        tail = fp.read()
+
+    if not tail:
+        os.remove(filename)
+        return
+
+    with atomic_save(filename, "wb") as fileobj:
+        fileobj.write(_JOURNAL_MAGIC)
+        fileobj.write(tail)
+
+
 class PicklingMixin(object):
     """A mixin to provide persistence of a library by pickling to disk"""
 
     filename = None
 
+    compact_format = False
+    """Save in the faster to load format of `dump_audio_files_compact`
+    instead of pickling"""
+
+    lazy = False
+    """Load songs lazily if saved in the compact format, see
+    `formats.LazyAudioFile`"""
+
     def load(self, filename):
         """Load a library from a file, containing a picked list.
 
+        If a journal of later changes exists next to it (see
+        `JournalingMixin`), it gets applied as well.
+
         Loading does not cause added, changed, or removed signals.
         """
 
         self.filename = filename
         print_d("Loading contents of %r." % filename, self)
 
-        items = _load_items(filename)
+        items = _load_items(filename, self.lazy)
+        items = _replay_journal(_journal_path(filename), items)
 
         # this loads all items without checking their validity, but makes
         # sure that non-mounted items are masked
@@ -267,7 +420,12 @@ class PicklingMixin(object):
             dirname = os.path.dirname(filename)
             mkdir(dirname)
             with atomic_save(filename, "wb") as fileobj:
-                fileobj.write(dump_audio_files(self.get_content()))
+                fileobj.write(self._dump(self.get_content()))
+            # everything journaled is part of the new file now
+            if filename == self.filename:
+                journal = _journal_path(filename)
+                if os.path.exists(journal):
+                    os.remove(journal)
         except SerializationError:
             # Can happen when we try to pickle while the library is being
             # modified, like in the periodic 15min save.
@@ -278,6 +436,29 @@ class PicklingMixin(object):
         else:
             self.dirty = False
 
+    def _dump(self, items):
+        """Serializes the items for saving.
+
+        Raises:
+            SerializationError
+        """
+
+        if self.compact_format:
+            try:
+                return dump_audio_files_compact(items)
+            except SerializationError:
+                print_w("Can't use compact format, falling back to pickle")
+        return dump_audio_files(items)
+
+    def get_save_time(self):
+        """Returns the time of the last save in seconds since the epoch,
+        or 0 if it wasn't saved yet.
+        """
+
+        if self.filename is None:
+            return 0
+        return mtime(self.filename)
+
 
 class PicklingLibrary(Library, PicklingMixin):
     """A library that pickles its contents to disk"""
@@ -287,6 +468,181 @@ class PicklingLibrary(Library, PicklingMixin):
         Library.__init__(self, name)
 
 
+class JournalingMixin(PicklingMixin):
+    """A mixin for `PicklingLibrary` subclasses which, instead of pickling
+    everything on each save, only appends the items that were added,
+    changed or removed since the last save to a journal next to the
+    library file.
+
+    Once the journal gets too large compared to the library file it gets
+    merged into a new library file in a background thread.
+    """
+
+    journal_compact_ratio = 0.5
+    """Compact once the journal is larger than this part of the library
+    file"""
+
+    journal_compact_min_size = 1024 * 1024
+    """Never compact if the journal is smaller than this (in bytes)"""
+
+    def __init__(self, *args, **kwargs):
+        super(JournalingMixin, self).__init__(*args, **kwargs)
+        self._journal_pending = set()
+        self._compacting = None
+        for name in ["added", "changed", "removed"]:
+            self.connect(name, self.__items_changed)
+
+    def __items_changed(self, library, items):
+        self._journal_pending.update(item.key for item in items)
+
+    def _renamed(self, item, old_key):
+        super(JournalingMixin, self)._renamed(item, old_key)
+        self._journal_pending.add(old_key)
+
+    @property
+    def journal_filename(self):
+        if self.filename is None:
+            return None
+        return _journal_path(self.filename)
+
+    def get_save_time(self):
+        if self.filename is None:
+            return 0
+        return max(super(JournalingMixin, self).get_save_time(),
+                   mtime(self.journal_filename))
+
+    def _flush_journal(self):
+        """Writes all pending changes to the journal.
+
+        Raises:
+            SerializationError
+            EnvironmentError
+        """
+
+        pending = self._journal_pending
+        if not pending:
+            return
+
+        items = []
+        removed = []
+        for key in sorted(pending):
+            item = self._lookup_content(key)
+            if item is not None and item.key == key:
+                items.append(item)
+            else:
+                removed.append(key)
+
+        print_d("Journaling %d changed and %d removed items." % (
+            len(items), len(removed)), self)
+        _append_journal(self.journal_filename, items, removed)
+        pending.clear()
+
+    def save(self, filename=None):
+        """Append all changes since the last save to the journal.
+
+        Saving to a different filename or saving for the first time
+        writes out the whole library instead.
+        """
+
+        if filename is not None and filename != self.filename:
+            return super(JournalingMixin, self).save(filename)
+
+        if not os.path.exists(self.filename):
+            if self._compacting is not None:
+                self._compacting.cancel()
+                self._compacting = None
+            self._journal_pending.clear()
+            return super(JournalingMixin, self).save()
+
+        try:
+            self._flush_journal()
+        except SerializationError:
+            util.print_exc()
+            return
+        except EnvironmentError:
+            print_w("Couldn't write library journal: %r" %
+                    self.journal_filename)
+            return
+
+        self.dirty = False
+
+        if self._needs_compaction():
+            self.compact()
+
+    def _needs_compaction(self):
+        try:
+            journal_size = os.path.getsize(self.journal_filename)
+            library_size = os.path.getsize(self.filename)
+        except EnvironmentError:
+            return False
+
+        limit = max(self.journal_compact_min_size,
+                    library_size * self.journal_compact_ratio)
+        return journal_size > limit
+
+    def compact(self, background=True):
+        """Write out the whole library and drop the journaled changes
+        which are now part of it.
+
+        If `background` is True the library file gets written in a thread
+        and the journal is only truncated once that has succeeded.
+        Changes happening meanwhile get journaled as usual.
+        """
+
+        if self._compacting is not None:
+            return
+
+        filename = self.filename
+        journal = self.journal_filename
+
+        try:
+            self._flush_journal()
+            offset = os.path.getsize(journal)
+        except SerializationError:
+            util.print_exc()
+            return
+        except EnvironmentError:
+            offset = 0
+
+        # copy the list in the main thread, the items themselves can still
+        # change while we serialize them, but any such change is journaled
+        # after `offset` and will be applied again on load.
+        items = self.get_content()
+        print_d("Compacting journal of %r (%d items)." % (
+            filename, len(items)), self)
+
+        def write_library():
+            try:
+                data = self._dump(items)
+                with atomic_save(filename, "wb") as fileobj:
+                    fileobj.write(data)
+            except (SerializationError, RuntimeError):
+                util.print_exc()
+                return False
+            except EnvironmentError:
+                print_w("Couldn't save library to path: %r" % filename)
+                return False
+            return True
+
+        def done(success):
+            self._compacting = None
+            if not success or not offset:
+                return
+            try:
+                _truncate_journal(journal, offset)
+            except EnvironmentError:
+                print_w("Couldn't truncate library journal: %r" % journal)
+            else:
+                print_d("Done compacting %r." % filename, self)
+
+        cancellable = Cancellable()
+        if background:
+            self._compacting = cancellable
+            call_async_background(write_library, cancellable, done)
+        else:
+            done(write_library())
+
+
 class AlbumLibrary(Library):
     """An AlbumLibrary listens to a SongLibrary and sorts its songs into
     albums.
@@ -303,6 +659,8 @@ class AlbumLibrary(Library):
             "AlbumLibrary for %s" % library._name)
 
         self._library = library
+        # song -> album containing it, as its album_key can change
+        self._albums = {}
         self._asig = library.connect('added', self.__added)
         self._rsig = library.connect('removed', self.__removed)
         self._csig = library.connect('changed', self.__changed)
@@ -319,27 +677,35 @@ class AlbumLibrary(Library):
     def _get(self, item):
         return self._contents.get(item)
 
-    def __add(self, items):
+    def __add(self, items, added):
+        """Adds songs to their albums, and to the list of songs added for
+        each album in `added`"""
+
         changed = set()
         new = set()
+        albums = self._albums
         for song in items:
             key = song.album_key
-            if key in self._contents:
-                changed.add(self._contents[key])
+            album = self._contents.get(key)
+            if album is not None:
+                changed.add(album)
             else:
                 album = Album(song)
                 self._contents[key] = album
                 new.add(album)
-            self._contents[key].songs.add(song)
+            album.songs.add(song)
+            albums[song] = album
+            added.setdefault(album, []).append(song)
 
         changed -= new
         return changed, new
 
     def __added(self, library, items, signal=True):
-        changed, new = self.__add(items)
+        added = {}
+        changed, new = self.__add(items, added)
 
         for album in changed:
-            album.finalize()
+            album.update(added=added[album])
 
         if signal:
             if new:
@@ -348,21 +714,22 @@ class AlbumLibrary(Library):
                 self.emit('changed', changed)
 
     def __removed(self, library, items):
-        changed = set()
+        changed = {}
         removed = set()
         for song in items:
-            key = song.album_key
-            album = self._contents[key]
+            album = self._albums.pop(song)
             album.songs.remove(song)
-            changed.add(album)
+            changed.setdefault(album, []).append(song)
             if not album.songs:
                 removed.add(album)
-                del self._contents[key]
+                del self._contents[album.key]
 
-        changed -= removed
+        for album in removed:
+            del changed[album]
 
-        for album in changed:
-            album.finalize()
+        for album, songs in changed.items():
+            album.update(removed=songs)
+        changed = set(changed)
 
         if removed:
             self.emit('removed', removed)
@@ -371,29 +738,35 @@ class AlbumLibrary(Library):
 
     def __changed(self, library, items):
         """Album keys could change between already existing ones.. so we
-        have to do it the hard way and search by id."""
+        look up the album a song was in before."""
         print_d("Updating affected albums for %d items" % len(items))
         changed = set()
         removed = set()
         to_add = []
+        # album -> songs changed in it, or removed from it
+        changed_songs = {}
+        removed_songs = {}
+        albums = self._albums
         for song in items:
+            album = albums.get(song)
             # in case the key hasn't changed
-            key = song.album_key
-            if key in self._contents and song in self._contents[key].songs:
-                changed.add(self._contents[key])
-            else:  # key changed.. look for it in each album
-                to_add.append(song)
-                for key, album in self._contents.items():
-                    if song in album.songs:
-                        album.songs.remove(song)
-                        if not album.songs:
-                            removed.add(album)
-                        else:
-                            changed.add(album)
-                        break
+            if album is not None and album.key == song.album_key:
+                changed.add(album)
+                changed_songs.setdefault(album, []).append(song)
+                continue
+            to_add.append(song)
+            if album is not None:  # key changed
+                del albums[song]
+                album.songs.remove(song)
+                removed_songs.setdefault(album, []).append(song)
+                if not album.songs:
+                    removed.add(album)
+                else:
+                    changed.add(album)
 
         # get new albums and changed ones because keys could have changed
-        add_changed, new = self.__add(to_add)
+        added_songs = {}
+        add_changed, new = self.__add(to_add, added_songs)
         changed |= add_changed
 
         # check if albums that were empty at some point are still empty
@@ -403,7 +776,9 @@ class AlbumLibrary(Library):
                 changed.discard(album)
 
         for album in changed:
-            album.finalize()
+            album.update(added_songs.get(album, ()),
+                         removed_songs.get(album, ()),
+                         changed_songs.get(album, ()))
 
         if removed:
             self.emit("removed", removed)
@@ -420,6 +795,19 @@ class SongLibrary(PicklingLibrary):
     interface.
     """
 
+    use_index = False
+    """Use `tag_index` in `query`"""
+
+    use_query_cache = False
+    """Use `query_cache` in `query`"""
+
+    ASYNC_MIN_SONGS = 20000
+    """Below this `filter_query_async` checks songs right away"""
+
+    ASYNC_CHUNK_SIZE = 2000
+    """Number of songs `filter_query_async` checks between looking for
+    cancellation"""
+
     def __init__(self, *args, **kwargs):
         super(SongLibrary, self).__init__(*args, **kwargs)
 
@@ -427,10 +815,22 @@ class SongLibrary(PicklingLibrary):
     def albums(self):
         return AlbumLibrary(self)
 
+    @util.cached_property
+    def tag_index(self):
+        return TagIndex(self)
+
+    @util.cached_property
+    def query_cache(self):
+        return QueryCache(self, self.__search)
+
     def destroy(self):
         super(SongLibrary, self).destroy()
         if "albums" in self.__dict__:
             self.albums.destroy()
+        if "tag_index" in self.__dict__:
+            self.tag_index.destroy()
+        if "query_cache" in self.__dict__:
+            self.query_cache.destroy()
 
     def tag_values(self, tag):
         """Return a set of all values for the given tag."""
@@ -450,9 +850,11 @@ class SongLibrary(PicklingLibrary):
         method. Instead, use the librarian.
         """
         print_d("Renaming %r to %r" % (song.key, newname), self)
+        old_key = song.key
         del(self._contents[song.key])
         song.rename(newname)
         self._contents[song.key] = song
+        self._renamed(song, old_key)
         if changed is not None:
             print_d("%s: Delaying changed signal." % (type(self).__name__,))
             changed.add(song)
@@ -464,10 +866,96 @@ class SongLibrary(PicklingLibrary):
         if isinstance(text, bytes):
             text = text.decode('utf-8')
 
+        if text == "":
+            return self.values()
+        return self.filter_query(Query(text, star))
+
+    def filter_query(self, query):
+        """Returns a list of songs matching `query` (a `Query`)"""
+
+        if query.matches_all:
+            return self.values()
+        if self.use_query_cache and query.is_cacheable():
+            return self.query_cache.query(query)
+        return self.__search(query)
+
+    def filter_query_async(self, query, cancellable, callback,
+                           partial_callback=None):
+        """Like `filter_query`, but for big libraries the songs get checked
+        in a thread, in chunks.
+
+        `callback` gets called in the main loop with the list of matching
+        songs. If given, `partial_callback` gets called in between with
+        all matching songs found so far. Neither gets called once
+        `cancellable` is cancelled. Small libraries get searched right
+        away, calling `callback` before returning.
+
+        Lazily loaded songs can get materialized by the thread and the main
+        loop at the same time, which `LazyAudioFile` allows for.
+        """
+
+        songs = None
+        generation = None
+        if not query.matches_all and self.use_query_cache and \
+                query.is_cacheable():
+            cache = self.query_cache
+            songs, complete = cache.lookup(query)
+            if complete:
+                callback(songs)
+                return
+            generation = cache.generation
+
+        if songs is None:
+            if self.use_index or query.matches_all:
+                callback(self.filter_query(query))
+                return
+            songs = list(self.values())
+
+        if len(songs) < self.ASYNC_MIN_SONGS:
+            callback(self.filter_query(query))
+            return
+
+        # optimize and compile here, the thread only uses the result
+        query.optimize(songs)
+        filter_ = query.filter
+        chunk_size = self.ASYNC_CHUNK_SIZE
+        state = {"done": False}
+
+        def partial_main(found):
+            if not cancellable.is_cancelled() and not state["done"]:
+                partial_callback(found)
+            return False
+
+        def search(songs):
+            found = []
+            reported = 0
+            for i in range(0, len(songs), chunk_size):
+                if cancellable.is_cancelled():
+                    break
+                found.extend(filter_(songs[i:i + chunk_size]))
+                # report whenever the number of songs doubled, so passing
+                # them on doesn't cost more than searching
+                if partial_callback is not None and \
+                        len(found) > 2 * reported:
+                    reported = len(found)
+                    GLib.idle_add(partial_main, list(found),
+                                  priority=GLib.PRIORITY_DEFAULT)
+            return found
+
+        def done(found):
+            state["done"] = True
+            if generation is not None:
+                self.query_cache.add(query, found, generation)
+            callback(list(found))
+
+        call_async(search, cancellable, done, args=(songs,))
+
+    def __search(self, query):
+        if self.use_index:
+            return self.tag_index.query(query)
         songs = self.values()
-        if text != "":
-            songs = list(filter(Query(text, star).search, songs))
-        return songs
+        query.optimize(songs)
+        return query.filter(songs)
 
 
 def iter_paths(root, exclude=[], skip_hidden=True):
@@ -514,6 +1002,65 @@ def iter_paths(root, exclude=[], skip_hidden=True):
             yield fullfilename
 
 
+def _get_invalid_in_dir(dirname, songs):
+    """Returns the songs in `dirname` for which `AudioFile.valid()` would
+    return False.
+
+    All files get looked up in one directory listing. Songs not found there
+    fall back to `valid()`.
+    """
+
+    entries = {}
+    try:
+        with os.scandir(dirname) as it:
+            for entry in it:
+                entries[entry.name] = entry
+    except OSError:
+        pass
+
+    invalid = []
+    for song in songs:
+        entry = entries.get(os.path.basename(song["~filename"]))
+        if entry is None:
+            if not song.valid():
+                invalid.append(song)
+            continue
+        try:
+            current = entry.stat().st_mtime
+        except OSError:
+            current = 0
+        if not song.get("~#mtime", 0) or song["~#mtime"] != current:
+            invalid.append(song)
+    return invalid
+
+
+def _iter_invalid(items, workers):
+    """Checks all items using `workers` threads, one directory at a time.
+
+    Yields (count, invalid) tuples with the number of checked items and the
+    ones of them which are not valid. Items which don't use
+    `AudioFile.valid()` get checked in the calling thread.
+    """
+
+    by_dir = {}
+    other = []
+    for item in items:
+        if isinstance(item, AudioFile) and \
+                type(item).valid is AudioFile.valid:
+            dirname = os.path.dirname(item["~filename"])
+            by_dir.setdefault(dirname, []).append(item)
+        else:
+            other.append(item)
+
+    for results in map_parallel(
+            _get_invalid_in_dir, by_dir.items(), workers):
+        count = sum(len(songs) for (dirname, songs), invalid in results)
+        yield count, [i for a, invalid in results for i in invalid]
+
+    for item in other:
+        yield 1, ([] if item.valid() else [item])
+
+
 class FileLibrary(PicklingLibrary):
     """A library containing items on a local(-ish) filesystem.
 
@@ -631,17 +1178,21 @@ class FileLibrary(PicklingLibrary):
             else:
                 removed.add(item)
 
-    def rebuild(self, paths, force=False, exclude=[], cofuncid=None):
+    def rebuild(self, paths, force=False, exclude=[], cofuncid=None,
+                workers=0):
         """Reload or remove songs if they have changed or been deleted.
 
         This generator rebuilds the library over the course of iteration.
 
         Any paths given will be scanned for new files, using the 'scan'
-        method.
+        method, see there for `workers`.
 
         Only items present in the library when the rebuild is started
         will be checked.
 
+        If `workers` is larger than 1 the files get checked for changes
+        in that many threads first.
+
         If this function is copooled, set "cofuncid" to enable pause/stop
         buttons in the UI.
         """
@@ -658,12 +1209,33 @@ class FileLibrary(PicklingLibrary):
                 self.emit('added', list(items.values()))
                 yield True
 
+        items = sorted(self.items())
+        is_valid = lambda item: item.valid()
+        if workers > 1 and not force:
+            # stat all files up front in parallel and only check the
+            # invalid ones below
+            task = Task(_("Library"), _("Checking files"))
+            if cofuncid:
+                task.copool(cofuncid)
+            invalid = set()
+            with task:
+                done = 0
+                for count, items_invalid in _iter_invalid(
+                        self.values(), workers):
+                    done += count
+                    invalid.update(items_invalid)
+                    task.update(float(done) / len(items))
+                    yield True
+            print_d("Found %d invalid items." % len(invalid), self)
+            items = [(k, i) for (k, i) in items if i in invalid]
+            is_valid = lambda item: item not in invalid
+
         task = Task(_("Library"), _("Scanning library"))
         if cofuncid:
             task.copool(cofuncid)
         changed, removed = set(), set()
-        for i, (key, item) in task.list(enumerate(sorted(self.items()))):
-            if key in self._contents and force or not item.valid():
+        for i, (key, item) in task.list(enumerate(items)):
+            if key in self._contents and force or not is_valid(item):
                 self.reload(item, changed, removed)
                 # These numbers are pretty empirical. We should yield more
             # often than we emit signals; that way the main loop stays
@@ -683,7 +1255,7 @@ class FileLibrary(PicklingLibrary):
         if changed:
             self.emit('changed', changed)
 
-        for value in self.scan(paths, exclude, cofuncid):
+        for value in self.scan(paths, exclude, cofuncid, workers):
             yield value
 
     def add_filename(self, filename, add=True):
@@ -703,7 +1275,27 @@ class FileLibrary(PicklingLibrary):
 
         raise NotImplementedError
 
-    def scan(self, paths, exclude=[], cofuncid=None):
+    def _load_filenames(self, filenames):
+        """Yields (count, items) tuples for loading the files one by one
+        in the calling thread"""
+
+        for filename in filenames:
+            item = self.add_filename(filename, False)
+            yield 1, ([item] if item is not None else [])
+
+    def _load_filenames_parallel(self, filenames, workers):
+        """Like `_load_filenames` but reads the files in `workers` threads"""
+
+        args = ((filename, False) for filename in filenames)
+        for results in map_parallel(self.add_filename, args, workers):
+            yield len(results), [r for a, r in results if r is not None]
+
+    def scan(self, paths, exclude=[], cofuncid=None, workers=0):
+        """Scan the paths for new files and add them to the library.
+
+        If `workers` is larger than 1 that many threads read the files and
+        the results get added in the calling thread in batches.
+        """
 
         def need_yield(last_yield=[0]):
             current = time.time()
@@ -747,22 +1339,43 @@ class FileLibrary(PicklingLibrary):
             if cofuncid:
                 task.copool(cofuncid)
 
+            if workers > 1:
+                print_d("Loading %d files using %d threads." % (
+                    len(paths_to_load), workers), self)
+                loaded = self._load_filenames_parallel(paths_to_load, workers)
+            else:
+                loaded = self._load_filenames(paths_to_load)
+
             added = []
-            for real_path in task.gen(paths_to_load):
-                item = self.add_filename(real_path, False)
-                if item is not None:
-                    added.append(item)
+            done = 0
+            for count, items in loaded:
+                done += count
+                task.update(float(done) / len(paths_to_load))
+                if items:
+                    added.extend(items)
                     if len(added) > 100 or need_added():
                         self.add(added)
                         added = []
                         yield
+                        continue
                 if added and need_yield():
                     yield
+                elif not count:
+                    # nothing finished yet, don't block the main loop
+                    yield
             if added:
                 self.add(added)
                 added = []
                 yield True
 
+    def _lookup_content(self, key):
+        item = self._contents.get(key)
+        if item is None:
+            for items in self._masked.values():
+                if key in items:
+                    return items[key]
+        return item
+
     def get_content(self):
         """Return visible and masked items"""
 
@@ -863,3 +1476,19 @@ class SongFileLibrary(SongLibrary, FileLibrary):
             song = self._contents[key]
 
         return song
+
+
+class JournaledSongFileLibrary(JournalingMixin, SongFileLibrary):
+    """A `SongFileLibrary` which journals its changes to disk instead of
+    pickling all songs on each save, see `JournalingMixin`"""
+
+    def __init__(self, name=None):
+        print_d("Using journaling persistence for library \"%s\"" % name)
+        super(JournaledSongFileLibrary, self).__init__(name)
+
+    def remove_masked(self, mount_point):
+        # this doesn't emit any signals, but the songs are gone for good
+        self._journal_pending.update(
+            item.key for item in self.get_masked(mount_point))
+        self.dirty = True
+        super(JournaledSongFileLibrary, self).remove_masked(mount_point)
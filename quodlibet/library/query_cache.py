@@ -0,0 +1,230 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Results of recent library queries, so repeating or refining a query
+(like when typing in the search bar) doesn't have to look at every song
+in the library again."""
+
+import unicodedata
+from collections import OrderedDict
+
+from quodlibet.query._match import Inter, Regex, Tag
+from quodlibet.unisearch.db import get_replacement_mapping
+from quodlibet.util import re_literal
+from quodlibet.util.dprint import print_d
+
+
+def _get_text(value):
+    """Returns the text `value` searches for if it is a Regex matching
+    all text containing it, otherwise None.
+    """
+
+    if not isinstance(value, Regex) or not value.pattern:
+        return None
+
+    text = re_literal(value.pattern)
+    if text is None:
+        return None
+    return unicodedata.normalize("NFC", text)
+
+
+def _has_sequences(text):
+    # with diacritic matching sequences like "ae" also match a single
+    # character, so "ae" doesn't imply "a"
+    return any(len(k) > 1 and k in text for k in get_replacement_mapping())
+
+
+def _implies(node, other):
+    """If all songs matching `node` also match `other`"""
+
+    if node._get_key() == other._get_key():
+        return True
+
+    if not isinstance(node, Tag) or not isinstance(other, Tag):
+        return False
+
+    if (node._names, node._intern, node._fs) != \
+            (other._names, other._intern, other._fs):
+        return False
+
+    value, other_value = node.res, other.res
+    text, other_text = _get_text(value), _get_text(other_value)
+    if text is None or other_text is None or \
+            value.mod_string != other_value.mod_string:
+        return False
+
+    if "d" in value.mod_string and _has_sequences(text):
+        return False
+
+    return other_text in text
+
+
+def _get_terms(node):
+    node = node._unpack()
+    if isinstance(node, Inter):
+        return node.res
+    return [node]
+
+
+def _refines(node, other):
+    """If `node` only matches songs which `other` matches, judging from
+    the terms of both"""
+
+    terms = _get_terms(node)
+    return all(any(_implies(t, o) for t in terms) for o in _get_terms(other))
+
+
+class _Entry(object):
+
+    def __init__(self, query, songs):
+        self.query = query
+        # used as an ordered set, in library order unless `ordered` is False
+        self.songs = dict.fromkeys(songs)
+        self.ordered = True
+
+
+class QueryCache(object):
+    """Remembers the songs matching the most recently used queries.
+
+    A query which is a refinement of a remembered one (it has additional
+    terms, or searches for a longer text) only gets checked against the
+    songs of the remembered one. The results are kept up to date
+    through the library signals.
+
+    Only queries for which `Query.is_cacheable` is True can be used.
+    """
+
+    MAX_ENTRIES = 10
+    """Number of queries to remember"""
+
+    def __init__(self, library, search):
+        """`search` gets called with a query and has to return the songs
+        in `library` matching it, for queries not remembered."""
+
+        print_d("Initializing query cache for %r" % library._name)
+
+        self._search = search
+        # key -> _Entry, least recently used first
+        self._entries = OrderedDict()
+
+        self.generation = 0
+        """Increases with every change to the library"""
+
+        self._library = library
+        self._sigs = [
+            library.connect('added', self.__added),
+            library.connect('removed', self.__removed),
+            library.connect('changed', self.__changed),
+        ]
+
+    def destroy(self):
+        for sig in self._sigs:
+            self._library.disconnect(sig)
+        self._entries.clear()
+
+    def clear(self):
+        """Forget all queries"""
+
+        self._entries.clear()
+
+    def _get_key(self, query):
+        # the parsed form, so differences in whitespace and quoting
+        # of otherwise equal queries don't matter
+        return query._unpack()._get_key()
+
+    def lookup(self, query):
+        """Returns a (songs, complete) tuple. If complete is True `songs`
+        are the ones matching `query`, otherwise all songs matching are
+        included in `songs`. `songs` is None if nothing is known.
+        """
+
+        assert query.is_cacheable()
+
+        key = self._get_key(query)
+        entries = self._entries
+        entry = entries.get(key)
+        if entry is not None:
+            entries.move_to_end(key)
+            return self._get_songs(entry), True
+
+        base = None
+        node = query._unpack()
+        for other in entries.values():
+            if _refines(node, other.query._unpack()):
+                if base is None or len(other.songs) < len(base.songs):
+                    base = other
+
+        if base is not None:
+            return self._get_songs(base), False
+        return None, False
+
+    def _get_songs(self, entry):
+        if not entry.ordered:
+            # sorting them would need the position of each song
+            songs = entry.songs
+            entry.songs = dict.fromkeys(
+                s for s in self._library.values() if s in songs)
+            entry.ordered = True
+        return list(entry.songs)
+
+    def add(self, query, songs, generation=None):
+        """Remember `songs` as the result of `query`.
+
+        If `generation` is given and the library has changed since then
+        the songs are ignored.
+        """
+
+        if generation is not None and generation != self.generation:
+            return
+
+        entries = self._entries
+        entries[self._get_key(query)] = _Entry(query, songs)
+        if len(entries) > self.MAX_ENTRIES:
+            entries.popitem(last=False)
+
+    def query(self, query):
+        """Returns a list of songs matching `query`"""
+
+        songs, complete = self.lookup(query)
+        if complete:
+            return songs
+
+        if songs is not None:
+            query.optimize(songs)
+            songs = query.filter(songs)
+        else:
+            songs = self._search(query)
+
+        self.add(query, songs)
+        return list(songs)
+
+    def __added(self, library, songs):
+        self.generation += 1
+        for entry in self._entries.values():
+            entry.songs.update(
+                dict.fromkeys(entry.query.filter(songs)))
+
+    def __removed(self, library, songs):
+        self.generation += 1
+        for entry in self._entries.values():
+            matching = entry.songs
+            for song in songs:
+                matching.pop(song, None)
+
+    def __changed(self, library, songs):
+        self.generation += 1
+        # changed can also be emitted for songs not in the library
+        songs = [s for s in songs if s in library]
+        for entry in self._entries.values():
+            search = entry.query.search
+            matching = entry.songs
+            for song in songs:
+                if search(song):
+                    # new ones would end up last, renamed ones move in the
+                    # library, so sort again once needed
+                    matching[song] = None
+                    entry.ordered = False
+                else:
+                    matching.pop(song, None)
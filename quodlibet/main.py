@@ -15,6 +15,7 @@ from senf import environ, argv as sys_argv
 from quodlibet import _
 from quodlibet.cli import process_arguments, exit_
 from quodlibet.util.dprint import print_d, print_, print_exc
+from quodlibet.util.tracing import trace, finish_startup_trace
 
 
 def main(argv=None):
@@ -45,6 +46,13 @@ def main(argv=None):
     from quodlibet import config
     from quodlibet import browsers
     from quodlibet import util
+    from quodlibet.util import copool
+    from quodlibet.pattern import pattern_cache, format_cache
+
+    pattern_cache.max_size = config.getint(
+        "settings", "pattern_cache_size", pattern_cache.max_size)
+    format_cache.max_size = config.getint(
+        "settings", "pattern_format_cache_size", format_cache.max_size)
 
     app.name = "Quod Libet"
     app.description = _("Music player and music library manager")
@@ -57,7 +65,8 @@ def main(argv=None):
     print_d("Initializing main library (%s)" % (
             quodlibet.util.path.unexpand(library_path)))
 
-    library = quodlibet.library.init(library_path)
+    with trace("library"):
+        library = quodlibet.library.init(library_path)
     app.library = library
 
     # this assumes that nullbe will always succeed
@@ -65,18 +74,21 @@ def main(argv=None):
     wanted_backend = environ.get(
         "QUODLIBET_BACKEND", config.get("player", "backend"))
 
-    try:
-        player = quodlibet.player.init_player(wanted_backend, app.librarian)
-    except PlayerError:
-        print_exc()
-        player = quodlibet.player.init_player("nullbe", app.librarian)
+    with trace("player"):
+        try:
+            player = quodlibet.player.init_player(
+                wanted_backend, app.librarian)
+        except PlayerError:
+            print_exc()
+            player = quodlibet.player.init_player("nullbe", app.librarian)
 
     app.player = player
 
     environ["PULSE_PROP_media.role"] = "music"
     environ["PULSE_PROP_application.icon_name"] = app.icon_name
 
-    browsers.init()
+    with trace("browsers"):
+        browsers.init()
 
     from quodlibet.qltk.songlist import SongList, get_columns
 
@@ -93,28 +105,30 @@ def main(argv=None):
     for Kind in browsers.browsers:
         if Kind.headers is not None:
             Kind.headers.extend(in_all)
-        Kind.init(library)
+        with trace(Kind.__name__, "browser"):
+            Kind.init(library)
 
-    pm = quodlibet.init_plugins("no-plugins" in startup_actions)
+    with trace("plugins"):
+        pm = quodlibet.init_plugins("no-plugins" in startup_actions)
 
-    if hasattr(player, "init_plugins"):
-        player.init_plugins()
+        if hasattr(player, "init_plugins"):
+            player.init_plugins()
 
-    from quodlibet.qltk import unity
-    unity.init("io.github.quodlibet.QuodLibet.desktop", player)
+        from quodlibet.qltk import unity
+        unity.init("io.github.quodlibet.QuodLibet.desktop", player)
 
-    from quodlibet.qltk.songsmenu import SongsMenu
-    SongsMenu.init_plugins()
+        from quodlibet.qltk.songsmenu import SongsMenu
+        SongsMenu.init_plugins()
 
-    from quodlibet.util.cover import CoverManager
-    app.cover_manager = CoverManager()
-    app.cover_manager.init_plugins()
+        from quodlibet.util.cover import CoverManager
+        app.cover_manager = CoverManager()
+        app.cover_manager.init_plugins()
 
-    from quodlibet.plugins.playlist import PLAYLIST_HANDLER
-    PLAYLIST_HANDLER.init_plugins()
+        from quodlibet.plugins.playlist import PLAYLIST_HANDLER
+        PLAYLIST_HANDLER.init_plugins()
 
-    from quodlibet.plugins.query import QUERY_HANDLER
-    QUERY_HANDLER.init_plugins()
+        from quodlibet.plugins.query import QUERY_HANDLER
+        QUERY_HANDLER.init_plugins()
 
     from gi.repository import GLib
 
@@ -134,20 +148,22 @@ def main(argv=None):
     # Call exec_commands after the window is restored, but make sure
     # it's after the mainloop has started so everything is set up.
 
-    app.window = window = QuodLibetWindow(
-        library, player,
-        restore_cb=lambda:
-            GLib.idle_add(exec_commands, priority=GLib.PRIORITY_HIGH))
+    with trace("window"):
+        app.window = window = QuodLibetWindow(
+            library, player,
+            restore_cb=lambda:
+                GLib.idle_add(exec_commands, priority=GLib.PRIORITY_HIGH))
 
-    app.player_options = PlayerOptions(window)
+        app.player_options = PlayerOptions(window)
 
     from quodlibet.qltk.window import Window
 
     from quodlibet.plugins.events import EventPluginHandler
     from quodlibet.plugins.gui import UserInterfacePluginHandler
-    pm.register_handler(EventPluginHandler(library.librarian, player,
-                                           app.window.songlist))
-    pm.register_handler(UserInterfacePluginHandler())
+    with trace("plugin handlers"):
+        pm.register_handler(EventPluginHandler(library.librarian, player,
+                                               app.window.songlist))
+        pm.register_handler(UserInterfacePluginHandler())
 
     from quodlibet.mmkeys import MMKeysHandler
     from quodlibet.remote import Remote, RemoteError
@@ -190,6 +206,15 @@ def main(argv=None):
     GLib.idle_add(LibraryBrowser.restore, library, player,
                   priority=GLib.PRIORITY_HIGH)
 
+    # runs once the main loop is idle, after the window got shown
+    def startup_done():
+        finish_startup_trace()
+        if config.getboolean("albumart", "pregenerate_thumbnails"):
+            copool.add(app.cover_manager.warm_thumbnails, library.albums,
+                       funcid="thumbnails", cofuncid="thumbnails")
+        return False
+    GLib.idle_add(startup_done)
+
     def before_quit():
         print_d("Saving active browser state")
         try:
@@ -197,6 +222,18 @@ def main(argv=None):
         except NotImplementedError:
             pass
 
+        try:
+            copool.remove("thumbnails")
+        except ValueError:
+            pass
+
+        print_d("Emitting pending library signals")
+        app.librarian.flush()
+
+        print_d("Writing changed playlists")
+        from quodlibet.browsers.playlists import PlaylistsBrowser
+        PlaylistsBrowser.write_pending()
+
         print_d("Shutting down player device %r." % player.version_info)
         player.destroy()
 
@@ -215,6 +252,9 @@ def main(argv=None):
 
     session_client.close()
 
+    print_d("Pattern cache: %r" % pattern_cache.stats())
+    print_d("Pattern format cache: %r" % format_cache.stats())
+    print_d("Library signals: %r" % app.librarian.signal_stats())
     print_d("Finished shutdown.")
 
     if app.is_restarting:
@@ -5,7 +5,8 @@
 
 from ._pattern import (Pattern, FileFromPattern, XMLFromPattern,
     XMLFromMarkupPattern, error,
-    ArbitraryExtensionFileFromPattern, URLFromPattern)
+    ArbitraryExtensionFileFromPattern, URLFromPattern, PatternCache,
+    pattern_cache, FormatCache, format_cache)
 
 
 URLFromPattern
@@ -15,3 +16,7 @@ Pattern
 XMLFromMarkupPattern
 XMLFromPattern
 error
+PatternCache
+pattern_cache
+FormatCache
+format_cache
@@ -13,6 +13,8 @@
 
 import os
 import re
+import time
+from collections import OrderedDict
 from re import Scanner  # type: ignore
 from urllib.parse import quote_plus
 
@@ -21,7 +23,8 @@ from senf import sep, fsnative, expanduser
 from quodlibet import util
 from quodlibet.query import Query
 from quodlibet.util.path import strip_win32_incompat_from_path, limit_path
-from quodlibet.formats._audio import decode_value, FILESYSTEM_TAGS
+from quodlibet.formats._audio import decode_value, FILESYSTEM_TAGS, \
+    VOLATILE_TAGS, AudioFile
 
 # Token types.
 (OPEN, CLOSE, TEXT, COND, EOF) = range(5)
@@ -186,6 +189,10 @@ class PatternFormatter(object):
     _post = None
     _text = None
 
+    cacheable = False
+    """If the output only depends on the tags of the formatted song, so
+    it can be kept in `format_cache`"""
+
     def __init__(self, func, list_func, tags):
         self.__func = func
         self.__list_func = list_func
@@ -242,6 +249,11 @@ class PatternFormatter(object):
             return values
 
     def format(self, song):
+        if self.cacheable and isinstance(song, AudioFile):
+            return format_cache.get(self, song, False, self.__format)
+        return self.__format(song)
+
+    def __format(self, song):
         value = u"".join(self.__func(self.SongProxy(song, self._format)))
         if self._post:
             return self._post(value, song)
@@ -252,6 +264,11 @@ class PatternFormatter(object):
         combinations always returns pairs of display and sort values. The
         returned set will never be empty (e.g. for an empty pattern).
         """
+        if self.cacheable and isinstance(song, AudioFile):
+            return set(format_cache.get(self, song, True, self.__format_list))
+        return set(self.__format_list(song))
+
+    def __format_list(self, song):
         vals = [(u"", u"")]
         for val in self.__list_func(self.SongProxy(song, self._format)):
             if not val:
@@ -265,7 +282,7 @@ class PatternFormatter(object):
         if self._post:
             vals = ((self._post(v[0], song), self._post(v[1], song))
                     for v in vals)
-        return set(vals)
+        return frozenset(vals)
 
     __mod__ = format
 
@@ -273,6 +290,9 @@ class PatternFormatter(object):
 class PatternCompiler(object):
     def __init__(self, root):
         self.__root = root.node
+        self.cacheable = True
+        """False if the compiled functions use tags or queries with
+        results depending on more than the song"""
 
     def compile(self, song_func, text_formatter=None):
         tags = []
@@ -294,6 +314,8 @@ class PatternCompiler(object):
         return scope["f"], tags
 
     def __get_value(self, text, scope, tag):
+        if not VOLATILE_TAGS.isdisjoint(util.tagsplit(tag)):
+            self.cacheable = False
         if tag not in scope:
             t_var = 'v%d' % len(scope)
             scope[tag] = t_var
@@ -312,6 +334,8 @@ class PatternCompiler(object):
             else:
                 q = Query.StrictQueryMatcher(query)
                 if q is not None:
+                    if not q.is_cacheable():
+                        self.cacheable = False
                     q_var = 'q%d' % len(queries)
                     r_var = 'r%d' % len(qscope)
                     queries[query] = (q_var, q.search)
@@ -361,15 +385,162 @@ class PatternCompiler(object):
         return text
 
 
-def Pattern(string, Kind=PatternFormatter, MAX_CACHE_SIZE=100, cache={}):
-    if (Kind, string) not in cache:
-        if len(cache) > MAX_CACHE_SIZE:
-            cache.clear()
+class PatternCache(object):
+    """Keeps the most recently used compiled patterns, up to `max_size`.
+
+    Counts hits, misses and the time spent compiling, in total and for
+    each formatter class (see `stats()`).
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        """Maximum number of patterns to keep"""
+
+        self.hits = 0
+        self.misses = 0
+        self.compile_time = 0.0
+
+        # (Kind, string) -> formatter, least recently used first
+        self._entries = OrderedDict()
+        # Kind -> [entries, hits, misses, compile time]
+        self._kinds = {}
+
+    def clear(self):
+        """Forget all patterns, but not the statistics"""
+
+        self._entries.clear()
+        for kind in self._kinds.values():
+            kind[0] = 0
+
+    def stats(self):
+        """Returns a dict with the number of patterns, the maximum number,
+        the hits/misses, the compile time in seconds and the same numbers
+        for each formatter class by its name in "kinds"
+        """
+
+        kinds = {}
+        for Kind, (entries, hits, misses, compile_time) in \
+                self._kinds.items():
+            kinds[Kind.__name__] = {
+                "entries": entries,
+                "hits": hits,
+                "misses": misses,
+                "compile_time": compile_time,
+            }
+
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "compile_time": self.compile_time,
+            "kinds": kinds,
+        }
+
+    def get(self, string, Kind):
+        """Returns the formatter of class `Kind` for the pattern `string`,
+        compiling it if needed"""
+
+        key = (Kind, string)
+        entries = self._entries
+        formatter = entries.get(key)
+        kind = self._kinds.get(Kind)
+        if kind is None:
+            kind = self._kinds[Kind] = [0, 0, 0, 0.0]
+
+        if formatter is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            kind[1] += 1
+            return formatter
+
+        start = time.perf_counter()
         comp = PatternCompiler(PatternParser(PatternLexer(string)))
         func, tags = comp.compile("comma", Kind._text)
         list_func, tags = comp.compile("list_separate", Kind._text)
-        cache[(Kind, string)] = Kind(func, list_func, tags)
-    return cache[(Kind, string)]
+        formatter = Kind(func, list_func, tags)
+        formatter.cacheable = comp.cacheable
+        elapsed = time.perf_counter() - start
+
+        self.misses += 1
+        self.compile_time += elapsed
+        kind[0] += 1
+        kind[2] += 1
+        kind[3] += elapsed
+
+        entries[key] = formatter
+        while len(entries) > self.max_size:
+            (old_kind, old_string), old = entries.popitem(last=False)
+            self._kinds[old_kind][0] -= 1
+        return formatter
+
+
+pattern_cache = PatternCache(500)
+"""The compiled patterns used by `Pattern()` and the other pattern
+functions"""
+
+
+class FormatCache(object):
+    """Keeps the output of the most recently formatted songs, up to
+    `max_size` results. 0 disables it.
+
+    Results are stored by formatter and `AudioFile.generation`, so they
+    get recomputed once a tag of the song changes.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        """Maximum number of results to keep"""
+
+        self.hits = 0
+        self.misses = 0
+
+        # (formatter, is list, generation) -> result,
+        # least recently used first
+        self._entries = OrderedDict()
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        """Returns a dict with the number of results, the maximum number
+        and the hits/misses"""
+
+        return {
+            "entries": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def get(self, formatter, song, is_list, format_):
+        """Returns the result of `format_(song)`, calling it only if not
+        already known for the current tags of `song`"""
+
+        key = (formatter, is_list, song.generation)
+        entries = self._entries
+        value = entries.get(key)
+        if value is not None:
+            entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = format_(song)
+        if self.max_size > 0:
+            entries[key] = value
+            if len(entries) > self.max_size:
+                entries.popitem(last=False)
+        return value
+
+
+format_cache = FormatCache(50000)
+"""The output of cacheable formatters (see `PatternFormatter.cacheable`)
+for recently formatted songs"""
+
+
+def Pattern(string, Kind=PatternFormatter):
+    return pattern_cache.get(string, Kind)
 
 
 def _number(key, value):
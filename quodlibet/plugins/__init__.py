@@ -5,23 +5,33 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import json
+import importlib
+
+from senf import environ, fsn2text
+
 from quodlibet import _
 from quodlibet import config
+from quodlibet import const
 from quodlibet import util
+from quodlibet.util.atomic import atomic_save
 from quodlibet.util.modulescanner import ModuleScanner
-from quodlibet.util.dprint import print_d
+from quodlibet.util.dprint import print_d, print_w
+from quodlibet.util.path import mtime
 from quodlibet.util.config import ConfigProxy
 from quodlibet.qltk.ccb import ConfigCheckButton
 
 
-def init(folders=None, disable_plugins=False):
+def init(folders=None, disable_plugins=False, manifest_path=None):
     """folders: list of paths to look for plugins
     disable_plugins: disables all plugins, but does not forget which
     plugins are enabled.
+    manifest_path: file for caching what the plugin modules contain
+    (see PluginManifest)
     """
     if disable_plugins:
         folders = []
-    manager = PluginManager.instance = PluginManager(folders)
+    manager = PluginManager.instance = PluginManager(folders, manifest_path)
     return manager
 
 
@@ -114,16 +124,25 @@ def list_plugins(module):
 
 class PluginModule(object):
 
-    def __init__(self, name, module):
+    def __init__(self, name, module, plugins=None):
+        """If `module` is None the plugins have to be passed"""
+
         self.name = name
         self.module = module
-        self.plugins = [Plugin(cls) for cls in list_plugins(module)]
+        if plugins is None:
+            plugins = [Plugin(cls) for cls in list_plugins(module)]
+        self.plugins = plugins
 
 
 class Plugin(object):
 
-    def __init__(self, plugin_cls):
+    def __init__(self, plugin_cls, deferred=False):
+        """If `deferred` is True `plugin_cls` is only a stand-in for the
+        real class, with the same plugin attributes and base classes, until
+        PluginManager.load() is called."""
+
         self.cls = plugin_cls
+        self.deferred = deferred
         self.handlers = []
         self.instance = None
 
@@ -174,6 +193,146 @@ class Plugin(object):
         return self.instance
 
 
+def _get_base_names(plugin_cls):
+    # the base classes which don't come from plugins, for deciding which
+    # handlers are interested without importing the plugin
+    names = []
+    for cls in plugin_cls.__mro__[1:]:
+        module = cls.__module__
+        if module.startswith("quodlibet.") and \
+                not module.startswith("quodlibet.fake."):
+            names.append("%s:%s" % (module, cls.__qualname__))
+    return names
+
+
+def _create_stand_in(info):
+    bases = []
+    for name in info["bases"]:
+        module, qualname = name.split(":")
+        obj = importlib.import_module(module)
+        for attr in qualname.split("."):
+            obj = getattr(obj, attr)
+        bases.append(obj)
+
+    # the others are implied and could lead to an inconsistent MRO
+    bases = [b for b in bases
+             if not any(o is not b and issubclass(o, b) for o in bases)]
+
+    return type(info["class"], tuple(bases) or (object,), {
+        "__module__": info["module"],
+        "PLUGIN_ID": info["id"],
+        "PLUGIN_NAME": info["name"],
+        "PLUGIN_DESC": info["description"],
+        "PLUGIN_TAGS": info["tags"],
+        "PLUGIN_ICON": info["icon"],
+        "PLUGIN_CAN_ENABLE": info["can_enable"],
+    })
+
+
+class PluginManifest(object):
+    """Remembers which plugins the plugin modules contain, so modules
+    containing only disabled plugins don't have to be imported on start.
+
+    Entries are only used as long as the modification times of the module
+    files stay the same and get rebuilt once the module gets imported.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._modules = {}
+        self._changed = False
+        self._key = [
+            const.VERSION, fsn2text(environ.get("LANGUAGE", u""))]
+
+        try:
+            with open(path, "r", encoding="utf-8") as h:
+                data = json.load(h)
+        except (EnvironmentError, ValueError):
+            return
+
+        # translated names or new base classes would be outdated
+        if not isinstance(data, dict) or data.get("key") != self._key:
+            return
+        self._modules = data.get("modules", {})
+
+    def get_plugins(self, name, deps):
+        """Returns a list of deferred plugins for the module `name` with
+        the dependency paths `deps`, or None if not known."""
+
+        entry = self._modules.get(name)
+        if entry is None:
+            return None
+
+        old_deps = entry["deps"]
+        if set(old_deps) != set(deps) or \
+                any(mtime(d) != old_deps[d] for d in deps):
+            return None
+
+        try:
+            return [Plugin(_create_stand_in(info), True)
+                    for info in entry["plugins"]]
+        except Exception:
+            util.print_exc()
+            return None
+
+    def set_plugins(self, name, deps, plugins):
+        """Remember the plugins of module `name`"""
+
+        infos = []
+        for plugin in plugins:
+            cls = plugin.cls
+            if not isinstance(cls, type):
+                # list_plugins() allows any object, always import those
+                self.remove(name)
+                return
+            infos.append({
+                "class": cls.__name__,
+                "module": cls.__module__,
+                "id": plugin.id,
+                "name": plugin.name,
+                "description": plugin.description,
+                "tags": plugin.tags,
+                "icon": plugin.icon,
+                "can_enable": plugin.can_enable,
+                "bases": _get_base_names(cls),
+            })
+
+        entry = {"deps": {d: mtime(d) for d in deps}, "plugins": infos}
+        try:
+            json.dumps(entry)
+        except (TypeError, ValueError):
+            # some plugin attribute which can't be stored, always import
+            self.remove(name)
+            return
+
+        self._modules[name] = entry
+        self._changed = True
+
+    def remove(self, name):
+        if self._modules.pop(name, None) is not None:
+            self._changed = True
+
+    def retain(self, names):
+        """Forget all modules not in `names`"""
+
+        for name in list(self._modules):
+            if name not in names:
+                self.remove(name)
+
+    def save(self):
+        if not self._changed:
+            return
+
+        data = {"key": self._key, "modules": self._modules}
+        try:
+            with atomic_save(self.path, "wb") as h:
+                h.write(json.dumps(data).encode("utf-8"))
+        except EnvironmentError as e:
+            print_w("Couldn't save plugin manifest: %s" % e)
+        else:
+            self._changed = False
+
+
 class PluginHandler(object):
     """A plugin handler can choose to handle plugins, as well as control
     their enabled state."""
@@ -207,6 +366,10 @@ class PluginManager(object):
     If plugin handlers want a plugin instance, they have to call
     Plugin.get_instance() to get a singleton.
 
+    If a manifest is used, modules which are known from it don't get
+    imported until one of their plugins gets enabled or load() gets called
+    for it. Until then handlers only see a stand-in for the plugin class.
+
     handlers need to implement the following methods:
 
         handler.plugin_handle(plugin)
@@ -226,9 +389,11 @@ class PluginManager(object):
 
     instance = None  # default instance
 
-    def __init__(self, folders=None):
+    def __init__(self, folders=None, manifest_path=None):
         """folders is a list of paths that will be scanned for plugins.
         Plugins in later paths will be preferred if they share a name.
+
+        manifest_path is the file to cache the plugin module contents in.
         """
 
         super(PluginManager, self).__init__()
@@ -240,15 +405,30 @@ class PluginManager(object):
         self.__modules = {}     # name: PluginModule
         self.__handlers = []    # handler list
         self.__enabled = set()  # (possibly) enabled plugin IDs
+        self.__manifest = None
+        if manifest_path is not None:
+            self.__manifest = PluginManifest(manifest_path)
+        self.__deferred = {}    # name: plugins from the manifest
 
         self.__restore()
 
+    def __defer(self, name, deps):
+        if self.__manifest is None:
+            return False
+
+        plugins = self.__manifest.get_plugins(name, deps)
+        if plugins is None:
+            return False
+
+        self.__deferred[name] = plugins
+        return True
+
     def rescan(self):
         """Scan for plugin changes or to initially load all plugins"""
 
         print_d("Rescanning..")
 
-        removed, added = self.__scanner.rescan()
+        removed, added = self.__scanner.rescan(self.__defer)
 
         # remember IDs of enabled plugin that get reloaded, so we can enable
         # them again
@@ -270,9 +450,56 @@ class PluginManager(object):
 
         for name in added:
             new_module = self.__scanner.modules[name]
-            self.__add_module(name, new_module.module)
+            self.__add_module(name, new_module)
+
+        if self.__manifest is not None:
+            self.__manifest.retain(self.__scanner.modules)
+            self.__manifest.save()
+
+        print_d("Rescanning done: %d modules deferred" % len(
+            [m for m in self.__modules.values() if m.module is None]))
+
+    def load(self, plugin):
+        """Imports the module of `plugin` in case it was deferred.
+
+        Returns True if the real plugin class is available afterwards.
+        """
+
+        if not plugin.deferred:
+            return True
+
+        for name, plugin_module in self.__modules.items():
+            if plugin in plugin_module.plugins:
+                break
+        else:
+            return False
+
+        print_d("Importing plugin module %r" % name)
+        module = self.__scanner.load(name)
+        if module is None:
+            # import it on the next start, to show the error
+            self.__manifest.remove(name)
+            self.__manifest.save()
+            return False
+        plugin_module.module = module
 
-        print_d("Rescanning done.")
+        classes = {cls.PLUGIN_ID: cls for cls in list_plugins(module)}
+        if set(classes) != {p.id for p in plugin_module.plugins}:
+            # not what the manifest said, rebuild it next time
+            self.__manifest.remove(name)
+            self.__manifest.save()
+
+        for plugin in plugin_module.plugins:
+            cls = classes.get(plugin.id)
+            if cls is None:
+                continue
+            plugin.cls = cls
+            plugin.deferred = False
+            # let the handlers see the real class
+            for handler in plugin.handlers:
+                handler.plugin_handle(plugin)
+
+        return not plugin.deferred
 
     @property
     def _modules(self):
@@ -351,6 +578,9 @@ class PluginManager(object):
                 except Exception:
                     util.print_exc()
         else:
+            if not self.load(plugin):
+                print_w("Can't enable %r, import failed" % plugin.id)
+                return
             print_d("Enable %r" % plugin.id)
             obj = plugin.get_instance()
             if obj and hasattr(obj, "enabled"):
@@ -390,8 +620,16 @@ class PluginManager(object):
             if plugin.handlers:
                 self.enable(plugin, False)
 
-    def __add_module(self, name, module):
-        plugin_mod = PluginModule(name, module)
+    def __add_module(self, name, scanner_module):
+        module = scanner_module.module
+        if module is None:
+            plugin_mod = PluginModule(
+                name, None, self.__deferred.pop(name))
+        else:
+            plugin_mod = PluginModule(name, module)
+            if self.__manifest is not None:
+                self.__manifest.set_plugins(
+                    name, scanner_module.deps, plugin_mod.plugins)
         self.__modules[name] = plugin_mod
 
         for plugin in plugin_mod.plugins:
@@ -328,6 +328,8 @@ class PluginPreferencesContainer(Gtk.VBox):
             frame.get_child().destroy()
 
         if plugin is not None:
+            # the preferences need the real plugin class
+            PluginManager.instance.load(plugin)
             instance_or_cls = plugin.get_instance() or plugin.cls
 
             if plugin and hasattr(instance_or_cls, 'PluginPreferences'):
@@ -9,6 +9,7 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+from collections import OrderedDict
 from typing import List
 
 from gi.repository import Gtk, GLib, Gdk, GObject
@@ -31,7 +32,7 @@ from quodlibet.qltk.songmodel import PlaylistModel
 from quodlibet.qltk import Icons
 from quodlibet.qltk.util import GSignals
 from quodlibet.qltk.delete import trash_songs
-from quodlibet.formats._audio import TAG_TO_SORT, AudioFile
+from quodlibet.formats._audio import TAG_TO_SORT, VOLATILE_TAGS, AudioFile
 from quodlibet.qltk.x import SeparatorMenuItem
 from quodlibet.qltk.songlistcolumns import create_songlist_column
 from quodlibet.util import connect_destroy
@@ -187,6 +188,100 @@ def header_tag_split(header):
         return util.tagsplit(header)
 
 
+class _SortKeys(object):
+
+    def __init__(self):
+        # generation -> sort key
+        self.keys = {}
+        # generation -> position of the key in the last sorted songs
+        self.ranks = {}
+
+
+class SortKeyCache(object):
+    """Sort keys of songs for the most recently used sort tags, so sorting
+    by one of them again doesn't have to compute them again.
+
+    Keys are stored by `AudioFile.generation`, so they get computed again
+    once the song changes.
+    """
+
+    MAX_TAGS = 4
+    """Number of sort tags to keep the keys for"""
+
+    def __init__(self):
+        # tag -> _SortKeys, least recently used first
+        self._tags = OrderedDict()
+
+    def clear(self):
+        self._tags.clear()
+
+    def _is_cacheable(self, tag):
+        if callable(tag):
+            # a bound PatternFormatter method
+            return getattr(getattr(tag, "__self__", None), "cacheable", False)
+        return VOLATILE_TAGS.isdisjoint(util.tagsplit(tag))
+
+    def sort(self, tag, songs, reverse=False):
+        """Sorts `songs` in place by `tag` (a tag or a callable, see
+        `get_sort_tag`)"""
+
+        sort_func = AudioFile.sort_by_func(tag, {})
+        if not self._is_cacheable(tag):
+            songs.sort(key=sort_func, reverse=reverse)
+            return
+
+        tags = self._tags
+        entry = tags.get(tag)
+        if entry is None:
+            entry = tags[tag] = _SortKeys()
+            if len(tags) > self.MAX_TAGS:
+                tags.popitem(last=False)
+        else:
+            tags.move_to_end(tag)
+
+        generations = [song.generation for song in songs]
+        ranks = entry.ranks
+        try:
+            # comparing numbers is a lot faster than comparing the keys
+            values = [ranks[g] for g in generations]
+        except KeyError:
+            keys = entry.keys
+            for song, generation in zip(songs, generations):
+                if generation not in keys:
+                    keys[generation] = sort_func(song)
+
+            # drop the keys of changed and removed songs
+            if len(keys) > 2 * len(generations) + 1000:
+                keys = entry.keys = {g: keys[g] for g in generations}
+
+            values = [keys[g] for g in generations]
+            order = sorted(
+                range(len(songs)), key=values.__getitem__, reverse=reverse)
+            entry.ranks = self._get_ranks(values, generations, order, reverse)
+        else:
+            order = sorted(
+                range(len(songs)), key=values.__getitem__, reverse=reverse)
+
+        songs[:] = [songs[i] for i in order]
+
+    def _get_ranks(self, keys, generations, order, reverse):
+        # the position of each key in the sorted keys, equal keys share one
+        ranks = {}
+        rank = -1
+        last = None
+        for i in (reversed(order) if reverse else order):
+            key = keys[i]
+            if rank < 0 or key != last:
+                rank += 1
+                last = key
+            ranks[generations[i]] = rank
+        return ranks
+
+
+sort_keys = SortKeyCache()
+"""Sort keys used by all song lists"""
+
+
 class SongListDnDMixin(object):
     """DnD support for the SongList class"""
 
@@ -772,8 +867,7 @@ class SongList(AllTreeView, SongListDnDMixin, DragScroll,
             if tag == "":
                 songs.sort(key=lambda s: s.sort_key, reverse=reverse)
             else:
-                sort_func = AudioFile.sort_by_func(tag)
-                songs.sort(key=sort_func, reverse=reverse)
+                sort_keys.sort(tag, songs, reverse)
 
     def add_songs(self, songs):
         """Add songs to the list in the right order and position"""
@@ -15,8 +15,9 @@ import operator
 from senf import fsn2text, fsnative
 
 from quodlibet.unisearch import compile
-from quodlibet.util import parse_date
+from quodlibet.util import parse_date, tagsplit
 from quodlibet.formats import FILESYSTEM_TAGS, TIME_TAGS
+from quodlibet.formats._audio import VOLATILE_TAGS
 
 
 class error(ValueError):
@@ -35,9 +36,32 @@ class Node(object):
     def filter(self, sequence):
         return [s for s in sequence if self.search(s)]
 
+    def search_index(self, index):
+        """Returns the set of songs in `index` (a `TagIndex`) matching,
+        or None if that needs a search through all songs.
+
+        The returned set must not be modified.
+        """
+
+        return None
+
+    def is_cacheable(self):
+        """Whether the result for a song only depends on its tags, and not
+        on the current time or external state, so it can be cached until
+        the song changes."""
+
+        return True
+
     def _unpack(self):
         return self
 
+    def _get_key(self):
+        """Returns a hashable value which is equal for nodes matching
+        the same songs in the same way (but not necessarily only then)"""
+
+        # unknown nodes are only equal to themselves
+        return (type(self), id(self))
+
     def __or__(self, other):
         return NotImplemented
 
@@ -66,6 +90,9 @@ class Regex(Node):
     def __repr__(self):
         return "<Regex pattern=%s mod=%s>" % (self.pattern, self.mod_string)
 
+    def _get_key(self):
+        return (Regex, self.pattern, self.mod_string)
+
 
 class True_(Node):
     """Always True"""
@@ -76,9 +103,15 @@ class True_(Node):
     def filter(self, list_):
         return list(list_)
 
+    def search_index(self, index):
+        return index.songs
+
     def __repr__(self):
         return "<True>"
 
+    def _get_key(self):
+        return (True_,)
+
     def __or__(self, other):
         return self
 
@@ -96,9 +129,15 @@ class False_(Node):
     def filter(self, list_):
         return []
 
+    def search_index(self, index):
+        return set()
+
     def __repr__(self):
         return "<False>"
 
+    def _get_key(self):
+        return (False_,)
+
     def __or__(self, other):
         other = other._unpack()
         return other
@@ -119,9 +158,24 @@ class Union(Node):
                 return True
         return False
 
+    def search_index(self, index):
+        result = set()
+        for re in self.res:
+            songs = re.search_index(index)
+            if songs is None:
+                return None
+            result = result | songs
+        return result
+
+    def is_cacheable(self):
+        return all(re.is_cacheable() for re in self.res)
+
     def __repr__(self):
         return "<Union %r>" % self.res
 
+    def _get_key(self):
+        return (Union, tuple(r._get_key() for r in self.res))
+
     def __or__(self, other):
         other = other._unpack()
 
@@ -161,9 +215,38 @@ class Inter(Node):
             current = list(current)
         return current
 
+    def search_index(self, index):
+        result = None
+        rest = []
+        for re in self.res:
+            # once only a few songs are left checking them directly
+            # is faster than going through all values in the index
+            if result is not None and \
+                    len(result) * index.SCAN_RATIO < len(index.songs):
+                rest.append(re)
+                continue
+            songs = re.search_index(index)
+            if songs is None:
+                rest.append(re)
+                continue
+            result = songs if result is None else result & songs
+            if not result:
+                return result
+        if result is None:
+            return None
+        for re in rest:
+            result = set(filter(re.search, result))
+        return result
+
+    def is_cacheable(self):
+        return all(re.is_cacheable() for re in self.res)
+
     def __repr__(self):
         return "<Inter %r>" % self.res
 
+    def _get_key(self):
+        return (Inter, tuple(r._get_key() for r in self.res))
+
     def __and__(self, other):
         other = other._unpack()
 
@@ -191,9 +274,21 @@ class Neg(Node):
     def search(self, data):
         return not self.res.search(data)
 
+    def search_index(self, index):
+        songs = self.res.search_index(index)
+        if songs is None:
+            return None
+        return index.songs - songs
+
+    def is_cacheable(self):
+        return self.res.is_cacheable()
+
     def __repr__(self):
         return "<Neg %r>" % self.res
 
+    def _get_key(self):
+        return (Neg, self.res._get_key())
+
     def __and__(self, other):
         other = other._unpack()
         if isinstance(other, True_):
@@ -237,10 +332,17 @@ class Numcmp(Node):
             return self._op(val, val2)
         return False
 
+    def is_cacheable(self):
+        return self._expr.is_cacheable() and self._expr2.is_cacheable()
+
     def __repr__(self):
         return "<Numcmp expr=%r, op=%r, expr2=%r>" % (
             self._expr, self._op.__name__, self._expr2)
 
+    def _get_key(self):
+        return (Numcmp, self._expr._get_key(), self._op,
+                self._expr2._get_key())
+
     def __and__(self, other):
         other = other._unpack()
         if isinstance(other, True_):
@@ -269,6 +371,19 @@ class Numexpr(object):
         values instead of the number values."""
         return False
 
+    def use_time(self):
+        """Returns whether the value depends on the current time"""
+        return False
+
+    def is_cacheable(self):
+        """See Node.is_cacheable()"""
+        return not self.use_time()
+
+    def _get_key(self):
+        """See Node._get_key()"""
+
+        return (type(self), id(self))
+
 
 class NumexprTag(Numexpr):
     """Numeric tag"""
@@ -300,9 +415,19 @@ class NumexprTag(Numexpr):
     def __repr__(self):
         return "<NumexprTag tag=%r>" % self._tag
 
+    def _get_key(self):
+        return (NumexprTag, self._tag)
+
     def use_date(self):
         return self._tag == 'date'
 
+    def use_time(self):
+        return self._ftag.split(":")[0] in TIME_TAGS
+
+    def is_cacheable(self):
+        tag = self._ftag.split(":")[0]
+        return tag not in TIME_TAGS and tag not in VOLATILE_TAGS
+
 
 class NumexprUnary(Numexpr):
     """Unary numeric operation (like -)"""
@@ -324,9 +449,18 @@ class NumexprUnary(Numexpr):
     def __repr__(self):
         return "<NumexprUnary op=%r expr=%r>" % (self.__op, self.__expr)
 
+    def _get_key(self):
+        return (NumexprUnary, self.__op, self.__expr._get_key())
+
     def use_date(self):
         return self.__expr.use_date()
 
+    def use_time(self):
+        return self.__expr.use_time()
+
+    def is_cacheable(self):
+        return self.__expr.is_cacheable()
+
 
 class NumexprBinary(Numexpr):
     """Binary numeric operation (like + or *)"""
@@ -374,9 +508,19 @@ class NumexprBinary(Numexpr):
         return "<NumexprBinary op=%r expr=%r expr2=%r>" % (
             self.__op, self.__expr, self.__expr2)
 
+    def _get_key(self):
+        return (NumexprBinary, self.__op, self.__expr._get_key(),
+                self.__expr2._get_key())
+
     def use_date(self):
         return self.__expr.use_date() or self.__expr2.use_date()
 
+    def use_time(self):
+        return self.__expr.use_time() or self.__expr2.use_time()
+
+    def is_cacheable(self):
+        return self.__expr.is_cacheable() and self.__expr2.is_cacheable()
+
 
 class NumexprGroup(Numexpr):
     """Parenthesized group in numeric expression"""
@@ -390,9 +534,18 @@ class NumexprGroup(Numexpr):
     def __repr__(self):
         return "<NumexprGroup expr=%r>" % (self.__expr)
 
+    def _get_key(self):
+        return (NumexprGroup, self.__expr._get_key())
+
     def use_date(self):
         return self.__expr.use_date()
 
+    def use_time(self):
+        return self.__expr.use_time()
+
+    def is_cacheable(self):
+        return self.__expr.is_cacheable()
+
 
 class NumexprNumber(Numexpr):
     """Number in numeric expression"""
@@ -406,6 +559,9 @@ class NumexprNumber(Numexpr):
     def __repr__(self):
         return "<NumexprNumber value=%.2f>" % (self._value)
 
+    def _get_key(self):
+        return (NumexprNumber, self._value)
+
 
 class NumexprNow(Numexpr):
     """Current time, with optional offset"""
@@ -419,6 +575,12 @@ class NumexprNow(Numexpr):
     def __repr__(self):
         return "<NumexprNow offset=%r>" % (self.__offset)
 
+    def _get_key(self):
+        return (NumexprNow, self.__offset)
+
+    def use_time(self):
+        return True
+
 
 class NumexprNumberOrDate(Numexpr):
     """An ambiguous value like 2015-09-25 than can be interpreted as either
@@ -443,6 +605,9 @@ class NumexprNumberOrDate(Numexpr):
         return ('<NumexprNumberOrDate number=%r date=%r>' %
             (self.number, self.date))
 
+    def _get_key(self):
+        return (NumexprNumberOrDate, self.number, self.date)
+
 
 def numexprUnit(value, unit):
     """Process numeric units and return NumexprNumber"""
@@ -504,8 +669,8 @@ class Tag(Node):
     def __init__(self, names, res):
         self.res = res
         self._names = []
-        self.__intern = []
-        self.__fs = []
+        self._intern = []
+        self._fs = []
 
         names = [Tag.ABBRS.get(n.lower(), n.lower()) for n in names]
         for name in names:
@@ -513,9 +678,9 @@ class Tag(Node):
                 if name.startswith("~#"):
                     raise ValueError("numeric tags not supported")
                 if name in FILESYSTEM_TAGS:
-                    self.__fs.append(name)
+                    self._fs.append(name)
                 else:
-                    self.__intern.append(name)
+                    self._intern.append(name)
             else:
                 self._names.append(name)
 
@@ -534,20 +699,44 @@ class Tag(Node):
             if search(val):
                 return True
 
-        for name in self.__intern:
+        for name in self._intern:
             if search(data(name)):
                 return True
 
-        for name in self.__fs:
+        for name in self._fs:
             if search(fsn2text(data(name, fs_default))):
                 return True
 
         return False
 
+    def is_cacheable(self):
+        # values which can change without the song changing, plain names
+        # fall back to the internal tag
+        for name in self._names + self._intern:
+            for tag in tagsplit(name):
+                if tag in VOLATILE_TAGS or "~" + tag in VOLATILE_TAGS:
+                    return False
+        return True
+
+    def search_index(self, index):
+        if self._intern or self._fs:
+            return None
+        if not all(map(index.can_index, self._names)):
+            return None
+
+        result = set()
+        for name in self._names:
+            result = result | index.search_tag(name, self.res)
+        return result
+
     def __repr__(self):
-        names = self._names + self.__intern
+        names = self._names + self._intern
         return ("<Tag names=%r, res=%r>" % (names, self.res))
 
+    def _get_key(self):
+        return (Tag, tuple(self._names), tuple(self._intern),
+                tuple(self._fs), self.res._get_key())
+
     def __and__(self, other):
         other = other._unpack()
         if isinstance(other, True_):
@@ -592,6 +781,10 @@ class Extension(Node):
     def search(self, data):
         return self.__valid and self.__plugin.search(data, self.__body)
 
+    def is_cacheable(self):
+        # plugins can depend on anything
+        return False
+
     def __repr__(self):
         return ('<Extension name=%r valid=%r body=%r>'
                 % (self.__name, self.__valid, self.__body))
@@ -611,3 +804,179 @@ class Extension(Node):
             return other.__or__(self)
 
         return Union([self, other])
+
+
+class QueryCompiler(object):
+    """Compiles a query node tree into Python code, so the nodes don't have
+    to be walked for each song (see `PatternCompiler`).
+    """
+
+    _OPERATORS = {
+        operator.lt: "<",
+        operator.le: "<=",
+        operator.gt: ">",
+        operator.ge: ">=",
+        operator.eq: "==",
+        operator.ne: "!=",
+    }
+
+    def __init__(self, root):
+        self.__root = root
+
+    def compile(self):
+        """Returns a (search, filter) tuple of functions which behave like
+        the ones of the root node.
+        """
+
+        lines = []
+        tags = {}
+        consts = {}
+        self.__uses_time = False
+        self.__uses_get = False
+        self.__count = 0
+        expr = self.__node(self.__root, lines, tags, consts)
+        setup = ["t = _time()"] if self.__uses_time else []
+        if self.__uses_get:
+            lines.insert(0, "g = s.get")
+
+        scope = dict((v, k) for k, v in consts.values())
+        scope.update({
+            "_time": time.time,
+            "_fsn2text": fsn2text,
+            "_fs_default": fsnative(),
+        })
+
+        content = ["def search(s):"]
+        content.extend("  " + line for line in setup + lines)
+        content.append("  return %s" % expr)
+        content.extend([
+            "def filter(songs):",
+            "  r = []",
+            "  a = r.append"])
+        content.extend("  " + line for line in setup)
+        content.append("  for s in songs:")
+        content.extend("    " + line for line in lines)
+        content.extend([
+            "    if %s:" % expr,
+            "      a(s)",
+            "  return r"])
+        code = "\n".join(content)
+
+        # compile() is the regex one here
+        exec(code, scope)
+        return scope["search"], scope["filter"]
+
+    def __const(self, consts, obj):
+        # keyed by id, bound methods and most nodes aren't hashable
+        # or compare equal in the wrong way
+        if id(obj) not in consts:
+            consts[id(obj)] = (obj, "c%d" % len(consts))
+        return consts[id(obj)][1]
+
+    def __get_value(self, lines, tags, name):
+        if name not in tags:
+            self.__uses_get = True
+            var = tags[name] = "v%d" % self.__count
+            self.__count += 1
+            lines.append("%s = g(%r)" % (var, name))
+            if name in ("filename", "mountpoint"):
+                fallback = "_fsn2text(g(%r, _fs_default))" % ("~" + name)
+            else:
+                fallback = "g(%r, u'')" % ("~" + name)
+            lines.append("if %s is None: %s = %s" % (var, var, fallback))
+        return tags[name]
+
+    def __value(self, node, var, consts):
+        """Returns an expression matching the text in `var`"""
+
+        node = node._unpack()
+        if isinstance(node, True_):
+            return "True"
+        elif isinstance(node, False_):
+            return "False"
+        elif isinstance(node, (Inter, Union)) and node.res:
+            join = " and " if isinstance(node, Inter) else " or "
+            return "(%s)" % join.join(
+                self.__value(n, var, consts) for n in node.res)
+        elif isinstance(node, Neg):
+            return "(not %s)" % self.__value(node.res, var, consts)
+        return "%s(%s)" % (self.__const(consts, node.search), var)
+
+    def __numexpr(self, expr, use_date, lines, consts):
+        """Returns (expression, can_be_none)"""
+
+        if isinstance(expr, NumexprNumber):
+            return self.__const(consts, expr._value), False
+
+        self.__uses_time = True
+        var = "n%d" % self.__count
+        self.__count += 1
+        if isinstance(expr, NumexprTag) and expr._tag != "date":
+            # the same as NumexprTag.evaluate()
+            lines.append("%s = s(%r, None)" % (var, expr._ftag))
+            value = "t - %s" % var if \
+                expr._ftag.split(":")[0] in TIME_TAGS else var
+            lines.append("if %s is not None: %s = round(%s, 2)" % (
+                var, var, value))
+        else:
+            lines.append("%s = %s(s, t, %r)" % (
+                var, self.__const(consts, expr.evaluate), use_date))
+        return var, True
+
+    def __node(self, node, lines, tags, consts):
+        """Returns an expression matching the song `s`. Statements it
+        depends on get appended to `lines`.
+        """
+
+        node = node._unpack()
+        if isinstance(node, True_):
+            return "True"
+        elif isinstance(node, False_):
+            return "False"
+        elif isinstance(node, (Inter, Union)) and node.res:
+            is_inter = isinstance(node, Inter)
+            expr = self.__node(node.res[0], lines, tags, consts)
+            for child in node.res[1:]:
+                block = []
+                child_expr = self.__node(child, block, dict(tags), consts)
+                if not block:
+                    expr = "%s %s %s" % (
+                        expr, "and" if is_inter else "or", child_expr)
+                    continue
+                # the child needs tag lookups, only do them if its
+                # result is needed
+                var = "b%d" % self.__count
+                self.__count += 1
+                lines.append("%s = %s" % (var, expr))
+                lines.append(("if %s:" if is_inter else "if not %s:") % var)
+                lines.extend("  " + line for line in block)
+                lines.append("  %s = %s" % (var, child_expr))
+                expr = var
+            return "(%s)" % expr
+        elif isinstance(node, Neg):
+            return "(not %s)" % self.__node(node.res, lines, tags, consts)
+        elif isinstance(node, Tag):
+            parts = []
+            for name in node._names:
+                var = self.__get_value(lines, tags, name)
+                parts.append(self.__value(node.res, var, consts))
+            for name in node._intern:
+                parts.append(self.__value(node.res, "s(%r)" % name, consts))
+            for name in node._fs:
+                parts.append(self.__value(
+                    node.res, "_fsn2text(s(%r, _fs_default))" % name, consts))
+            return "(%s)" % (" or ".join(parts) or "False")
+        elif isinstance(node, Numcmp):
+            use_date = node._expr.use_date() or node._expr2.use_date()
+            parts = []
+            values = []
+            for expr in [node._expr, node._expr2]:
+                value, can_be_none = self.__numexpr(
+                    expr, use_date, lines, consts)
+                if can_be_none:
+                    parts.append("%s is not None" % value)
+                values.append(value)
+            parts.append("%s %s %s" % (
+                values[0], self._OPERATORS[node._op], values[1]))
+            return "(%s)" % " and ".join(parts)
+        return "%s(s)" % self.__const(consts, node.search)
@@ -0,0 +1,136 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import random
+import time
+
+from . import _match as match
+
+
+class QueryOptimizer(object):
+    """Reorders the children of Inter and Union nodes so that the ones
+    which are cheap and most likely to decide the result get evaluated
+    first.
+
+    The cost and selectivity (the fraction of songs matching) of each
+    node gets measured on a sample of `songs`, or estimated from the node
+    type if no songs are given.
+    """
+
+    SAMPLE_SIZE = 100
+    """Number of songs to measure nodes with"""
+
+    MIN_SONGS = 2000
+    """Below this sampling costs more than it could save"""
+
+    def __init__(self, songs=None):
+        self._sample = []
+        if songs is not None:
+            songs = list(songs)
+            if len(songs) >= self.MIN_SONGS:
+                self._sample = random.sample(songs, self.SAMPLE_SIZE)
+        # id(node) -> (node, cost, selectivity)
+        self._estimates = {}
+
+    def optimize(self, node):
+        """Returns a new node which matches the same songs as `node`"""
+
+        node = node._unpack()
+        if isinstance(node, (match.Inter, match.Union)) and node.res:
+            is_inter = isinstance(node, match.Inter)
+            res = [self.optimize(n) for n in node.res]
+
+            def rank(n):
+                # cost per song decided, songs filtered out for Inter
+                # and found for Union
+                decided = self._selectivity(n)
+                if is_inter:
+                    decided = 1 - decided
+                return self._cost(n) / max(decided, 1e-6)
+
+            res.sort(key=rank)
+            new = type(node)(res)
+            self._estimate_sequence(new, is_inter)
+            return new
+        elif isinstance(node, match.Neg):
+            new = match.Neg(self.optimize(node.res))
+            self._set_estimate(
+                new, self._cost(new.res), 1 - self._selectivity(new.res))
+            return new
+
+        self._estimate_leaf(node)
+        return node
+
+    def explain(self, node, indent=0):
+        """Returns a text describing `node` (as returned by optimize()) and
+        the estimates for it and its children"""
+
+        node = node._unpack()
+        if id(node) in self._estimates:
+            stats = " (cost %.2fµs, selectivity %.2f)" % (
+                self._cost(node), self._selectivity(node))
+        else:
+            stats = ""
+
+        prefix = "  " * indent
+        if isinstance(node, (match.Inter, match.Union, match.Neg)):
+            res = node.res if isinstance(node.res, list) else [node.res]
+            lines = [prefix + type(node).__name__ + stats]
+            lines.extend(self.explain(n, indent + 1) for n in res)
+            return "\n".join(lines)
+        return prefix + repr(node) + stats
+
+    def _cost(self, node):
+        return self._estimates[id(node)][1]
+
+    def _selectivity(self, node):
+        return self._estimates[id(node)][2]
+
+    def _set_estimate(self, node, cost, selectivity):
+        # keep the node, so its id stays unique
+        self._estimates[id(node)] = (node, cost, selectivity)
+
+    def _estimate_sequence(self, node, is_inter):
+        # assumes the children are independent
+        cost = 0.0
+        remaining = 1.0
+        for n in node.res:
+            cost += remaining * self._cost(n)
+            if is_inter:
+                remaining *= self._selectivity(n)
+            else:
+                remaining *= 1 - self._selectivity(n)
+        selectivity = remaining if is_inter else 1 - remaining
+        self._set_estimate(node, cost, selectivity)
+
+    def _estimate_leaf(self, node):
+        sample = self._sample
+        if not sample:
+            self._set_estimate(node, *_guess(node))
+            return
+
+        search = node.search
+        t = time.perf_counter()
+        matches = sum(1 for song in sample if search(song))
+        elapsed = time.perf_counter() - t
+        # smoothed, one sample shouldn't rule out anything
+        self._set_estimate(
+            node, elapsed * 1e6 / len(sample),
+            (matches + 0.5) / (len(sample) + 1))
+
+
+def _guess(node):
+    """Returns (cost, selectivity) for a node, from its type alone"""
+
+    if isinstance(node, (match.True_, match.False_)):
+        return 0.01, float(isinstance(node, match.True_))
+    elif isinstance(node, match.Numcmp):
+        return 1.0, 0.5
+    elif isinstance(node, match.Tag):
+        cost = 0.5 * len(node._names) + 2.0 * len(node._intern + node._fs)
+        return cost, 0.2
+    elif isinstance(node, match.Extension):
+        return 20.0, 0.5
+    return 1.0, 0.5
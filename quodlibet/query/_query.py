@@ -13,6 +13,7 @@ from quodlibet.util.dprint import frame_info
 from . import _match as match
 from ._match import error, Node, False_
 from ._parser import QueryParser
+from ._optimizer import QueryOptimizer
 from quodlibet.util import re_escape, enum, cached_property
 
 
@@ -37,6 +38,10 @@ class Query(Node):
     string = None
     """The original string which was used to create this query"""
 
+    _plan = None
+    _optimizer = None
+    _measured = False
+
     def __init__(self, string, star=None):
         """Parses the query string and returns a match object.
 
@@ -103,13 +108,54 @@ class Query(Node):
         return "<Query string=%r type=%r star=%r>" % (
             self.string, self.type, self.star)
 
+    def optimize(self, songs=None):
+        """Reorders the parts of the query so that searching is faster.
+
+        If `songs` are given, the parts get measured on a sample of them.
+        Otherwise their cost gets guessed.
+
+        This only happens once (or once more, if songs are given for the
+        first time), so repeated searches use the same order and the same
+        compiled functions.
+        """
+
+        if self._plan is not None and (self._measured or songs is None):
+            return
+
+        self._measured = songs is not None
+        self._optimizer = QueryOptimizer(songs)
+        self._plan = self._optimizer.optimize(self._match)
+        for name in ["_compiled", "search", "filter"]:
+            self.__dict__.pop(name, None)
+
+    def explain(self):
+        """Returns a text describing the order in which the query gets
+        evaluated, with the estimated cost per song and selectivity
+        of each part"""
+
+        if self._plan is None:
+            self.optimize()
+        return self._optimizer.explain(self._plan)
+
+    @cached_property
+    def _compiled(self):
+        if self._plan is None:
+            self.optimize()
+        return match.QueryCompiler(self._plan).compile()
+
     @cached_property
     def search(self):
-        return self._match.search
+        return self._compiled[0]
 
     @cached_property
     def filter(self):
-        return self._match.filter
+        return self._compiled[1]
+
+    def search_index(self, index):
+        return self._match.search_index(index)
+
+    def is_cacheable(self):
+        return self._match.is_cacheable()
 
     @property
     def valid(self):
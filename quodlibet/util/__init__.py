@@ -1096,6 +1096,32 @@ def re_escape(string, BAD="/.^$*+-?{,\\[]|()<>#=!:"):
     return type(string)().join(map(needs_escape, string))
 
 
+def re_literal(pattern, SPECIAL=".^$*+?{[|()"):
+    """Returns the text a regex `pattern` matches if it doesn't contain
+    any special characters except escaped ones (like the output of
+    re_escape()), otherwise None.
+    """
+
+    text = []
+    escaped = False
+    for c in pattern:
+        if escaped:
+            # things like \d or \1
+            if c.isalnum():
+                return None
+            text.append(c)
+            escaped = False
+        elif c == "\\":
+            escaped = True
+        elif c in SPECIAL:
+            return None
+        else:
+            text.append(c)
+    if escaped:
+        return None
+    return u"".join(text)
+
+
 def set_process_title(title):
     """Sets process name as visible in ps or top. Requires ctypes libc
     and is almost certainly *nix-only. See issue 736
@@ -10,8 +10,14 @@
 from __future__ import absolute_import
 
 import os
+import sys
+import math
+import json
 import random
-from typing import List
+import weakref
+from itertools import repeat
+from collections import OrderedDict
+from typing import Any, Dict, List, Set
 
 from senf import fsnative, fsn2bytes, bytes2fsn
 
@@ -72,6 +78,306 @@ NUM_FUNCS = {
 }
 
 
+class _Aggregate(object):
+    """A value computed from the songs of a collection, which gets updated
+    from the songs added and removed instead of looking at all songs again.
+
+    Subclasses define what a song contributes (`_get`) and how to add and
+    subtract contributions (`_add`, `_remove`).
+    """
+
+    def __init__(self, songs):
+        # song -> [contribution, count], songs can appear more than once
+        self._contribs = {}
+        self._value = None
+        self.add(songs)
+
+    def _get(self, song):
+        raise NotImplementedError
+
+    def _add(self, contrib):
+        raise NotImplementedError
+
+    def _remove(self, contrib):
+        raise NotImplementedError
+
+    def _compute(self, *args):
+        raise NotImplementedError
+
+    def add(self, songs):
+        contribs = self._contribs
+        for song in songs:
+            entry = contribs.get(song)
+            if entry is not None:
+                entry[1] += 1
+                contrib = entry[0]
+            else:
+                contrib = self._get(song)
+                contribs[song] = [contrib, 1]
+            self._add(contrib)
+        self._value = None
+
+    def remove(self, songs):
+        contribs = self._contribs
+        for song in songs:
+            entry = contribs[song]
+            entry[1] -= 1
+            if not entry[1]:
+                del contribs[song]
+            self._remove(entry[0])
+        self._value = None
+
+    def change(self, songs):
+        """Update for songs which have changed, returns True if this
+        changed the value"""
+
+        contribs = self._contribs
+        changed = False
+        for song in songs:
+            entry = contribs[song]
+            contrib = self._get(song)
+            if contrib == entry[0]:
+                continue
+            changed = True
+            for i in range(entry[1]):
+                self._remove(entry[0])
+                self._add(contrib)
+            entry[0] = contrib
+        if changed:
+            self._value = None
+        return changed
+
+    def value(self, *args):
+        """Returns the result of `_compute(*args)`, cached until the
+        songs change"""
+
+        if self._value is None:
+            self._value = {}
+        try:
+            return self._value[args]
+        except KeyError:
+            value = self._value[args] = self._compute(*args)
+            return value
+
+
+class _Numbers(_Aggregate):
+    """Numbers of the songs, for the functions in `NUM_FUNCS`"""
+
+    def __init__(self, songs, get_value):
+        self._get_value = get_value
+        # sum of all numbers, None until needed
+        self._total = None
+        # value -> number of songs
+        self._counts = {}
+        super(_Numbers, self).__init__(songs)
+
+    def _get(self, song):
+        value = self._get_value(song)
+        return None if value == "" else value
+
+    def _add(self, value):
+        if value is not None:
+            self._total = None
+            self._counts[value] = self._counts.get(value, 0) + 1
+
+    def _remove(self, value):
+        if value is not None:
+            self._total = None
+            count = self._counts.pop(value) - 1
+            if count:
+                self._counts[value] = count
+
+    def _sum(self):
+        # Adding and subtracting floats one by one would drift and depend
+        # on the order of the songs, fsum() is exact. Ints stay ints.
+        if self._total is None:
+            counts = self._counts
+            if all(isinstance(v, int) for v in counts):
+                self._total = sum(v * n for v, n in counts.items())
+            else:
+                self._total = math.fsum(
+                    x for v, n in counts.items() for x in repeat(v, n))
+        return self._total
+
+    def value(self, func):
+        """Returns the result of the `NUM_FUNCS` function `func` for all
+        numbers, or None if there are none"""
+
+        count = sum(self._counts.values())
+        if not count:
+            return None
+        if func == "sum":
+            return self._sum()
+        elif func == "avg":
+            return float(self._sum()) / count
+        elif func == "bav":
+            m = config.RATINGS.default
+            c = config.getfloat("settings", "bayesian_rating_factor", 0.0)
+            return float(m * c + self._sum()) / (c + count)
+        elif func == "max":
+            return max(self._counts)
+        elif func == "min":
+            return min(self._counts)
+        raise ValueError(func)
+
+
+class _Values(_Aggregate):
+    """All values of a key, ordered by number of appearances"""
+
+    def __init__(self, songs, get_values):
+        self._get_values = get_values
+        # value -> number of appearances
+        self._counts = {}
+        super(_Values, self).__init__(songs)
+
+    def _get(self, song):
+        return tuple(self._get_values(song))
+
+    def _add(self, values):
+        counts = self._counts
+        for value in values:
+            counts[value] = counts.get(value, 0) + 1
+
+    def _remove(self, values):
+        counts = self._counts
+        for value in values:
+            count = counts.pop(value) - 1
+            if count:
+                counts[value] = count
+
+    def __len__(self):
+        return len(self._counts)
+
+    def _compute(self):
+        values = sorted(self._counts.items(), key=lambda x: (-x[1], x[0]))
+        return "\n".join(v for v, n in values) if values else None
+
+
+class _People(_Aggregate):
+    """People and their sort names, ranked by "relevance" -- artists
+    before composers before performers, then by number of appearances.
+    """
+
+    def __init__(self, songs):
+        # name -> score, one for people and one for peoplesort
+        self._scores = ({}, {})
+        super(_People, self).__init__(songs)
+
+    def _get(self, song):
+        people = []
+        peoplesort = []
+        for score, k in zip(PEOPLE_SCORE, ELPOEP):
+            persons = song.list(k)
+            if persons:
+                people.append((score, persons))
+            if k in TAG_TO_SORT:
+                persons = song.list(TAG_TO_SORT[k]) or persons
+            if persons:
+                peoplesort.append((score, persons))
+        return people, peoplesort
+
+    def _add(self, contrib):
+        for scores, entries in zip(self._scores, contrib):
+            for score, persons in entries:
+                for person in persons:
+                    scores[person] = scores.get(person, 0) - score
+
+    def _remove(self, contrib):
+        for scores, entries in zip(self._scores, contrib):
+            for score, persons in entries:
+                for person in persons:
+                    value = scores[person] + score
+                    if value:
+                        scores[person] = value
+                    else:
+                        del scores[person]
+
+    def _compute(self, sort):
+        # ties by name, the order the songs got added in can change
+        scores = self._scores[sort]
+        people = sorted(scores.items(), key=lambda x: (x[1], x[0]))[:100]
+        return "\n".join(p for p, s in people) or None
+
+
+def _sizeof_value(key, value):
+    # value, key and an OrderedDict entry
+    return sys.getsizeof(key) + sys.getsizeof(value) + 100
+
+
+def _sizeof_aggregate(aggregate):
+    # mostly the contribution of each song
+    return 200 + 150 * len(aggregate._contribs)
+
+
+class CollectionCache(object):
+    """Keeps track of the approximate memory used by the cached values of
+    all collections. Once it exceeds `max_size` the caches of the least
+    recently used collections get dropped.
+    """
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        """Maximum number of bytes for all cached values"""
+
+        self.size = 0
+        """Approximate number of bytes used by all cached values"""
+
+        self.hits = 0
+        self.misses = 0
+
+        # id(collection) -> [weakref, size], least recently used first
+        self._entries = OrderedDict()
+
+    def stats(self):
+        """Returns a dict with the current size, the maximum size, the
+        number of collections with a cache and the cache hits/misses"""
+
+        return {
+            "size": self.size,
+            "max_size": self.max_size,
+            "collections": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def used(self, collection, delta=0):
+        """Marks the cache of `collection` as recently used, with `delta`
+        bytes more (or less) than before"""
+
+        entries = self._entries
+        key = id(collection)
+        entry = entries.get(key)
+        if entry is None:
+            ref = weakref.ref(collection, lambda r: self.__collected(key))
+            entry = entries[key] = [ref, 0]
+        else:
+            entries.move_to_end(key)
+        entry[1] += delta
+        self.size += delta
+
+        while self.size > self.max_size and len(entries) > 1:
+            other_key, (ref, size) = next(iter(entries.items()))
+            other = ref()
+            if other is None:
+                self.__collected(other_key)
+            else:
+                other._drop_cache()
+
+    def forget(self, collection):
+        """Removes the cache of `collection` from the accounting"""
+
+        self.__collected(id(collection))
+
+    def __collected(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[1]
+
+
+collection_cache = CollectionCache(32 * 1024 ** 2)
+"""Accounting of the cached values of all collections"""
+
+
 class Collection(object):
     """A collection of songs which implements some methods similar to the
     AudioFile class.
@@ -84,18 +390,62 @@ class Collection(object):
     songs = ()
 
     def __init__(self):
-        """Cache in _cache, LRU key order in _used, keys that return default
-        are in _default"""
-        self.__cache = {}
+        """Cache in _cache and aggregates of song values in _aggregates,
+        both in LRU order (least recently used first), keys that return
+        default are in _default. The size of all is in _cache_bytes."""
+        self.__cache = OrderedDict()
         self.__default = set()
-        self.__used = []
+        self.__aggregates = OrderedDict()
+        self.__cache_bytes = 0
+
+    def _drop_cache(self):
+        self.__cache.clear()
+        self.__default.clear()
+        self.__aggregates.clear()
+        self.__cache_bytes = 0
+        collection_cache.forget(self)
 
     def finalize(self):
         """Finalize the collection.
         Call this after songs get added or removed"""
+        self._drop_cache()
+
+    def update(self, added=(), removed=(), changed=()):
+        """Like `finalize`, but updates cached values from the songs
+        which got added or removed, or have changed tags, instead of
+        looking at all songs again."""
+
+        size = 0
+        for aggregate in self.__aggregates.values():
+            aggregate.remove(removed)
+            aggregate.change(changed)
+            aggregate.add(added)
+            size += _sizeof_aggregate(aggregate)
+
         self.__cache.clear()
         self.__default.clear()
-        self.__used = []
+        if self.__aggregates:
+            self.__resize(size - self.__cache_bytes)
+        else:
+            self._drop_cache()
+
+    def __resize(self, delta):
+        self.__cache_bytes += delta
+        collection_cache.used(self, delta)
+
+    def __get_aggregate(self, key, type_, *args):
+        aggregates = self.__aggregates
+        aggregate = aggregates.get(key)
+        if aggregate is not None:
+            aggregates.move_to_end(key)
+            return aggregate
+
+        aggregate = aggregates[key] = type_(self.songs, *args)
+        delta = _sizeof_aggregate(aggregate)
+        if len(aggregates) > self._cache_size:
+            delta -= _sizeof_aggregate(aggregates.popitem(last=False)[1])
+        self.__resize(delta)
+        return aggregate
 
     def get(self, key, default=u"", connector=u" - "):
         if not self.songs:
@@ -137,22 +487,27 @@ class Collection(object):
         return [] if v == "" else str(v).split("\n")
 
     def __get_cached_value(self, key):
-        if key in self.__cache:
-            self.__used.remove(key)
-            self.__used.insert(0, key)
-            return self.__cache[key]
+        cache = self.__cache
+        if key in cache:
+            cache.move_to_end(key)
+            collection_cache.hits += 1
+            return cache[key]
         elif key in self.__default:
+            collection_cache.hits += 1
             return None
+
+        collection_cache.misses += 1
+        val = self.__get_value(key)
+        if val is None:
+            self.__default.add(key)
+            self.__resize(_sizeof_value(key, val))
         else:
-            val = self.__get_value(key)
-            if val is None:
-                self.__default.add(key)
-            else:
-                self.__used.insert(0, key)
-                self.__cache[key] = val
+            cache[key] = val
+            delta = _sizeof_value(key, val)
             # Remove the oldest if the cache is full
-            if len(self.__used) > self._cache_size:
-                self.__cache.pop(self.__used.pop(-1))
+            if len(cache) > self._cache_size:
+                delta -= _sizeof_value(*cache.popitem(last=False))
+            self.__resize(delta)
         return val
 
     def __get_value(self, key):
@@ -172,13 +527,16 @@ class Collection(object):
             elif key == "tracks":
                 return len(self.songs)
             elif key == "discs":
-                return len({song("~#disc", 1) for song in self.songs})
+                return len(self.__get_aggregate(
+                    "~#discs", _Values, lambda s: [s("~#disc", 1)]))
             elif key == "bitrate":
                 length = self.__get_value("~#length")
                 if not length:
                     return 0
-                w = lambda s: s("~#bitrate", 0) * s("~#length", 0)
-                return sum(w(song) for song in self.songs) / length
+                w = self.__get_aggregate(
+                    "~#bitrate", _Numbers,
+                    lambda s: s("~#bitrate", 0) * s("~#length", 0))
+                return w.value("sum") / length
             else:
                 # Standard or unknown numeric key.
                 # AudioFile will try to cast the values to int,
@@ -186,55 +544,21 @@ class Collection(object):
                 func = NUM_DEFAULT_FUNCS.get(key, "avg")
 
             key = "~#" + key
-            func = NUM_FUNCS.get(func)
-            if func:
+            if func in NUM_FUNCS:
                 # If none of the songs can return a numeric key,
                 # the album returns default
-                values = (song(key) for song in self.songs)
-                values = [v for v in values if v != ""]
-                return func(values) if values else None
+                return self.__get_aggregate(
+                    key, _Numbers, lambda s: s(key)).value(func)
             elif key in NUMERIC_ZERO_DEFAULT:
                 return 0
             return None
         elif key[:1] == "~":
             key = key[1:]
             numkey = key.split(":")[0]
-            keys = {"people": {}, "peoplesort": {}}
-            if key in keys:
-                people = keys["people"]
-                peoplesort = keys["peoplesort"]
-                for song in self.songs:
-                    # Rank people by "relevance" -- artists before composers
-                    # before performers, then by number of appearances.
-                    for w, k in enumerate(ELPOEP):
-                        persons = song.list(k)
-                        for person in persons:
-                            people[person] = (people.get(person, 0) -
-                                              PEOPLE_SCORE[w])
-                        if k in TAG_TO_SORT:
-                            persons = song.list(TAG_TO_SORT[k]) or persons
-                        for person in persons:
-                            peoplesort[person] = (peoplesort.get(person, 0) -
-                                                  PEOPLE_SCORE[w])
+            if key in ("people", "peoplesort"):
                 # It's cheaper to get people and peoplesort in one go
-                keys["people"] = sorted(people.keys(),
-                                        key=people.__getitem__)[:100]
-                keys["peoplesort"] = sorted(peoplesort.keys(),
-                                            key=peoplesort.__getitem__)[:100]
-
-                ret = keys.pop(key)
-                ret = (ret and "\n".join(ret)) or None
-
-                other, values = keys.popitem()
-                other = "~" + other
-                if not values:
-                    self.__default.add(other)
-                else:
-                    if other in self.__used:
-                        self.__used.remove(other)
-                    self.__used.append(other)
-                    self.__cache[other] = "\n".join(values)
-                return ret
+                people = self.__get_aggregate("~people", _People)
+                return people.value(key == "peoplesort")
             elif numkey == "length":
                 length = self.__get_value("~#" + key)
                 return None if length is None else util.format_time(length)
@@ -265,14 +589,8 @@ class Collection(object):
 
         # Nothing special was found, so just take all values of the songs
         # and sort them by their number of appearance
-        result = {}
-        for song in self.songs:
-            for value in song.list(key):
-                result[value] = result.get(value, 0) - 1
-
-        values = list(map(lambda x: x[0],
-                          sorted(result.items(), key=lambda x: (x[1], x[0]))))
-        return "\n".join(values) if values else None
+        values = self.__get_aggregate(key, _Values, lambda s: s.list(key))
+        return values.value()
 
 
 class Album(Collection):
@@ -312,10 +630,67 @@ class Album(Collection):
         self.__dict__.pop("peoplesort", None)
         self.__dict__.pop("genre", None)
 
+    def update(self, added=(), removed=(), changed=()):
+        super(Album, self).update(added, removed, changed)
+        self.__dict__.pop("peoplesort", None)
+        self.__dict__.pop("genre", None)
+
     def __repr__(self):
         return "Album(%s)" % repr(self.key)
 
 
+class _PlaylistItems(HashedList):
+    """The items of a playlist. Keeps the index of which playlists
+    contain an item up to date and marks the playlist as changed."""
+
+    def __init__(self, playlist, featuring):
+        super(_PlaylistItems, self).__init__()
+        self._playlist = playlist
+        # item -> {playlists}
+        self._featuring = featuring
+
+    def __setitem__(self, index, item):
+        if isinstance(index, slice):
+            item = list(item)
+            old = self._data[index]
+            super(_PlaylistItems, self).__setitem__(index, item)
+            self._update(old, item)
+        else:
+            old = self._data[index]
+            super(_PlaylistItems, self).__setitem__(index, item)
+            self._update([old], [item])
+
+    def __delitem__(self, index):
+        old = self._data[index]
+        if not isinstance(index, slice):
+            old = [old]
+        super(_PlaylistItems, self).__delitem__(index)
+        self._update(old, [])
+
+    def insert(self, index, item):
+        super(_PlaylistItems, self).insert(index, item)
+        self._update([], [item])
+
+    def _update(self, removed, added):
+        playlist = self._playlist
+        playlist._dirty = True
+
+        featuring = self._featuring
+        for item in removed:
+            if item not in self._map:
+                playlists = featuring.get(item)
+                if playlists is not None:
+                    playlists.discard(playlist)
+                    if not playlists:
+                        del featuring[item]
+        for item in added:
+            playlists = featuring.get(item)
+            if playlists is None:
+                featuring[item] = {playlist}
+            else:
+                playlists.add(playlist)
+
+
 @hashable
 @total_ordering
 class Playlist(Collection, Iterable):
@@ -324,16 +699,29 @@ class Playlist(Collection, Iterable):
     """
 
     __instances: "List[Playlist]" = []
+    # song or filename -> {playlists containing it}
+    __featuring: "Dict[Any, Set[Playlist]]" = {}
+    # playlists which haven't read their songs yet, see load()
+    _unloaded: "Set[Playlist]" = set()
 
     @classmethod
-    def playlists_featuring(cls, song):
-        """Returns the list of playlists in which this song appears"""
+    def playlists_featuring(cls, song, load=True):
+        """Returns the list of playlists in which this song appears,
+        sorted by name.
+
+        If `load` is False playlists which haven't read their songs yet
+        are left out.
+        """
 
-        playlists = []
-        for instance in cls.__instances:
-            if song in instance._list:
-                playlists.append(instance)
-        return playlists
+        if load:
+            for playlist in list(Playlist._unloaded):
+                playlist.load()
+        return sorted(cls.__featuring.get(song, ()))
+
+    def load(self):
+        """Reads the songs in case that was deferred"""
+
+        pass
 
     def get(self, key, default=u"", connector=u" - "):
         if key == "~name":
@@ -393,7 +781,9 @@ class Playlist(Collection, Iterable):
 
         self.name = name
         self.library = library
-        self._list = HashedList()
+        self._list = _PlaylistItems(self, self.__featuring)
+        # if the songs have changed since the last write()
+        self._dirty = True
 
     @classmethod
     def suggested_name_for(cls, songs):
@@ -536,12 +926,26 @@ class Playlist(Collection, Iterable):
 
 
 class FileBackedPlaylist(Playlist):
-    """A `Playlist` that is stored as a file on disk"""
+    """A `Playlist` that is stored as a file on disk.
+
+    Next to the file a summary (the number of tracks, length and size)
+    gets stored, so lazy playlists can show those without reading the
+    file.
+    """
 
     quote = staticmethod(escape_filename)
     unquote = staticmethod(unescape_filename)
 
-    def __init__(self, dir, name, library=None, validate=False):
+    SUMMARY_SUFFIX = fsnative(u"#summary")
+    """Appended to the file name for the summary file. Escaped playlist
+    names can't contain '#', so it can't clash with a playlist."""
+
+    _SUMMARY_KEYS = ["~#tracks", "~#length", "~#filesize"]
+
+    def __init__(self, dir, name, library=None, validate=False, lazy=False):
+        """If `lazy` is True and the summary is up to date the songs only
+        get read once they are needed."""
+
         assert isinstance(dir, fsnative)
         super(FileBackedPlaylist, self).__init__(name, library)
 
@@ -549,12 +953,133 @@ class FileBackedPlaylist(Playlist):
         if validate:
             self.name = self._validated_name(name)
         self._last_fn = self.filename
+        self.__summary = None
+        if self.__read_summary() and lazy:
+            # _list gets restored by load() on first access
+            self.__items = self._list
+            del self._list
+            self._dirty = False
+            self._unloaded.add(self)
+        else:
+            self.__populate_from_file()
+
+    @classmethod
+    def is_summary_file(cls, filename):
+        return filename.endswith(cls.SUMMARY_SUFFIX)
+
+    @property
+    def loaded(self):
+        """If the songs have been read"""
+
+        return "_list" in self.__dict__
+
+    def __getattr__(self, name):
+        # only called for missing attributes, so free once loaded
+        if name == "_list":
+            self.load()
+            return self._list
+        raise AttributeError(name)
+
+    def load(self):
+        if self.loaded:
+            return
+
+        print_d("Loading playlist %r" % self.name)
+        self._list = self.__items
+        del self.__items
+        self._unloaded.discard(self)
         self.__populate_from_file()
 
+    def get(self, key, default=u"", connector=u" - "):
+        if not self.loaded:
+            found, value = self.__get_summary_value(key)
+            if found:
+                return default if value is None else value
+        return super(FileBackedPlaylist, self).get(key, default, connector)
+
+    __call__ = get
+
+    def __get_summary_value(self, key):
+        """Returns a (found, value) tuple for keys which can be answered
+        from the summary"""
+
+        summary = self.__summary
+        if not summary["~#tracks"]:
+            if key in self._SUMMARY_KEYS or \
+                    key in ("~tracks", "~length", "~long-length",
+                            "~filesize"):
+                return True, None
+            return False, None
+
+        if key in self._SUMMARY_KEYS:
+            return True, summary[key]
+        elif key == "~tracks":
+            tracks = summary["~#tracks"]
+            return True, ngettext("%d track", "%d tracks", tracks) % tracks
+        elif key in ("~length", "~long-length", "~filesize"):
+            if key == "~filesize":
+                value = summary["~#filesize"]
+                format_ = util.format_size
+            else:
+                value = summary["~#length"]
+                format_ = (util.format_time if key == "~length"
+                           else util.format_time_long)
+            return True, (None if value is None else format_(value))
+        return False, None
+
+    @property
+    def _summary_filename(self):
+        return self.filename + self.SUMMARY_SUFFIX
+
+    def __get_summary(self):
+        songs = self.songs
+        summary = {"~#tracks": len(songs)}
+        for key in self._SUMMARY_KEYS[1:]:
+            summary[key] = (
+                super(FileBackedPlaylist, self).get(key, None)
+                if songs else None)
+        return summary
+
+    def __read_summary(self):
+        """Returns True if an up to date summary could be read"""
+
+        try:
+            with open(self._summary_filename, "r", encoding="utf-8") as h:
+                summary = json.load(h)
+            stat = os.stat(self.filename)
+        except (EnvironmentError, ValueError):
+            return False
+
+        try:
+            if [summary["mtime"], summary["size"]] != \
+                    [stat.st_mtime, stat.st_size]:
+                return False
+            self.__summary = {k: summary[k] for k in self._SUMMARY_KEYS}
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __write_summary(self, force=False):
+        """Writes the summary in case it changed or `force` is True"""
+
+        summary = self.__get_summary()
+        if summary == self.__summary and not force:
+            return
+        self.__summary = summary
+
+        try:
+            stat = os.stat(self.filename)
+            data = dict(summary, mtime=stat.st_mtime, size=stat.st_size)
+            with open(self._summary_filename, "w", encoding="utf-8") as h:
+                json.dump(data, h)
+        except EnvironmentError as e:
+            print_d("Couldn't write playlist summary: %s" % e)
+
     def __populate_from_file(self):
         library = self.library
         try:
-            with open(self.filename, "rb") as h:
+            # not renamed yet in case it got loaded by a rename
+            with open(self._last_fn, "rb") as h:
                 for line in h:
                     assert library is not None
                     try:
@@ -571,6 +1096,10 @@ class FileBackedPlaylist(Playlist):
                 util.print_d(
                     "Playlist '%s' not found, creating new." % self.name)
                 self.write()
+        else:
+            self._dirty = False
+            # the tags of the songs might have changed since
+            self.__write_summary()
 
     @classmethod
     def new(cls, dir_, base=_("New Playlist"), library=None):
@@ -612,6 +1141,9 @@ class FileBackedPlaylist(Playlist):
     def delete(self):
         super(FileBackedPlaylist, self).delete()
         self.__delete_file(self.filename)
+        self.__delete_file(self._summary_filename)
+        # nothing left to write
+        self._dirty = False
 
     @classmethod
     def __delete_file(cls, fn):
@@ -621,13 +1153,22 @@ class FileBackedPlaylist(Playlist):
             pass
 
     def write(self):
+        """Writes the playlist to its file if the songs have changed since
+        the last write or the name has changed"""
+
         fn = self.filename
+        if not self._dirty and self._last_fn == fn:
+            return
+
         with open(fn, "wb") as f:
             for song in self._list:
                 if isinstance(song, str):
                     f.write(fsn2bytes(song, "utf-8") + b"\n")
                 else:
                     f.write(fsn2bytes(song("~filename"), "utf-8") + b"\n")
+        self._dirty = False
+        self.__write_summary(force=True)
         if self._last_fn != fn:
             self.__delete_file(self._last_fn)
+            self.__delete_file(self._last_fn + self.SUMMARY_SUFFIX)
             self._last_fn = fn
@@ -11,6 +11,8 @@ import glob
 import os.path
 import re
 import sre_constants
+import threading
+from collections import OrderedDict
 
 from senf import fsn2text
 
@@ -51,6 +53,82 @@ class EmbeddedCover(CoverSourcePlugin):
             return image.file if image else None
 
 
+class _Directory(object):
+    """The possible cover images in a directory and its cover subdirs"""
+
+    def __init__(self, subdirs, mtimes, candidates):
+        self.subdirs = subdirs
+        self.mtimes = mtimes
+        # [(subdir or None, filename, lower case text, score)]
+        self.candidates = candidates
+        # the scoring of a song -> [(score, path)]
+        self.images = {}
+
+
+class _DirectoryCache(object):
+    """Remembers the cover candidates of directories, as long as their
+    modification times stay the same"""
+
+    MAX_ENTRIES = 2000
+
+    def __init__(self):
+        # path -> _Directory, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, path, list_func):
+        """Returns the _Directory for `path`. If not known or changed
+        `list_func(path)` gets called to create it.
+
+        The file system only gets looked at without holding the lock, so
+        two threads might list the same directory at the same time.
+        """
+
+        with self._lock:
+            entry = self._entries.get(path)
+
+        if entry is not None and \
+                _get_mtimes(path, entry.subdirs) == entry.mtimes:
+            with self._lock:
+                if path in self._entries:
+                    self._entries.move_to_end(path)
+                self.hits += 1
+            return entry
+
+        entry = list_func(path)
+        with self._lock:
+            self.misses += 1
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            if len(self._entries) > self.MAX_ENTRIES:
+                self._entries.popitem(last=False)
+        return entry
+
+    def invalidate(self, paths):
+        """Forget the directories in `paths`"""
+
+        with self._lock:
+            for path in paths:
+                self._entries.pop(path, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def _get_mtimes(path, subdirs):
+    mtimes = []
+    for sub in [None] + subdirs:
+        try:
+            mtimes.append(os.stat(
+                path if sub is None else os.path.join(path, sub)).st_mtime_ns)
+        except EnvironmentError:
+            mtimes.append(None)
+    return mtimes
+
+
 class FilesystemCover(CoverSourcePlugin):
     PLUGIN_ID = "filesystem-cover"
     PLUGIN_NAME = _("Filesystem cover")
@@ -69,11 +147,66 @@ class FilesystemCover(CoverSourcePlugin):
     cover_negative_regexes = frozenset(
         [re.compile(r'(\b|_|)' + s + r'(\b|_)') for s in cover_negative_words])
 
+    _cache = _DirectoryCache()
+
     @classmethod
     def group_by(cls, song):
         # in the common case this means we only search once per album
         return song('~dirname'), song.album_key
 
+    @classmethod
+    def cover_changed(cls, songs):
+        """Forget what is known about the directories of `songs`"""
+
+        cls._cache.invalidate(
+            {song('~dirname') for song in songs if song.is_file})
+
+    @classmethod
+    def _list_directory(cls, base):
+        # before listing, so changes in between get noticed next time
+        mtimes = _get_mtimes(base, [])
+
+        entries = []
+        try:
+            entries = os.listdir(base)
+        except EnvironmentError:
+            print_w("Can't list album art directory %s" % base)
+
+        fns = []
+        subdirs = []
+        for entry in entries:
+            lentry = entry.lower()
+            if get_ext(lentry) in cls.cover_exts:
+                fns.append((None, entry))
+            if lentry in cls.cover_subdirs:
+                subdirs.append(entry)
+                subdir = os.path.join(base, entry)
+                mtimes.extend(_get_mtimes(subdir, []))
+                sub_entries = []
+                try:
+                    sub_entries = os.listdir(subdir)
+                except EnvironmentError:
+                    pass
+                for sub_entry in sub_entries:
+                    lsub_entry = sub_entry.lower()
+                    if get_ext(lsub_entry) in cls.cover_exts:
+                        fns.append((entry, sub_entry))
+
+        candidates = []
+        for sub, fn in fns:
+            dec_lfn = fsn2text(fn).lower()
+
+            # Generic keywords
+            score = 3 * sum(r.search(dec_lfn) is not None
+                            for r in cls.cover_positive_regexes)
+
+            score -= 2 * sum(r.search(dec_lfn) is not None
+                             for r in cls.cover_negative_regexes)
+
+            candidates.append((sub, fn, dec_lfn, score))
+
+        return _Directory(subdirs, mtimes, candidates)
+
     @property
     def name(self):
         return "Filesystem"
@@ -116,60 +249,37 @@ class FilesystemCover(CoverSourcePlugin):
                 # So names and patterns at the start are preferred
                 score -= 1
 
+            images.sort(reverse=True)
+
         if not images:
-            entries = []
-            try:
-                entries = os.listdir(base)
-            except EnvironmentError:
-                print_w("Can't list album art directory %s" % base)
-
-            fns = []
-            for entry in entries:
-                lentry = entry.lower()
-                if get_ext(lentry) in self.cover_exts:
-                    fns.append((None, entry))
-                if lentry in self.cover_subdirs:
-                    subdir = os.path.join(base, entry)
-                    sub_entries = []
-                    try:
-                        sub_entries = os.listdir(subdir)
-                    except EnvironmentError:
-                        pass
-                    for sub_entry in sub_entries:
-                        lsub_entry = sub_entry.lower()
-                        if get_ext(lsub_entry) in self.cover_exts:
-                            fns.append((entry, sub_entry))
-
-            for sub, fn in fns:
-                dec_lfn = fsn2text(fn).lower()
-
-                score = 0
-                # check for the album label number
-                labelid = self.song.get("labelid", "").lower()
-                if labelid and labelid in dec_lfn:
-                    score += 20
-
-                # Track-related keywords
-                values = self.song.list("~people") + [self.song("album")]
-                lowers = [value.lower().strip() for value in values
-                          if len(value) > 1]
-                score += 2 * sum([value in dec_lfn for value in lowers])
-
-                # Generic keywords
-                score += 3 * sum(r.search(dec_lfn) is not None
-                                 for r in self.cover_positive_regexes)
-
-                score -= 2 * sum(r.search(dec_lfn) is not None
-                                 for r in self.cover_negative_regexes)
-
-                # print("[%s - %s]: Album art \"%s\" scores %d." %
-                #         (self.song("artist"), self.song("title"), fn, score))
-                if score > 0:
-                    if sub is not None:
-                        fn = os.path.join(sub, fn)
-                    images.append((score, os.path.join(base, fn)))
-
-        images.sort(reverse=True)
+            directory = self._cache.get(base, self._list_directory)
+
+            # check for the album label number
+            labelid = self.song.get("labelid", "").lower()
+
+            # Track-related keywords
+            values = self.song.list("~people") + [self.song("album")]
+            lowers = tuple(value.lower().strip() for value in values
+                           if len(value) > 1)
+
+            # everything the score depends on, so songs of the same album
+            # only get scored once
+            key = (self.song.album_key, labelid, lowers)
+            images = directory.images.get(key)
+            if images is None:
+                images = []
+                for sub, fn, dec_lfn, score in directory.candidates:
+                    if labelid and labelid in dec_lfn:
+                        score += 20
+                    score += 2 * sum([value in dec_lfn for value in lowers])
+
+                    if score > 0:
+                        if sub is not None:
+                            fn = os.path.join(sub, fn)
+                        images.append((score, os.path.join(base, fn)))
+                images.sort(reverse=True)
+                directory.images[key] = images
+
         for score, path in images:
             # could be a directory
             if not os.path.isfile(path):
@@ -8,16 +8,18 @@
 
 from itertools import chain
 
-from gi.repository import GObject
+from gi.repository import GObject, GLib
 
 from quodlibet import _
 from quodlibet.formats import AudioFile
 from quodlibet.plugins import PluginManager, PluginHandler
 from quodlibet.qltk.notif import Task
 from quodlibet.util.cover import built_in
-from quodlibet.util import print_d
-from quodlibet.util.thread import call_async
-from quodlibet.util.thumbnails import get_thumbnail_from_file
+from quodlibet.util import print_d, print_exc
+from quodlibet.util.thread import call_async, map_parallel, \
+    lower_thread_priority
+from quodlibet.util.thumbnails import get_thumbnail_from_file, \
+    ensure_thumbnail, ThumbSize
 from quodlibet.plugins.cover import CoverSourcePlugin
 
 
@@ -90,6 +92,7 @@ class CoverManager(GObject.Object):
         to re-fetch the cover and do a display update.
         """
 
+        built_in.FilesystemCover.cover_changed(songs)
         self.emit("cover-changed", songs)
 
     def acquire_cover(self, callback, cancellable, song):
@@ -219,6 +222,52 @@ class CoverManager(GObject.Object):
         call_async(get_thumbnail_from_file, cancel, callback,
                    args=(fileobj, (width, height)))
 
+    def warm_thumbnails(self, albums, sizes=(ThumbSize.NORMAL,
+                        ThumbSize.LARGE), workers=2, cofuncid=None):
+        """Creates the thumbnails of the covers of `albums` which are missing
+        or outdated in the thumbnail cache, so they are ready once shown.
+
+        The covers get looked up in the main loop, as the cover sources
+        aren't thread-safe, and the thumbnails created in `workers` threads
+        with low priority. A generator meant to run in a copool, with
+        `cofuncid` the progress task can pause and stop it.
+        """
+
+        albums = list(albums)
+        # only a few get looked up before each step, see map_parallel()
+        args = ((self.get_cover_many(album.songs), sizes) for album in albums)
+        done = created = 0
+        with Task(_("Cover Art"), _("Creating thumbnails")) as task:
+            if cofuncid:
+                task.copool(cofuncid)
+            for results in map_parallel(self._warm_thumbnails, args, workers):
+                for a, count in results:
+                    created += count
+                done += len(results)
+                task.update(float(done) / len(albums))
+                yield
+        print_d("Created %d thumbnails for %d albums" % (created, done))
+
+    def _warm_thumbnails(self, fileobj, sizes):
+        lower_thread_priority()
+
+        if fileobj is None:
+            return 0
+
+        created = 0
+        with fileobj:
+            for size in sizes:
+                try:
+                    created += ensure_thumbnail(fileobj.name, (size, size))
+                except (GLib.GError, EnvironmentError) as e:
+                    print_d("Couldn't create thumbnail: %s" % e)
+                    break
+                except Exception:
+                    # don't stop the others because of one broken file
+                    print_exc()
+                    break
+        return created
+
     def search_cover(self, cancellable, songs):
         """Search for all the covers applicable to `songs` across all providers
         Every successful image result emits a 'covers-found' signal
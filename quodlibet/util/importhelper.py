@@ -12,6 +12,7 @@ import importlib
 from os.path import join, splitext, basename
 
 from quodlibet import util
+from quodlibet.util.tracing import trace
 
 
 def load_dir_modules(path, package):
@@ -101,7 +102,8 @@ def load_module(name, package, path):
         spec = importlib.machinery.ModuleSpec(package, None, is_package=True)
         sys.modules[package] = importlib.util.module_from_spec(spec)
 
-    mod = loader.load_module(fullname)
+    with trace(fullname, "import"):
+        mod = loader.load_module(fullname)
 
     # make it accessible from the parent, like __import__ does
     vars(sys.modules[package])[name] = mod
@@ -109,8 +109,9 @@ def scan_library(library, force):
 
     paths = get_scan_dirs()
     exclude = get_exclude_dirs()
+    workers = config.getint("library", "scan_workers")
     copool.add(library.rebuild, paths, force, exclude,
-               cofuncid="library", funcid="library")
+               cofuncid="library", funcid="library", workers=workers)
 
 
 def emit_signal(songs, signal="changed", block_size=50, name=None,
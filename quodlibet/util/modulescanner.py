@@ -58,8 +58,10 @@ class ModuleScanner(object):
     as key.
 
     rescan() - Update the module list. Returns added/removed module names
+    load() - Import a module which was deferred by rescan()
     failures - A dict of Name: (Exception, Text) for all modules that failed
     modules - A dict of Name: Module for all successfully loaded modules
+              (or deferred ones, for which `Module.module` is None)
 
     """
     def __init__(self, folders):
@@ -79,11 +81,15 @@ class ModuleScanner(object):
 
         return self.__modules
 
-    def rescan(self):
+    def rescan(self, defer=None):
         """Rescan all folders for changed/new/removed modules.
 
         The caller should release all references to removed modules.
 
+        `defer` gets called with the name and the dependency paths of each
+        new module and if it returns True the module doesn't get imported
+        until load() is called.
+
         Returns a tuple: (removed, added)
         """
 
@@ -125,17 +131,13 @@ class ModuleScanner(object):
             if name in self.__modules:
                 continue
 
+            if defer is not None and defer(name, deps):
+                added.append(name)
+                self.__modules[name] = Module(name, None, deps, path)
+                continue
+
             try:
-                # add a real module, so that pickle works
-                # https://github.com/quodlibet/quodlibet/issues/1093
-                parent = "quodlibet.fake"
-                if parent not in sys.modules:
-                    spec = importlib.machinery.ModuleSpec(
-                        parent, None, is_package=True)
-                    sys.modules[parent] = importlib.util.module_from_spec(spec)
-                vars(sys.modules["quodlibet"])["fake"] = sys.modules[parent]
-
-                mod = load_module(name, parent + ".plugins", dirname(path))
+                mod = self.__import(name, path)
                 if mod is None:
                     continue
             except Exception as err:
@@ -149,3 +151,31 @@ class ModuleScanner(object):
                 (len(added), len(removed), len(self.__failures)))
 
         return removed, added
+
+    def load(self, name):
+        """Imports the module `name` in case its import was deferred.
+
+        Returns the python module or None if importing failed (see
+        `failures`).
+        """
+
+        module = self.__modules[name]
+        if module.module is None and name not in self.__failures:
+            try:
+                module.module = self.__import(name, module.path)
+            except Exception as err:
+                text = format_exception(*sys.exc_info())
+                self.__failures[name] = ModuleImportError(name, err, text)
+        return module.module
+
+    def __import(self, name, path):
+        # add a real module, so that pickle works
+        # https://github.com/quodlibet/quodlibet/issues/1093
+        parent = "quodlibet.fake"
+        if parent not in sys.modules:
+            spec = importlib.machinery.ModuleSpec(
+                parent, None, is_package=True)
+            sys.modules[parent] = importlib.util.module_from_spec(spec)
+        vars(sys.modules["quodlibet"])["fake"] = sys.modules[parent]
+
+        return load_module(name, parent + ".plugins", dirname(path))
@@ -7,9 +7,13 @@
 
 """Utils for executing things in a thread controlled from the main loop"""
 
+import os
+import sys
+import threading
 from multiprocessing import cpu_count
 try:
-    from concurrent.futures import ThreadPoolExecutor
+    from concurrent.futures import ThreadPoolExecutor, wait, \
+        FIRST_COMPLETED
 except ImportError as e:
     raise ImportError("python-futures is missing: %r" % e)
 
@@ -147,3 +151,61 @@ def call_async_background(function, cancellable, callback, args=None,
 
     _call_async(Priority.BACKGROUND, function, cancellable, callback,
                 args, kwargs)
+
+
+def map_parallel(function, args, workers):
+    """Calls `function(*a)` for each `a` in `args` using `workers` threads.
+
+    Yields lists of (a, result) tuples for the calls which finished since
+    the last step, or an empty list after a short wait, so the caller can
+    return to the main loop in between.
+
+    Only a few calls per worker get queued at a time, so not iterating
+    (pausing) also pauses the workers, and closing the generator
+    (stopping) drops everything not started yet.
+    """
+
+    executor = ThreadPoolExecutor(workers)
+    args = iter(args)
+    pending = {}
+    try:
+        while True:
+            for a in args:
+                pending[executor.submit(function, *a)] = a
+                if len(pending) >= workers * 4:
+                    break
+            if not pending:
+                break
+            done = wait(pending, timeout=0.015,
+                        return_when=FIRST_COMPLETED)[0]
+            yield [(pending.pop(f), f.result()) for f in done]
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+
+
+_lowered = threading.local()
+
+
+def lower_thread_priority():
+    """Gives the calling thread the lowest CPU priority, which with the
+    default best-effort scheduling class also gives it the lowest I/O
+    priority.
+
+    Only supported on Linux (where the nice value is per thread), does
+    nothing otherwise or if already lowered.
+    """
+
+    if getattr(_lowered, "done", False):
+        return
+    _lowered.done = True
+
+    get_native_id = getattr(threading, "get_native_id", None)
+    if not sys.platform.startswith("linux") or get_native_id is None:
+        return
+
+    try:
+        os.setpriority(os.PRIO_PROCESS, get_native_id(), 19)
+    except OSError:
+        pass
@@ -69,6 +69,44 @@ def get_cache_info(path, boundary):
     return (thumb_path, thumb_size)
 
 
+def has_fresh_thumbnail(path, boundary):
+    """If the thumbnail cache has a thumbnail for the image at `path`
+    which was created after the image last changed.
+
+    Only looks at the modification times, the thumbnail doesn't get loaded.
+    """
+
+    assert isinstance(path, fsnative)
+
+    path_mtime = mtime(path)
+    if path_mtime == 0:
+        return False
+    thumb_path = get_cache_info(path, boundary)[0]
+    return mtime(thumb_path) >= path_mtime
+
+
+def ensure_thumbnail(path, boundary):
+    """Creates the thumbnail for the image at `path` in the thumbnail cache
+    unless it exists already and is up to date.
+
+    Returns True if a thumbnail got written.
+    Can raise GLib.GError and EnvironmentError. Thread-safe.
+    """
+
+    assert isinstance(path, fsnative)
+
+    # no thumbnails get created for those, see get_thumbnail()
+    width, height = boundary
+    if width > ThumbSize.LARGEST or height > ThumbSize.LARGEST or \
+            path.startswith(gettempdir()) or \
+            has_fresh_thumbnail(path, boundary):
+        return False
+
+    get_thumbnail(path, boundary)
+    # images smaller than the thumbnail size don't get one either
+    return has_fresh_thumbnail(path, boundary)
+
+
 def get_thumbnail_from_file(fileobj, boundary):
     """Like get_thumbnail() but works with files that can't be reopened.
 
@@ -0,0 +1,118 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+"""Records where the time during startup goes.
+
+If QUODLIBET_STARTUP_TRACE is set to a file path the wall and CPU time of
+each startup phase, module import and browser init gets written there
+once the main window is shown, in the Chrome trace event format (it can
+be viewed with chrome://tracing or https://ui.perfetto.dev).
+"""
+
+import os
+import json
+import time
+import threading
+import contextlib
+
+from senf import environ
+
+from quodlibet.util.dprint import print_d, print_w
+
+
+class Tracer(object):
+    """Collects timed events. Does nothing if not enabled."""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.events = []
+        self._start = time.perf_counter()
+
+    def _timestamp(self, t):
+        # microseconds, as used by the trace format
+        return (t - self._start) * 1e6
+
+    @contextlib.contextmanager
+    def trace(self, name, category="startup"):
+        """Records the wall and CPU time of the code in the with block"""
+
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            cpu = time.process_time() - start_cpu
+            self.events.append({
+                "name": name,
+                "cat": category,
+                "ph": "X",
+                "ts": self._timestamp(start),
+                "dur": (end - start) * 1e6,
+                "pid": os.getpid(),
+                "tid": threading.get_ident(),
+                "args": {"cpu_ms": cpu * 1e3},
+            })
+
+    def mark(self, name, category="startup"):
+        """Records that something happened now"""
+
+        if not self.enabled:
+            return
+
+        self.events.append({
+            "name": name,
+            "cat": category,
+            "ph": "i",
+            "s": "p",
+            "ts": self._timestamp(time.perf_counter()),
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        })
+
+    def get_report(self):
+        """Returns the events as a dict in the trace event format"""
+
+        return {
+            "traceEvents": list(self.events),
+            "displayTimeUnit": "ms",
+        }
+
+    def write(self, path):
+        """Writes the report to `path` as JSON"""
+
+        with open(path, "w", encoding="utf-8") as h:
+            json.dump(self.get_report(), h, indent=1)
+
+
+_path = environ.get("QUODLIBET_STARTUP_TRACE")
+
+tracer = Tracer(bool(_path))
+
+
+def trace(name, category="startup"):
+    """Context manager recording how long the startup phase `name` takes"""
+
+    return tracer.trace(name, category)
+
+
+def finish_startup_trace():
+    """Call once startup is done, writes the report if enabled"""
+
+    if not tracer.enabled:
+        return
+
+    tracer.mark("startup done")
+    try:
+        tracer.write(_path)
+    except EnvironmentError as e:
+        print_w("Couldn't write startup trace: %s" % e)
+    else:
+        print_d("Wrote startup trace to %r" % _path)
+    tracer.enabled = False
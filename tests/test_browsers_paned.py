@@ -3,6 +3,8 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import time
+
 from tests import TestCase
 from .helper import realized
 
@@ -73,6 +75,12 @@ class TPanedBrowser(TestCase):
         while Gtk.events_pending():
             Gtk.main_iteration()
 
+    def _wait_search(self):
+        # searches in a thread don't show up as pending events
+        start = time.time()
+        while time.time() - start < 0.5:
+            Gtk.main_iteration_do(False)
+
     def test_get_set_headers(self):
         config.set("browsers", "panes", "~people album")
         self.assertEqual(get_headers(), ["~people", "album"])
@@ -146,6 +154,24 @@ class TPanedBrowser(TestCase):
         for song in self.last:
             self.assertTrue(u"piman" in song.list("artist"))
 
+    def test_fill_panes_inhibited(self):
+        library = self.bar._library
+        library.ASYNC_MIN_SONGS = 0
+        self.bar.fill_panes()
+        self._wait_search()
+        self.failUnlessEqual(self.emit_count, 0)
+
+    def test_activate_changed_while_searching(self):
+        library = self.bar._library
+        library.ASYNC_MIN_SONGS = 0
+        self.bar.filter_text("artist=piman")
+        new = AudioFile({"artist": "piman", "title": "new",
+                         "~filename": fsnative(u"/bin/new")})
+        library.remove([SONGS[2]])
+        library.add([new])
+        self._wait_search()
+        self.failUnlessEqual(set(self.last), {SONGS[3], new})
+
     def test_set_all_panes(self):
         self.bar.activate()
         self.bar.set_all_panes()
@@ -535,6 +561,51 @@ class TPaneModel(TestCase):
         self._verify_model(m)
         self.assertTrue(m.matches([len(m) - 1], UNKNOWN_ARTIST))
 
+    def test_matches_not_in_model(self):
+        conf = PaneConfig("artist")
+        m = PaneModel(conf)
+        m.add_songs(SONGS[1:])
+        song = AudioFile(dict(SONGS[1]))
+        self.assertTrue(m.matches([1], song))
+        self.assertFalse(m.matches([2], song))
+        self.assertFalse(m.matches([1], UNKNOWN_ARTIST))
+        self.assertTrue(m.matches([len(m) - 1], UNKNOWN_ARTIST))
+
+    def test_remove_songs_changed_rows(self):
+        conf = PaneConfig("artist")
+        m = PaneModel(conf)
+        m.add_songs(SONGS)
+        changed = []
+        m.connect("row-changed",
+                  lambda model, path, iter_: changed.append(path[0]))
+        m.remove_songs([SONGS[2]], True)
+        self.assertEqual(changed, [3])
+        self.assertEqual(m.get_songs([3]), {SONGS[3]})
+
+    def test_remove_songs_keep_then_remove(self):
+        conf = PaneConfig("artist")
+        m = PaneModel(conf)
+        m.add_songs(SONGS)
+        length = len(m)
+        m.remove_songs([SONGS[1]], False)
+        self.assertEqual(len(m), length)
+        self.assertFalse(m.get_songs([2]))
+        m.remove_songs([], True)
+        self.assertEqual(len(m), length - 1)
+        self._verify_model(m)
+
+    def test_remove_songs_keep_then_add(self):
+        conf = PaneConfig("artist")
+        m = PaneModel(conf)
+        m.add_songs(SONGS)
+        length = len(m)
+        m.remove_songs([SONGS[1]], False)
+        m.add_songs([SONGS[1]])
+        m.remove_songs([], True)
+        self.assertEqual(len(m), length)
+        self.assertEqual(m.get_songs([2]), {SONGS[1]})
+        self.assertTrue(m.matches([2], SONGS[1]))
+
 
 class TPanedPreferences(TestCase):
 
@@ -5,16 +5,21 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+import gc
 import sys
+import time
+import threading
 
 from senf import fsnative
 
-from tests import TestCase, get_data_path
+from tests import TestCase, get_data_path, skip
 from .helper import capture_output
 
 from quodlibet import formats
 from quodlibet.formats import AudioFile, load_audio_files, dump_audio_files, \
-    SerializationError
+    dump_audio_files_compact, SerializationError, LazyAudioFile
+from quodlibet.formats import _misc
+from quodlibet.formats._misc import FORMAT_MODULES, get_module_name
 from quodlibet.util.picklehelper import pickle_dumps
 from quodlibet import config
 
@@ -27,6 +32,8 @@ class TFormats(TestCase):
         config.quit()
 
     def test_presence(self):
+        # looking at all types imports all format modules
+        self.failUnless(formats.types)
         self.failUnless(formats.aac)
         self.failUnless(formats.aiff)
         self.failUnless(formats.midi)
@@ -47,6 +54,8 @@ class TFormats(TestCase):
         self.failUnless(formats.loaders[".mp3"] is formats.mp3.MP3File)
 
     def test_migration(self):
+        formats.loaders[".mp3"]
+        formats.loaders[".flac"]
         self.failUnless(formats.mp3 is sys.modules["quodlibet.formats.mp3"])
         self.failUnless(formats.mp3 is sys.modules["quodlibet/formats/mp3"])
         self.failUnless(formats.mp3 is sys.modules["formats.mp3"])
@@ -54,6 +63,65 @@ class TFormats(TestCase):
         self.failUnless(formats.xiph is sys.modules["formats.flac"])
         self.failUnless(formats.xiph is sys.modules["formats.oggvorbis"])
 
+    def test_format_modules(self):
+        for ext, loader in formats.loaders.items():
+            name = loader.__module__.rsplit(".", 1)[-1]
+            self.assertTrue(ext in FORMAT_MODULES[name], msg=ext)
+        # some modules only support their extensions if a library they
+        # need is available
+        for name, extensions in FORMAT_MODULES.items():
+            module = sys.modules["quodlibet.formats." + name]
+            self.assertTrue(set(module.extensions) <= set(extensions))
+
+    def test_load_module_threaded(self):
+        formats.loaders[".mp3"]
+        import_module = _misc.importlib.import_module
+
+        class SlowImportlib(object):
+            @staticmethod
+            def import_module(*args):
+                time.sleep(0.05)
+                return import_module(*args)
+
+        _misc._loaded.discard("mp3")
+        dict.pop(formats.loaders, ".mp3")
+        _misc.importlib = SlowImportlib
+        try:
+            found = []
+            threads = [
+                threading.Thread(
+                    target=lambda: found.append(formats.loaders.get(".mp3")))
+                for i in range(2)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            _misc.importlib = sys.modules["importlib"]
+        self.assertEqual(found, [formats.mp3.MP3File] * 2)
+
+    def test_load_all_none_found(self):
+        modules, loaded = _misc.FORMAT_MODULES, _misc._loaded
+        loaders = _misc.loaders
+        _misc.FORMAT_MODULES = {"nope": []}
+        _misc._loaded = set()
+        _misc.loaders = _misc._Loaders()
+        try:
+            with capture_output():
+                self.assertRaises(SystemExit, _misc._load_all)
+        finally:
+            _misc.FORMAT_MODULES, _misc._loaded = modules, loaded
+            _misc.loaders = loaders
+
+    def test_get_module_name(self):
+        for name in ["quodlibet/formats/mp3", "formats.mp3",
+                     "quodlibet.formats.mp3"]:
+            self.assertEqual(
+                get_module_name(name), "quodlibet.formats.mp3")
+        self.assertEqual(
+            get_module_name("formats.flac"), "quodlibet.formats.xiph")
+        self.assertEqual(get_module_name("foo.bar"), "foo.bar")
+
     def test_filter(self):
         self.assertTrue(formats.filter("foo.mp3"))
         self.assertFalse(formats.filter("foo.doc"))
@@ -168,3 +236,182 @@ class TPickle(TestCase):
             data = pickle_dumps([42], protocol)
             with self.assertRaises(SerializationError):
                 load_audio_files(data)
+
+
+def _synthetic_songs(count):
+    songs = []
+    for i in range(count):
+        song = AudioFile()
+        dict.update(song, {
+            "~filename": fsnative(u"/music/%d/%d.flac" % (i // 10, i)),
+            "~mountpoint": fsnative(u"/"),
+            "title": u"Title %d" % i,
+            "artist": u"Artist %d" % (i % 1000),
+            "album": u"Album %d" % (i // 10),
+            "tracknumber": u"%d/10" % (i % 10 + 1),
+            "genre": u"Rock",
+            "date": u"%d" % (1950 + i % 70),
+            "~#length": 180 + i % 120,
+            "~#playcount": i % 13,
+            "~#rating": (i % 5) / 4.0,
+            "~#mtime": 1500000000.5 + i,
+        })
+        songs.append(song)
+    return songs
+
+
+class TCompact(TestCase):
+
+    def setUp(self):
+        self.instances = []
+        for t in formats.types:
+            i = AudioFile.__new__(t)
+            dict.__init__(
+                i, {u"~filename": fsnative(u"foo"), "a": u"b", u"b": 42,
+                    "c": 0.25, u"\xf6\xe4\xfc": u"\u2605"})
+            self.instances.append(i)
+
+    def test_roundtrip(self):
+        data = dump_audio_files_compact(self.instances)
+        items = load_audio_files(data)
+        assert len(items) == len(self.instances)
+        for a, b in zip(items, self.instances):
+            assert type(a) is type(b)
+            assert dict(a) == dict(b)
+            assert type(a["b"]) is int
+            assert type(a["c"]) is float
+
+    def test_keys_shared(self):
+        items = load_audio_files(dump_audio_files_compact(self.instances))
+        a, b = [list(i.keys()) for i in items[:2]]
+        assert all(x is y for x, y in zip(a, b))
+
+    def test_dump_empty(self):
+        assert load_audio_files(dump_audio_files_compact([])) == []
+
+    def test_unsupported(self):
+        song = AudioFile()
+        dict.__setitem__(song, "foo", None)
+        with self.assertRaises(SerializationError):
+            dump_audio_files_compact([song])
+        dict.__setitem__(song, "foo", u"a\0b")
+        with self.assertRaises(SerializationError):
+            dump_audio_files_compact([song])
+
+    def test_missing_class(self):
+        data = dump_audio_files_compact(self.instances)
+        broken = data.replace(b"SPCFile", b"FooFile")
+        items = load_audio_files(broken)
+        self.assertEqual(len(items), len(formats.types) - 1)
+
+    def test_truncated(self):
+        data = dump_audio_files_compact(self.instances)
+        with self.assertRaises(SerializationError):
+            load_audio_files(data[:len(data) // 2])
+
+    def test_lazy(self):
+        data = dump_audio_files_compact(self.instances)
+        for a, b in zip(load_audio_files(data, lazy=True), self.instances):
+            if type(b).__getitem__ is not dict.__getitem__:
+                # can't be lazy
+                assert type(a) is type(b)
+                continue
+            assert isinstance(a, LazyAudioFile)
+            assert isinstance(a, type(b))
+            assert a
+            assert a("~filename") == b("~filename")
+            assert a.get("title") is None
+            assert "~filename" in a
+            assert isinstance(a, LazyAudioFile)
+            assert dict(a) == dict(b)
+            assert type(a) is type(b)
+
+    def test_lazy_write(self):
+        data = dump_audio_files_compact(self.instances)
+        song = load_audio_files(data, lazy=True)[0]
+        song["title"] = u"foo"
+        assert type(song) is type(self.instances[0])
+        assert song("title") == u"foo"
+        assert song("a") == u"b"
+
+    def test_lazy_uncommon(self):
+        data = dump_audio_files_compact(self.instances)
+        song = load_audio_files(data, lazy=True)[0]
+        assert song.get("a") == u"b"
+        assert not isinstance(song, LazyAudioFile)
+
+    def test_lazy_dump(self):
+        data = dump_audio_files_compact(self.instances)
+        items = load_audio_files(data, lazy=True)
+        assert dump_audio_files_compact(items) == data
+        data = dump_audio_files(items)
+        assert any(isinstance(i, LazyAudioFile) for i in items)
+        items = load_audio_files(data)
+        for a, b in zip(items, self.instances):
+            assert type(a) is type(b)
+            assert dict(a) == dict(b)
+
+    def test_lazy_materialized_meanwhile(self):
+        # readers which got in before another thread materialized the song
+        data = dump_audio_files_compact(self.instances)
+        song = load_audio_files(data, lazy=True)[0]
+        song.get("a")
+        assert not isinstance(song, LazyAudioFile)
+        assert LazyAudioFile.get(song, "title") is None
+        assert LazyAudioFile.get(song, "a") == u"b"
+        assert LazyAudioFile.__getitem__(song, "~filename") == \
+            song["~filename"]
+        assert LazyAudioFile.__contains__(song, "a")
+        assert LazyAudioFile.prefixkeys(song, "a") == ["a"]
+
+    def test_lazy_threaded(self):
+        data = dump_audio_files_compact(_synthetic_songs(2000))
+        songs = load_audio_files(data, lazy=True)
+        errors = []
+
+        def search():
+            try:
+                for i in range(3):
+                    for song in songs:
+                        song.get("title")
+                        song("~filename")
+                        "album" in song
+            except Exception as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=search)
+        thread.start()
+        for song in songs:
+            song.get("comment")
+        thread.join()
+        assert not errors
+        assert not any(isinstance(s, LazyAudioFile) for s in songs)
+        assert songs[1]["title"] == u"Title 1"
+
+    def test_lazy_freed(self):
+        data = dump_audio_files_compact(self.instances)
+        songs = load_audio_files(data, lazy=True)
+        lazy = [s for s in songs if isinstance(s, LazyAudioFile)]
+        store = lazy[0]._store
+        assert len(store._indices) == len(lazy)
+        del songs, lazy
+        gc.collect()
+        assert len(store._indices) == 0
+
+    @skip("Enable for basic benchmarking of the library formats")
+    def test_load_performance(self):
+        for count in [10000, 100000, 500000]:
+            songs = _synthetic_songs(count)
+            pickled = dump_audio_files(songs)
+            compact = dump_audio_files_compact(songs)
+            del songs
+
+            t = time.time()
+            load_audio_files(pickled)
+            pickle_time = time.time() - t
+            t = time.time()
+            load_audio_files(compact)
+            compact_time = time.time() - t
+            print("%d songs: pickle %.2fs (%d MB), compact %.2fs (%d MB)" % (
+                count, pickle_time, len(pickled) // 2 ** 20,
+                compact_time, len(compact) // 2 ** 20))
@@ -855,6 +855,18 @@ class TAudioFile(TestCase):
             afile.sanitize(fsnative(u'/dir/fn'))
             self.failUnlessEqual(afile.album_key, expected)
 
+    def test_generation(self):
+        song = AudioFile({"a": "b"})
+        other = AudioFile({"a": "b"})
+        generation = song.generation
+        self.assertEqual(song.generation, generation)
+        self.assertNotEqual(other.generation, generation)
+        song["a"] = "c"
+        self.assertNotEqual(song.generation, generation)
+        generation = song.generation
+        del song["a"]
+        self.assertNotEqual(song.generation, generation)
+
     def test_eq_ne(self):
         self.failIf(AudioFile({"a": "b"}) == AudioFile({"a": "b"}))
         self.failUnless(AudioFile({"a": "b"}) != AudioFile({"a": "b"}))
@@ -0,0 +1,141 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import time
+
+from senf import fsnative
+
+from quodlibet import config
+from quodlibet.formats import AudioFile
+from quodlibet.library.libraries import SongLibrary
+from quodlibet.library.index import TagIndex
+from quodlibet.query import Query
+
+from tests import TestCase, skip
+
+
+QUERIES = [
+    u"", u"foo", u"piman", u"mu", u"ångström", u"angstrom", u"!mu",
+    u"artist=mu", u"artist=\"mu\"", u"artist=\"MU\"", u"artist=\"mu\"c",
+    u"artist=\"Mu\"c", u"artist=/^pi/", u"artist=/^PI/", u"artist=/^pi$/",
+    u"artist=/man$/", u"artist=!\"mu\"", u"artist!=mu",
+    u"artist=|(\"mu\", \"piman\")", u"|(artist=\"mu\", title=/^rock/)",
+    u"&(artist=\"mu\", title=/^rock/)", u"&(artist=/^/, #(length > 100))",
+    u"&(album=\"\", artist=mu)", u"title=\"Ångström\"", u"title=/^ång/",
+    u"title=/^ANG/", u"title=/^Ångström$/", u"&(mu, #(playcount < 3))",
+    u"|(mu, #(playcount < 3))", u"filename=foo", u"~people=piman",
+    u"#(length > 100)", u"a=\"\"", u"x=/^$/", u"title=/^o.*h/",
+    u"artist=/^i$/", u"artist=/^\u0131$/", u"title=/^sun$/", u"title=/^SU/",
+]
+
+
+class TTagIndex(TestCase):
+
+    def setUp(self):
+        config.init()
+        self.library = SongLibrary()
+        self.songs = [
+            AudioFile(
+                {"album": u"I Hate: Tests", "artist": u"piman",
+                 "title": u"Quuxly", "~#length": 224, "~#playcount": 24,
+                 "~filename": fsnative(u"/dir1/foobar.ogg")}),
+            AudioFile(
+                {"album": u"Foo the Bar", "artist": u"mu",
+                 "title": u"Rockin' Out", "~#playcount": 2,
+                 "~filename": fsnative(u"/dir2/something.mp3")}),
+            AudioFile(
+                {"artist": u"piman\nmu",
+                 "~filename": fsnative(u"/dir3/foo.ogg")}),
+            AudioFile(
+                {"title": u"\xc5ngström",
+                 "~filename": fsnative(u"/dir3/bar.ogg")}),
+            AudioFile(
+                {"title": u"oh&blahhh", "artist": u"!ohno",
+                 "~filename": fsnative(u"/dir3/baz.ogg")}),
+            AudioFile(
+                {"title": u"\u017fun", "artist": u"\u0130",
+                 "~filename": fsnative(u"/dir4/i.ogg")}),
+        ]
+        self.library.add(self.songs)
+        self.index = TagIndex(self.library)
+
+    def tearDown(self):
+        self.index.destroy()
+        self.library.destroy()
+        config.quit()
+
+    def _check(self):
+        for text in QUERIES:
+            query = Query(text)
+            expected = list(filter(query.search, self.library.values()))
+            self.assertEqual(self.index.query(query), expected, msg=text)
+
+    def test_query(self):
+        self._check()
+
+    def test_search_index(self):
+        self.assertEqual(
+            Query(u"artist=\"mu\"").search_index(self.index),
+            {self.songs[1], self.songs[2]})
+        assert Query(u"#(length > 100)").search_index(self.index) is None
+        assert Query(u"filename=foo").search_index(self.index) is None
+        self.assertEqual(
+            Query(u"&(mu, #(playcount < 3))").search_index(self.index),
+            {self.songs[1], self.songs[2]})
+
+    def test_added(self):
+        self._check()
+        self.library.add([AudioFile(
+            {"artist": u"Mu", "title": u"rock",
+             "~filename": fsnative(u"/dir4/new.ogg")})])
+        self._check()
+
+    def test_changed(self):
+        self._check()
+        self.songs[1]["artist"] = u"piman"
+        self.songs[2]["artist"] = u"Ångström\nmu"
+        del self.songs[3]["title"]
+        self.library.changed(self.songs[1:4])
+        self._check()
+
+    def test_removed(self):
+        self._check()
+        self.library.remove(self.songs[:2])
+        self._check()
+        self.library.remove(self.songs[2:])
+        self._check()
+
+    def test_library_query(self):
+        self.library.use_index = True
+        for text in QUERIES:
+            self.assertEqual(
+                list(self.library.query(text)),
+                list(filter(Query(text).search, self.library.values())))
+
+    @skip("Enable for basic benchmarking of the tag index")
+    def test_performance(self):
+        songs = []
+        for i in range(300000):
+            songs.append(AudioFile({
+                "artist": u"Artist %d" % (i // 100),
+                "album": u"Album %d" % (i // 10),
+                "title": u"Title %d" % i,
+                "~filename": fsnative(u"/dir/%d.ogg" % i),
+            }))
+        self.library.add(songs)
+        for tag in ["artist", "album", "title"]:
+            self.index.query(Query(u"%s=/^x/" % tag))
+
+        for text in [u"artist=\"Artist 42\"", u"title=/^title 4242/",
+                     u"&(artist=\"Artist 42\", album=/^album 42/)",
+                     u"&(artist=/^artist 42/, 4242)", u"4242"]:
+            query = Query(text)
+            t = time.time()
+            list(filter(query.search, self.library.values()))
+            scan = time.time() - t
+            t = time.time()
+            self.index.query(query)
+            indexed = time.time() - t
+            print("%s: scan %.4fs, index %.4fs" % (text, scan, indexed))
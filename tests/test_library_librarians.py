@@ -99,6 +99,57 @@ class TLibrarian(TestCase):
         self.failUnlessEqual(self.changed_1, self.Frange(6, 12))
         self.failUnlessEqual(self.changed_2, self.Frange(12, 18))
 
+    def test_coalesce_signals(self):
+        self.librarian.coalesce_signals = True
+        self.lib1.add(self.Frange(12))
+        self.lib2.add(self.Frange(12, 24))
+        self.lib1.remove([self.Fake(3)])
+        self.lib2.remove([self.Fake(16)])
+        self.failIf(self.added or self.changed or self.removed)
+        self.failUnlessEqual(self.removed_1, [self.Fake(3)])
+
+        self.librarian.flush()
+        self.failUnlessEqual(
+            self.added, [f for f in self.Frange(24) if f not in (3, 16)])
+        self.failIf(self.changed or self.removed)
+        stats = self.librarian.signal_stats()
+        self.failUnlessEqual(stats["received"], 4)
+        self.failUnlessEqual(stats["emitted"], 1)
+        self.failUnlessEqual(stats["saved"], 3)
+
+        self.lib1.remove(self.Frange(2))
+        self.lib1.add(self.Frange(1))
+        self.failIf(self.changed or self.removed)
+        # changes made through the librarian get emitted right away
+        self.librarian.changed(self.Frange(4))
+        self.failUnlessEqual(self.removed, [self.Fake(1)])
+        # 3 got removed before
+        self.failUnlessEqual(self.changed, [self.Fake(0), self.Fake(2)])
+        self.failUnlessEqual(self.librarian.signal_stats()["emitted"], 3)
+
+    def test_coalesce_signals_remove(self):
+        self.librarian.coalesce_signals = True
+        self.lib1.add(self.Frange(4))
+        self.librarian.remove([self.Fake(2)])
+        self.failUnlessEqual(
+            self.added, [self.Fake(0), self.Fake(1), self.Fake(3)])
+        self.failIf(self.changed or self.removed)
+
+    def test_coalesce_signals_across_libraries(self):
+        self.librarian.coalesce_signals = True
+        self.lib1.add(self.Frange(4))
+        self.librarian.flush()
+        del self.added[:]
+
+        self.lib1.remove([self.Fake(1)])
+        self.lib2.add([self.Fake(1)])
+        self.lib2.add([self.Fake(5)])
+        self.lib1.remove([self.Fake(2)])
+        self.librarian.flush()
+        self.failUnlessEqual(self.changed, [self.Fake(1)])
+        self.failUnlessEqual(self.added, [self.Fake(5)])
+        self.failUnlessEqual(self.removed, [self.Fake(2)])
+
     def test___getitem__(self):
         self.lib1.add(self.Frange(12))
         self.lib2.add(self.Frange(12, 24))
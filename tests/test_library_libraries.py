@@ -7,18 +7,22 @@ from gi.repository import Gtk
 
 import os
 import shutil
+import time
 from senf import fsnative
 
 from quodlibet.formats import AudioFileError
 from quodlibet import config
 from quodlibet.util import connect_obj, is_windows
-from quodlibet.formats import AudioFile
+from quodlibet.formats import AudioFile, LazyAudioFile, load_audio_files, \
+    dump_audio_files_compact
 
-from tests import TestCase, get_data_path, mkstemp, mkdtemp, skipIf
+from tests import TestCase, get_data_path, mkstemp, mkdtemp, skipIf, skip
 from .helper import capture_output, get_temp_copy
 
 from quodlibet.library.libraries import Library, PicklingMixin, SongLibrary, \
-    FileLibrary, AlbumLibrary, SongFileLibrary, iter_paths
+    FileLibrary, AlbumLibrary, SongFileLibrary, iter_paths, JournalingMixin
+from quodlibet.query import Query
+from quodlibet.util.thread import Cancellable
 
 
 class Fake(int):
@@ -306,6 +310,165 @@ class TPicklingMixin(TestCase):
         finally:
             os.unlink(filename)
 
+    def test_save_load_lazy(self):
+        fd, filename = mkstemp()
+        os.close(fd)
+        try:
+            self.library.compact_format = True
+            self.library.add(self.Frange(30))
+            self.library.save(filename)
+
+            library = self.Library()
+            library.lazy = True
+            library.load(filename)
+            assert all(isinstance(s, LazyAudioFile) for s in library.values())
+            assert sorted(library.keys()) == sorted(self.library.keys())
+            # the map has to keep working after the file is replaced
+            self.library.save(filename)
+            for key, song in library.items():
+                assert dict(song) == dict(self.library[key])
+        finally:
+            os.unlink(filename)
+
+
+class TJournalingMixin(TestCase):
+
+    class JournalingLibrary(JournalingMixin, SongLibrary):
+        pass
+
+    def setUp(self):
+        self.temp = mkdtemp()
+        self.filename = os.path.join(self.temp, "songs")
+        self.library = self.JournalingLibrary()
+        self.library.filename = self.filename
+
+    def tearDown(self):
+        self.library.destroy()
+        shutil.rmtree(self.temp)
+
+    def _reload(self):
+        library = self.JournalingLibrary()
+        library.load(self.filename)
+        self.addCleanup(library.destroy)
+        return library
+
+    def test_first_save(self):
+        self.library.add(FakeAudioFileRange(10))
+        self.library.save()
+        assert os.path.exists(self.filename)
+        assert not os.path.exists(self.library.journal_filename)
+        assert not self.library.dirty
+        assert len(self._reload()) == 10
+
+    def test_journal(self):
+        songs = FakeAudioFileRange(10)
+        self.library.add(songs)
+        self.library.save()
+        size = os.path.getsize(self.filename)
+
+        self.library.add(FakeAudioFileRange(10, 15))
+        songs[0]["title"] = "changed"
+        self.library.changed([songs[0]])
+        self.library.remove([songs[1]])
+        self.library.save()
+
+        assert os.path.getsize(self.filename) == size
+        assert os.path.exists(self.library.journal_filename)
+
+        library = self._reload()
+        assert sorted(library.keys()) == sorted(self.library.keys())
+        assert library[songs[0].key]["title"] == "changed"
+        assert songs[1].key not in library
+
+    def test_renamed(self):
+        song = FakeAudioFile(1)
+        self.library.add([song])
+        self.library.save()
+
+        old_key = song.key
+        del self.library._contents[old_key]
+        song["~filename"] = fsnative(u"2")
+        self.library._contents[song.key] = song
+        self.library._renamed(song, old_key)
+        self.library.changed([song])
+        self.library.save()
+
+        assert list(self._reload().keys()) == [song.key]
+
+    def test_compact(self):
+        songs = FakeAudioFileRange(10)
+        self.library.add(songs)
+        self.library.save()
+        self.library.remove(songs[:5])
+        self.library.save()
+        assert os.path.exists(self.library.journal_filename)
+
+        self.library.compact(background=False)
+        assert not os.path.exists(self.library.journal_filename)
+        assert sorted(self._reload().keys()) == sorted(self.library.keys())
+
+    def test_compact_background(self):
+        songs = FakeAudioFileRange(10)
+        self.library.add(songs)
+        self.library.save()
+        self.library.remove(songs[:5])
+        self.library.save()
+
+        self.library.compact()
+        for i in range(500):
+            while Gtk.events_pending():
+                Gtk.main_iteration()
+            if self.library._compacting is None:
+                break
+            time.sleep(0.01)
+        assert self.library._compacting is None
+        assert not os.path.exists(self.library.journal_filename)
+        assert sorted(self._reload().keys()) == sorted(self.library.keys())
+
+    def test_compact_format(self):
+        self.library.compact_format = True
+        self.library.journal_compact_min_size = 0
+        self.library.journal_compact_ratio = 0
+        songs = FakeAudioFileRange(10)
+        self.library.add(songs)
+        self.library.save()
+        self.library.remove(songs[:5])
+        # any journal gets compacted
+        self.library.save()
+        assert self.library._compacting is not None
+        for i in range(500):
+            while Gtk.events_pending():
+                Gtk.main_iteration()
+            if self.library._compacting is None:
+                break
+            time.sleep(0.01)
+        assert not os.path.exists(self.library.journal_filename)
+
+        library = self.JournalingLibrary()
+        library.lazy = True
+        library.load(self.filename)
+        self.addCleanup(library.destroy)
+        assert all(isinstance(s, LazyAudioFile) for s in library.values())
+        assert sorted(library.keys()) == sorted(self.library.keys())
+
+    def test_truncated_journal(self):
+        self.library.add(FakeAudioFileRange(10))
+        self.library.save()
+        self.library.add(FakeAudioFileRange(10, 12))
+        self.library.save()
+        with open(self.library.journal_filename, "ab") as h:
+            h.write(b"+\x00\x00\xff\xffgarbage")
+        assert len(self._reload()) == 12
+
+    def test_pickling_save_drops_journal(self):
+        self.library.add(FakeAudioFileRange(10))
+        self.library.save()
+        self.library.add(FakeAudioFileRange(10, 12))
+        self.library.save()
+        PicklingMixin.save(self.library)
+        assert not os.path.exists(self.library.journal_filename)
+        assert len(self._reload()) == 12
+
 
 class TSongLibrary(TLibrary):
     Fake = FakeSong
@@ -348,6 +511,94 @@ class TSongLibrary(TLibrary):
         self.failUnlessEqual(sorted(self.library.tag_values(0)), [])
         self.failIf(self.changed or self.added or self.removed)
 
+    def _add_query_songs(self):
+        songs = [AudioFile({"title": u"song %d" % i, "~#playcount": i % 3,
+                            "~filename": fsnative(u"/dir/%d.ogg" % i)})
+                 for i in range(20)]
+        self.library.add(songs)
+        return {s for s in songs if s("~#playcount") == 1}
+
+    def _filter_query_async(self, text):
+        results = []
+        partial = []
+        cancellable = Cancellable()
+        self.library.filter_query_async(
+            Query(text), cancellable, results.append, partial.append)
+        start = time.time()
+        while not results and time.time() - start < 10:
+            Gtk.main_iteration_do(False)
+        return results, partial
+
+    def test_filter_query_async_small(self):
+        expected = self._add_query_songs()
+        results = []
+        self.library.filter_query_async(
+            Query(u"#(playcount = 1)"), Cancellable(), results.append)
+        # searched right away
+        self.assertEqual(len(results), 1)
+        self.assertEqual(set(results[0]), expected)
+
+    def test_filter_query_async(self):
+        expected = self._add_query_songs()
+        self.library.ASYNC_MIN_SONGS = 0
+        self.library.ASYNC_CHUNK_SIZE = 3
+        results, partial = self._filter_query_async(u"#(playcount = 1)")
+        self.assertEqual(len(results), 1)
+        self.assertEqual(set(results[0]), expected)
+        assert partial
+        for songs in partial:
+            assert set(songs) <= expected
+
+    def test_filter_query_async_cancel(self):
+        self._add_query_songs()
+        self.library.ASYNC_MIN_SONGS = 0
+        results = []
+        cancellable = Cancellable()
+        self.library.filter_query_async(
+            Query(u"#(playcount = 1)"), cancellable, results.append,
+            results.append)
+        cancellable.cancel()
+        while Gtk.events_pending():
+            Gtk.main_iteration()
+        self.assertEqual(results, [])
+
+    def test_filter_query_async_cached(self):
+        expected = self._add_query_songs()
+        self.library.use_query_cache = True
+        self.library.ASYNC_MIN_SONGS = 0
+        results, partial = self._filter_query_async(u"#(playcount = 1)")
+        self.assertEqual(set(results[0]), expected)
+        # remembered, so no need to search again
+        results = []
+        self.library.filter_query_async(
+            Query(u"#(playcount = 1)"), Cancellable(), results.append)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(set(results[0]), expected)
+
+    def test_filter_query_async_lazy(self):
+        songs = [AudioFile({"title": u"song %d" % i,
+                            "comment": u"c%d" % (i % 3),
+                            "~filename": fsnative(u"/dir/%d.ogg" % i)})
+                 for i in range(3000)]
+        songs = load_audio_files(dump_audio_files_compact(songs), lazy=True)
+        self.library.add(songs)
+        self.library.ASYNC_MIN_SONGS = 0
+        self.library.ASYNC_CHUNK_SIZE = 100
+        results = []
+        self.library.filter_query_async(
+            Query(u"&(title=/^song/, comment=c1)"), Cancellable(),
+            results.append)
+        # materialize them here while the thread looks at them as well
+        for song in reversed(songs):
+            song.get("comment")
+        start = time.time()
+        while not results and time.time() - start < 10:
+            Gtk.main_iteration_do(False)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(
+            set(results[0]), {s for s in songs if s["comment"] == u"c1"})
+        assert not any(isinstance(s, LazyAudioFile) for s in songs)
+
 
 class TFileLibrary(TLibrary):
     Fake = FakeSongFile
@@ -538,6 +789,69 @@ class TSongFileLibrary(TSongLibrary):
         os.unlink(filename)
         config.quit()
 
+    def _scan(self, workers):
+        config.init()
+        temp = mkdtemp()
+        try:
+            for i in range(10):
+                shutil.copy(get_data_path('empty.flac'),
+                            os.path.join(temp, "%d.flac" % i))
+            with open(os.path.join(temp, "broken.flac"), "wb") as h:
+                h.write(b"nope")
+            with capture_output():
+                for _ in self.library.scan([temp], workers=workers):
+                    pass
+            return sorted(os.path.basename(k) for k in self.library.keys())
+        finally:
+            shutil.rmtree(temp)
+            config.quit()
+
+    def test_scan(self):
+        keys = self._scan(0)
+        assert keys == sorted("%d.flac" % i for i in range(10))
+        assert len(self.added) == 10
+
+    def test_scan_workers(self):
+        keys = self._scan(3)
+        assert keys == sorted("%d.flac" % i for i in range(10))
+        assert len(self.added) == 10
+
+    def _rebuild(self, workers):
+        config.init()
+        temp = mkdtemp()
+        try:
+            for i in range(2):
+                subdir = os.path.join(temp, str(i))
+                os.mkdir(subdir)
+                for j in range(5):
+                    shutil.copy(get_data_path('empty.flac'),
+                                os.path.join(subdir, "%d.flac" % j))
+            with capture_output():
+                for _ in self.library.scan([temp]):
+                    pass
+            os.unlink(os.path.join(temp, "0", "1.flac"))
+            changed = os.path.join(temp, "1", "2.flac")
+            os.utime(changed, (0, 0))
+            self.library.get_filename(os.path.join(temp, "1", "3.flac"))[
+                "~#mtime"] = 0
+            with capture_output():
+                for _ in self.library.rebuild([], workers=workers):
+                    pass
+            return (
+                sorted(os.path.basename(s("~dirname")) + s("~basename")
+                       for s in self.changed),
+                sorted(os.path.basename(s("~dirname")) + s("~basename")
+                       for s in self.removed))
+        finally:
+            shutil.rmtree(temp)
+            config.quit()
+
+    def test_rebuild(self):
+        assert self._rebuild(0) == (["12.flac", "13.flac"], ["01.flac"])
+
+    def test_rebuild_workers(self):
+        assert self._rebuild(4) == (["12.flac", "13.flac"], ["01.flac"])
+
 
 class TAlbumLibrary(TestCase):
     Fake = FakeSong
@@ -626,6 +940,47 @@ class TAlbumLibrary(TestCase):
         # It shouldn't implement FileLibrary etc
         self.failIf(getattr(self.library, "filename", None))
 
+    def test_changed(self):
+        songs = self.underlying._contents
+        key = self.underlying.get("file_1.mp3").album_key
+
+        # move all songs of Album 1 to Album 2
+        moved = [songs["file_%d.mp3" % i] for i in range(1, 12, 3)]
+        for song in moved:
+            song["album"] = song["labelid"] = "Album 2"
+        self.underlying.changed(moved)
+
+        self.failUnlessEqual(self.library.get(key), None)
+        album2 = self.library[self.underlying.get("file_2.mp3").album_key]
+        self.failUnlessEqual(len(album2.songs), 8)
+        assert set(moved) <= album2.songs
+
+        # and one to a new album
+        song = moved[0]
+        song["album"] = song["labelid"] = "Album 4"
+        self.underlying.changed([song])
+        self.failUnlessEqual(len(album2.songs), 7)
+        self.failUnlessEqual(self.library[song.album_key].songs, {song})
+
+        self.underlying.remove([song])
+        self.failUnlessEqual(self.library.get(song.album_key), None)
+
+    @skip("Enable for basic benchmarking of album changes")
+    def test_changed_performance(self):
+        songs = [AlbumSong(i, album="Album %d" % (i // 10))
+                 for i in range(12, 200000)]
+        self.underlying.add(songs)
+
+        # retag a box set
+        box_set = songs[:2000]
+        for song in box_set:
+            song["album"] = song["labelid"] = "Box Set"
+
+        t = time.time()
+        self.underlying.changed(box_set)
+        print("%d albums, %d changed songs: %.4fs" % (
+            len(self.library), len(box_set), time.time() - t))
+
 
 class TAlbumLibrarySignals(TestCase):
     def setUp(self):
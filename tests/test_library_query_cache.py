@@ -0,0 +1,163 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+from senf import fsnative
+
+from quodlibet import config
+from quodlibet.formats import AudioFile
+from quodlibet.library.libraries import SongLibrary
+from quodlibet.library.query_cache import QueryCache, _refines
+from quodlibet.query import Query
+
+from tests import TestCase
+
+
+QUERIES = [
+    u"p", u"pi", u"piman", u"pimanx", u"pi mu", u"pi mu rock",
+    u"artist=p", u"artist=pi", u"artist=/pi/", u"artist=\"piman\"",
+    u"&(artist=pi, title=rock)", u"&(artist=pi, !title=rock)",
+    u"|(artist=pi, title=rock)", u"#(playcount < 3)",
+    u"&(#(playcount < 3), artist=m)", u"t", u"th", u"title=\"þ\"",
+    # same repr() text, but different queries
+    u"~dirname=dir", u"~basename=dir", u"#(playcount < 2.001)",
+    u"#(playcount < 1.999)",
+]
+
+
+class TQueryCache(TestCase):
+
+    def setUp(self):
+        config.init()
+        self.library = SongLibrary()
+        self.songs = [
+            AudioFile(
+                {"album": u"I Hate: Tests", "artist": u"piman",
+                 "title": u"Quuxly", "~#playcount": 24,
+                 "~filename": fsnative(u"/dir1/foobar.ogg")}),
+            AudioFile(
+                {"album": u"Foo the Bar", "artist": u"mu",
+                 "title": u"Rockin' Out", "~#playcount": 2,
+                 "~filename": fsnative(u"/dir2/something.mp3")}),
+            AudioFile(
+                {"artist": u"piman\nmu", "title": u"þorn",
+                 "~filename": fsnative(u"/dir3/foo.ogg")}),
+        ]
+        self.library.add(self.songs)
+        self.searches = []
+        self.cache = QueryCache(self.library, self._search)
+
+    def tearDown(self):
+        self.cache.destroy()
+        self.library.destroy()
+        config.quit()
+
+    def _search(self, query):
+        self.searches.append(query)
+        return query.filter(self.library.values())
+
+    def _check(self):
+        for text in QUERIES:
+            query = Query(text)
+            self.assertEqual(
+                self.cache.query(query),
+                list(filter(query.search, self.library.values())), msg=text)
+
+    def test_query(self):
+        self._check()
+        self._check()
+
+    def test_repeated(self):
+        self.cache.query(Query(u"artist=mu"))
+        self.cache.query(Query(u"artist = mu"))
+        self.assertEqual(len(self.searches), 1)
+
+    def test_refined(self):
+        self.cache.query(Query(u"pi"))
+        self.assertEqual(self.cache.query(Query(u"piman mu")),
+                         [self.songs[2]])
+        self.assertEqual(len(self.searches), 1)
+
+    def test_refines(self):
+        def refines(text, other):
+            return _refines(Query(text)._unpack(), Query(other)._unpack())
+
+        assert refines(u"bar", u"ba")
+        assert refines(u"bar baz", u"bar")
+        assert refines(u"&(a=b, c=d)", u"c=d")
+        assert refines(u"artist=bar", u"artist=ba")
+        assert refines(u"&(a=/^bar/, #(length > 3))", u"a=/^bar/")
+        assert refines(u"a-b.c", u"a-b")
+        assert not refines(u"ba", u"bar")
+        assert not refines(u"bar", u"bar baz")
+        assert not refines(u"artist=bar", u"title=ba")
+        assert not refines(u"artist=bar", u"artist=\"ba\"c")
+        assert not refines(u"artist=/bar+/", u"artist=ba")
+        assert not refines(u"artist=/ba\\w/", u"artist=ba")
+        assert not refines(u"|(a=bar, b=baz)", u"a=ba")
+        # "th" also matches "þ" and "oo" matches "ꝏ"
+        assert not refines(u"th", u"t")
+        assert not refines(u"foo", u"fo")
+
+    def test_not_cacheable(self):
+        assert Query(u"artist=mu").is_cacheable()
+        assert Query(u"&(mu, #(playcount < 3))").is_cacheable()
+        assert not Query(u"#(added < 1 day)").is_cacheable()
+        assert not Query(u"#(lastplayed:max < today)").is_cacheable()
+        assert not Query(u"!&(mu, #(added < now))").is_cacheable()
+        # can change without the song changing
+        assert not Query(u"~playlists=foo").is_cacheable()
+        assert not Query(u"playlists=foo").is_cacheable()
+        assert not Query(u"~people~lyrics=foo").is_cacheable()
+        assert not Query(u"#(rating > 0.5)").is_cacheable()
+        assert not Query(u"#(2 * rating:avg > 0.5)").is_cacheable()
+
+    def test_added(self):
+        self._check()
+        self.library.add([AudioFile(
+            {"artist": u"Pim", "title": u"rock",
+             "~filename": fsnative(u"/dir4/new.ogg")})])
+        self._check()
+
+    def test_changed(self):
+        self._check()
+        self.songs[1]["artist"] = u"piman"
+        self.songs[2]["title"] = u"Rock"
+        del self.songs[0]["artist"]
+        self.library.changed(self.songs)
+        self._check()
+
+    def test_changed_order(self):
+        query = Query(u"artist=pi")
+        songs = list(self.library.values())
+        self.assertEqual(self.cache.query(query),
+                         [s for s in songs if s is not self.songs[1]])
+        self.songs[1]["artist"] = u"piman"
+        self.library.changed([self.songs[1]])
+        # in library order, like without the cache
+        self.assertEqual(self.cache.query(query), songs)
+        self.assertEqual(len(self.searches), 1)
+
+    def test_removed(self):
+        self._check()
+        self.library.remove(self.songs[:2])
+        self._check()
+        self.library.remove(self.songs[2:])
+        self._check()
+
+    def test_max_entries(self):
+        for i in range(QueryCache.MAX_ENTRIES + 1):
+            self.cache.query(Query(u"artist=x%dy" % i))
+        self.cache.query(Query(u"artist=x0y"))
+        self.assertEqual(len(self.searches), QueryCache.MAX_ENTRIES + 2)
+        self.cache.query(Query(u"artist=x%dy" % QueryCache.MAX_ENTRIES))
+        self.assertEqual(len(self.searches), QueryCache.MAX_ENTRIES + 2)
+
+    def test_library_query(self):
+        self.library.use_query_cache = True
+        for i in range(2):
+            for text in QUERIES + [u"#(added < 1 day)"]:
+                self.assertEqual(
+                    set(self.library.query(text)),
+                    set(filter(Query(text).search, self.library.values())))
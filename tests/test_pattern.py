@@ -11,7 +11,9 @@ from tests import TestCase
 
 from quodlibet.formats import AudioFile
 from quodlibet.pattern import (FileFromPattern, XMLFromPattern, Pattern,
-    XMLFromMarkupPattern, ArbitraryExtensionFileFromPattern)
+    XMLFromMarkupPattern, ArbitraryExtensionFileFromPattern, PatternCache,
+    pattern_cache, format_cache)
+from quodlibet.pattern._pattern import PatternFormatter, _XMLFromPattern
 
 
 class _TPattern(TestCase):
@@ -580,3 +582,105 @@ class TPatternFormatList(_TPattern):
     def test_string(s):
         pat = Pattern('display')
         s.assertEqual(pat.format_list(s.a), {("display", "display")})
+
+
+class TPatternCache(TestCase):
+
+    def setUp(self):
+        self.cache = PatternCache(2)
+
+    def test_get(self):
+        first = self.cache.get(u"<artist>", PatternFormatter)
+        self.assertTrue(self.cache.get(u"<artist>", PatternFormatter) is first)
+        self.assertEqual(self.cache.hits, 1)
+        self.assertEqual(self.cache.misses, 1)
+        xml = self.cache.get(u"<artist>", _XMLFromPattern)
+        self.assertFalse(xml is first)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_max_size(self):
+        get = self.cache.get
+        first = get(u"<a>", PatternFormatter)
+        get(u"<b>", PatternFormatter)
+        get(u"<a>", PatternFormatter)
+        get(u"<c>", PatternFormatter)
+        self.assertTrue(get(u"<a>", PatternFormatter) is first)
+        self.assertEqual(self.cache.misses, 3)
+        get(u"<b>", PatternFormatter)
+        self.assertEqual(self.cache.misses, 4)
+        self.assertEqual(self.cache.stats()["entries"], 2)
+
+    def test_stats(self):
+        self.cache.get(u"<a>", PatternFormatter)
+        self.cache.get(u"<a>", PatternFormatter)
+        self.cache.get(u"<a>", _XMLFromPattern)
+        stats = self.cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 2)
+        self.assertEqual(stats["max_size"], 2)
+        self.assertTrue(stats["compile_time"] > 0)
+        kinds = stats["kinds"]
+        self.assertEqual(kinds["PatternFormatter"]["entries"], 1)
+        self.assertEqual(kinds["PatternFormatter"]["hits"], 1)
+        self.assertEqual(kinds["_XMLFromPattern"]["misses"], 1)
+        self.cache.clear()
+        self.assertEqual(
+            self.cache.stats()["kinds"]["PatternFormatter"]["entries"], 0)
+
+    def test_pattern(self):
+        self.assertTrue(Pattern(u"<title>") is Pattern(u"<title>"))
+        self.assertTrue(
+            pattern_cache.get(u"<title>", PatternFormatter) is
+            Pattern(u"<title>"))
+
+
+class TFormatCache(TestCase):
+
+    def setUp(self):
+        format_cache.clear()
+        self.song = AudioFile({"artist": u"foo", "title": u"bar"})
+
+    def test_format(self):
+        pattern = Pattern(u"<artist> - <title>")
+        assert pattern.cacheable
+        misses = format_cache.misses
+        self.assertEqual(pattern.format(self.song), u"foo - bar")
+        self.assertEqual(pattern.format(self.song), u"foo - bar")
+        self.assertEqual(format_cache.misses, misses + 1)
+
+        self.song["title"] = u"baz"
+        self.assertEqual(pattern.format(self.song), u"foo - baz")
+        del self.song["artist"]
+        self.assertEqual(pattern.format(self.song), u" - baz")
+
+    def test_format_list(self):
+        pattern = Pattern(u"<artist>")
+        result = pattern.format_list(self.song)
+        self.assertEqual(result, {(u"foo", u"foo")})
+        result.clear()
+        self.assertEqual(pattern.format_list(self.song), {(u"foo", u"foo")})
+        self.song["artist"] = u"a\nb"
+        self.assertEqual(
+            pattern.format_list(self.song), {(u"a", u"a"), (u"b", u"b")})
+
+    def test_not_cacheable(self):
+        assert not Pattern(u"<~#rating>").cacheable
+        assert not Pattern(u"<artist~~rating>").cacheable
+        assert not Pattern(u"<~playlists|x>").cacheable
+        assert not Pattern(u"<#(lastplayed = today)|new>").cacheable
+        assert Pattern(u"<#(playcount = 2)|twice>").cacheable
+
+        misses = format_cache.misses
+        Pattern(u"<~#rating>").format(self.song)
+        self.assertEqual(format_cache.misses, misses)
+
+    def test_disabled(self):
+        max_size = format_cache.max_size
+        format_cache.max_size = 0
+        try:
+            pattern = Pattern(u"<artist>")
+            pattern.format(self.song)
+            self.assertEqual(format_cache.stats()["entries"], 0)
+            self.assertEqual(pattern.format(self.song), u"foo")
+        finally:
+            format_cache.max_size = max_size
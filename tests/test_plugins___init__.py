@@ -3,14 +3,17 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
-from tests import TestCase, mkstemp
+from tests import TestCase, mkstemp, mkdtemp
 
 import os
+import sys
+import shutil
 
 from quodlibet import config
 from quodlibet.formats import AudioFile
 from quodlibet.util.songwrapper import SongWrapper, ListWrapper
-from quodlibet.plugins import PluginConfig
+from quodlibet.plugins import PluginConfig, PluginManager, PluginHandler
+from quodlibet.plugins.events import EventPlugin
 
 
 class TSongWrapper(TestCase):
@@ -162,3 +165,109 @@ class TPluginConfig(TestCase):
         c = PluginConfig("some")
         c.defaults.set("hm", "mh")
         self.assertEqual(c.get("hm"), "mh")
+
+
+class EventHandler(PluginHandler):
+
+    def __init__(self):
+        self.handled = []
+        self.enabled = []
+
+    def plugin_handle(self, plugin):
+        self.handled.append(plugin.cls)
+        return issubclass(plugin.cls, EventPlugin)
+
+    def plugin_enable(self, plugin):
+        self.enabled.append(plugin.cls)
+
+    def plugin_disable(self, plugin):
+        self.enabled.remove(plugin.cls)
+
+
+class TPluginManifest(TestCase):
+
+    MODULE = "quodlibet.fake.plugins.manifesttest"
+
+    def setUp(self):
+        config.init()
+        self.tempdir = mkdtemp()
+        self.manifest = os.path.join(self.tempdir, "manifest.json")
+        self.folder = os.path.join(self.tempdir, "plugins")
+        os.mkdir(self.folder)
+        self.path = os.path.join(self.folder, "manifesttest.py")
+        with open(self.path, "w") as h:
+            h.write(
+                "from quodlibet.plugins.events import EventPlugin\n"
+                "class Foo(EventPlugin):\n"
+                "    PLUGIN_ID = 'foo'\n"
+                "    PLUGIN_NAME = 'Foo Name'\n"
+                "    PLUGIN_DESC = 'Foo desc'\n"
+                "    PLUGIN_TAGS = 'Tag'\n")
+
+    def tearDown(self):
+        sys.modules.pop(self.MODULE, None)
+        shutil.rmtree(self.tempdir)
+        config.quit()
+
+    def _rescan(self):
+        # forget the module, to see if it gets imported again
+        sys.modules.pop(self.MODULE, None)
+        pm = PluginManager([self.folder], self.manifest)
+        handler = EventHandler()
+        pm.register_handler(handler)
+        pm.rescan()
+        return pm, handler
+
+    def test_deferred(self):
+        pm, handler = self._rescan()
+        self.assertTrue(self.MODULE in sys.modules)
+        self.assertTrue(os.path.exists(self.manifest))
+        plugin, = pm.plugins
+        self.assertFalse(plugin.deferred)
+        pm.quit()
+
+        pm, handler = self._rescan()
+        self.assertFalse(self.MODULE in sys.modules)
+        plugin, = pm.plugins
+        self.assertTrue(plugin.deferred)
+        self.assertEqual(plugin.id, "foo")
+        self.assertEqual(plugin.name, "Foo Name")
+        self.assertEqual(plugin.description, "Foo desc")
+        self.assertEqual(plugin.tags, ["Tag"])
+        self.assertTrue(issubclass(plugin.cls, EventPlugin))
+
+        self.assertTrue(pm.load(plugin))
+        self.assertTrue(self.MODULE in sys.modules)
+        self.assertFalse(plugin.deferred)
+        self.assertTrue(plugin.cls is sys.modules[self.MODULE].Foo)
+        self.assertTrue(handler.handled[-1] is plugin.cls)
+        pm.quit()
+
+    def test_enable(self):
+        pm, handler = self._rescan()
+        pm.enable(pm.plugins[0], True)
+        pm.save()
+        pm.quit()
+
+        pm, handler = self._rescan()
+        plugin, = pm.plugins
+        self.assertFalse(plugin.deferred)
+        self.assertEqual(handler.enabled, [sys.modules[self.MODULE].Foo])
+        pm.quit()
+
+    def test_changed(self):
+        self._rescan()[0].quit()
+        mtime = os.path.getmtime(self.path)
+        with open(self.path, "a") as h:
+            h.write("    PLUGIN_DESC = 'Changed'\n")
+        os.utime(self.path, (mtime + 1, mtime + 1))
+
+        pm, handler = self._rescan()
+        self.assertTrue(self.MODULE in sys.modules)
+        self.assertEqual(pm.plugins[0].description, "Changed")
+        pm.quit()
+
+        pm, handler = self._rescan()
+        self.assertFalse(self.MODULE in sys.modules)
+        self.assertEqual(pm.plugins[0].description, "Changed")
+        pm.quit()
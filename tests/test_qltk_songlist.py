@@ -10,7 +10,7 @@ from tests import TestCase
 
 from quodlibet.library import SongLibrary
 from quodlibet.qltk.songlist import SongList, set_columns, get_columns, \
-    header_tag_split, get_sort_tag
+    header_tag_split, get_sort_tag, SortKeyCache
 from quodlibet.formats import AudioFile
 from quodlibet import config
 
@@ -226,3 +226,61 @@ class TSongList(TestCase):
     def tearDown(self):
         self.songlist.destroy()
         config.quit()
+
+
+class TSortKeyCache(TestCase):
+
+    def setUp(self):
+        config.init()
+        self.cache = SortKeyCache()
+        self.songs = [
+            AudioFile({"artist": u"b", "title": u"Track 10",
+                       "~#playcount": 2}),
+            AudioFile({"artist": u"a", "title": u"track 2",
+                       "~#playcount": 1}),
+            AudioFile({"artist": u"b", "title": u"track 1",
+                       "~#playcount": 2}),
+            AudioFile({"title": u"Track 3", "~#playcount": 0}),
+        ]
+
+    def tearDown(self):
+        config.quit()
+
+    def _check(self, tag):
+        for reverse in [False, True, False]:
+            expected = sorted(
+                self.songs, key=AudioFile.sort_by_func(tag), reverse=reverse)
+            songs = list(self.songs)
+            self.cache.sort(tag, songs, reverse)
+            self.assertEqual(songs, expected)
+
+    def test_sort(self):
+        for tag in ["artist", "title", "~#playcount", "~artist~title",
+                    get_sort_tag("<artist> <title>")]:
+            self._check(tag)
+
+    def test_changed(self):
+        self._check("title")
+        self.songs[1]["title"] = u"track 20"
+        self._check("title")
+        self._check("artist")
+        del self.songs[0]["artist"]
+        self._check("artist")
+
+    def test_subset(self):
+        self._check("artist")
+        self.songs = self.songs[1:]
+        self._check("artist")
+        self.songs.append(AudioFile({"artist": u"aa"}))
+        self._check("artist")
+
+    def test_not_cacheable(self):
+        self._check("~#rating")
+        self._check(get_sort_tag("<~#rating>"))
+        self.assertFalse(self.cache._tags)
+
+    def test_max_tags(self):
+        tags = ["artist", "title", "~#playcount", "album", "genre"]
+        for tag in tags:
+            self._check(tag)
+        self.assertEqual(list(self.cache._tags), tags[1:])
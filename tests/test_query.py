@@ -201,6 +201,22 @@ class TQuery(TestCase):
         us = (time.time() - t) * 1000000 / ((i + 1) * 4)
         print("Blended Query searches average %.0f μs" % us)
 
+    @skip("Enable for basic benchmarking of Query")
+    def test_compiled_filter_performance(self):
+        songs = [self.s1, self.s2, self.s3, self.s4, self.s5] * 20000
+        for text in [u"foo the bar", u"&(artist=piman, album=/^i hate/)",
+                     u"|(artist=mu, #(playcount > 10), title=!quux)",
+                     u"&(#(length > 100), !version=\"cake mix\")"]:
+            query = Query(text)
+            t = time.time()
+            expected = query._match.filter(songs)
+            interpreted = time.time() - t
+            t = time.time()
+            assert query.filter(songs) == expected
+            compiled = time.time() - t
+            print("%s: interpreted %.3fs, compiled %.3fs" % (
+                text, interpreted, compiled))
+
     @skip("Enable for basic benchmarking of Query")
     def test_inequality_equalish_performance(self):
         t0 = time.time()
@@ -520,3 +536,64 @@ class TQuery_get_type(TestCase):
     def test_green(self):
         for p in ["a = /b/", "&(a = b, c = d)", "/abc/", "!x", "!&(abc, def)"]:
             self.failUnlessEqual(QueryType.VALID, Query(p).type)
+
+
+class TQuery_optimize(TestCase):
+
+    def setUp(self):
+        config.init()
+        self.songs = []
+        for i in range(3000):
+            self.songs.append(AudioFile({
+                "artist": u"common",
+                "title": u"rare" if i % 100 == 0 else u"other",
+                "~#playcount": i % 3,
+            }))
+
+    def tearDown(self):
+        config.quit()
+
+    def _leaves(self, query):
+        return [l.strip() for l in query.explain().splitlines()
+                if l.lstrip().startswith("<")]
+
+    def test_guessed(self):
+        query = Query(u"&(~people=foo, #(playcount > 1))")
+        leaves = self._leaves(query)
+        assert leaves[0].startswith("<Numcmp")
+        assert leaves[1].startswith("<Tag")
+        self.assertEqual(query.filter(self.songs), [])
+
+    def test_sampled(self):
+        query = Query(u"&(artist=common, title=rare)")
+        query.optimize(self.songs)
+        assert self._leaves(query)[0].startswith("<Tag names=['title']")
+        self.assertEqual(
+            query.filter(self.songs), query._match.filter(self.songs))
+
+    def test_union(self):
+        query = Query(u"|(title=rare, artist=common)")
+        query.optimize(self.songs)
+        assert self._leaves(query)[0].startswith("<Tag names=['artist']")
+        self.assertEqual(len(query.filter(self.songs)), len(self.songs))
+
+    def test_once(self):
+        query = Query(u"&(artist=common, title=rare)")
+        query.search(self.songs[0])
+        query.optimize(self.songs)
+        search = query.search
+        order = self._leaves(query)
+        for i in range(10):
+            query.optimize(self.songs)
+        assert query.search is search
+        self.assertEqual(self._leaves(query), order)
+
+    def test_same_result(self):
+        for text in [u"&(!artist=common, |(title=rare, #(playcount = 2)))",
+                     u"|(&(title=rare, #(playcount = 0)), !title=other)",
+                     u"&()", u"|()", u"!&(title=rare, #(playcount < 1))"]:
+            query = Query(text)
+            query.optimize(self.songs)
+            self.assertEqual(query.filter(self.songs),
+                             query._match.filter(self.songs), msg=text)
+            assert query.explain()
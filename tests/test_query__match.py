@@ -3,11 +3,14 @@
 # the Free Software Foundation; either version 2 of the License, or
 # (at your option) any later version.
 
+from senf import fsnative
+
 from tests import TestCase
 
+from quodlibet.query import Query
 from quodlibet.query._match import numexprUnit, ParseError, NumexprTag
 from quodlibet.query._match import NumexprNow, numexprTagOrSpecial, Inter,\
-    True_, Neg
+    True_, Neg, QueryCompiler
 from quodlibet.util import parse_date
 from quodlibet.formats import AudioFile
 from quodlibet.util.collection import Collection
@@ -92,3 +95,37 @@ class TQueryMatch(TestCase):
                         == numexprTagOrSpecial('now').__repr__())
         self.failUnless(NumexprTag('genre').__repr__()
                         == numexprTagOrSpecial('genre').__repr__())
+
+
+class TQueryCompiler(TestCase):
+
+    def setUp(self):
+        self.songs = [
+            AudioFile({"artist": u"foo", "title": u"bar", "~#rating": 0.5,
+                       "~filename": fsnative(u"/music/a.ogg")}),
+            AudioFile({"artist": u"Foo\nbaz", "~#playcount": 3,
+                       "~filename": fsnative(u"/music/b.ogg")}),
+            AudioFile({"~title": u"quux",
+                       "~filename": fsnative(u"/other/c.ogg")}),
+        ]
+
+    def test_compile(self):
+        for text in [
+                u"", u"foo", u"!foo", u"artist=foo", u"artist=\"foo\"c",
+                u"artist=|(foo, baz)", u"artist=&(foo, !baz)",
+                u"|(artist=baz, title=bar)", u"&(foo, #(rating > 0.2))",
+                u"#(playcount = 3)", u"#(2 < playcount < 4)",
+                u"title=quux", u"filename=music", u"~basename=c",
+                u"~people=baz", u"&()", u"|()", u"artist=/[/"]:
+            node = Query(text)._match
+            search, filter_ = QueryCompiler(node).compile()
+            self.assertEqual(filter_(self.songs), node.filter(self.songs),
+                             msg=text)
+            self.assertEqual([bool(search(s)) for s in self.songs],
+                             [bool(node.search(s)) for s in self.songs],
+                             msg=text)
+
+    def test_non_songs(self):
+        search, filter_ = QueryCompiler(Inter([True_()])).compile()
+        assert filter_([1]) == [1]
+        assert search(1)
@@ -22,7 +22,7 @@ from quodlibet.util.dprint import print_exc, format_exception, extract_tb, \
     PrintHandler
 from quodlibet.util import format_time_long as f_t_l, format_time_preferred, \
     format_time_display, format_time_seconds
-from quodlibet.util import re_escape
+from quodlibet.util import re_escape, re_literal
 from quodlibet.util.library import set_scan_dirs, get_scan_dirs
 from quodlibet.util.path import fsn2glib, glib2fsn, \
     parse_xdg_user_dirs, xdg_get_system_data_dirs, escape_filename, \
@@ -214,6 +214,20 @@ class Tre_esc(TestCase):
             re_escape("*quux#argh?woo"), r"\*quux\#argh\?woo")
 
 
+class Tre_literal(TestCase):
+
+    def test_literal(self):
+        self.assertEqual(re_literal(u""), u"")
+        self.assertEqual(re_literal(u"fo o"), u"fo o")
+        for text in [u"*quux#argh?woo", u"a\\b", u"f-o.o$", u"\u00e4"]:
+            self.assertEqual(re_literal(re_escape(text)), text)
+
+    def test_not_literal(self):
+        for pattern in [u"^foo", u"a.b", u"a*", u"(a)", u"a|b", u"[a]",
+                        u"\\d", u"\\b", u"\\1", u"foo\\"]:
+            self.assertTrue(re_literal(pattern) is None, msg=pattern)
+
+
 class Tdecode(TestCase):
     def test_empty(self):
         self.failUnlessEqual(decode(b""), "")
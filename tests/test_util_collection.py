@@ -15,7 +15,7 @@ from tests import TestCase, mkdtemp
 from quodlibet.formats import AudioFile as Fakesong
 from quodlibet.formats._audio import NUMERIC_ZERO_DEFAULT, PEOPLE
 from quodlibet.util.collection import Album, Playlist, avg, bayesian_average, \
-    FileBackedPlaylist
+    FileBackedPlaylist, collection_cache
 from quodlibet.library.libraries import FileLibrary
 from quodlibet.util import format_rating
 
@@ -261,10 +261,170 @@ class TAlbum(TestCase):
         s.failUnlessEqual(album.comma("c"), "cc3, cc1")
         s.failUnlessEqual(album.comma("~c~b"), "cc3, cc1 - bb1, bb4")
 
+    def _check_update(s, album, keys):
+        fresh = Album(next(iter(album.songs)))
+        fresh.songs = set(album.songs)
+        for key in keys:
+            s.assertEqual(album.get(key), fresh.get(key), msg=key)
+
+    def test_update(s):
+        songs = [Fakesong(dict(song)) for song in NUMERIC_SONGS]
+        for i, song in enumerate(songs):
+            song["artist"] = "artist %d" % (i % 2)
+            song["composer"] = "composer"
+        keys = ["~#length", "~#length:max", "~#added", "~#rating",
+                "~#rating:avg", "~#year", "~#bitrate", "~#discs", "~people",
+                "~peoplesort", "artist", "~length", "~rating", "~tracks"]
+
+        album = Album(songs[0])
+        album.songs = set(songs[:2])
+        s._check_update(album, keys)
+
+        album.songs.add(songs[2])
+        album.update(added=[songs[2]])
+        s._check_update(album, keys)
+
+        songs[0]["~#length"] = 40
+        songs[0]["~#rating"] = 1.0
+        songs[1]["artist"] = "artist 1\nartist 2"
+        songs[2]["discnumber"] = "2/2"
+        album.update(changed=songs)
+        s._check_update(album, keys)
+
+        album.songs.remove(songs[1])
+        album.update(removed=[songs[1]])
+        s._check_update(album, keys)
+        s.assertEqual(album("~#added"), 5)
+        s.assertEqual(album("~#length"), 41)
+
+    def test_update_cycles(s):
+        songs = [Fakesong({"artist": "a%d" % (i % 4), "~#length": i,
+                           "~#rating": (i % 10) / 10.0 + 1e-9 * i,
+                           "~#mtime": 1e17 if i == 3 else i * 0.1})
+                 for i in range(20)]
+        keys = ["~#length", "~#rating", "~#rating:sum", "~#mtime:sum",
+                "~#mtime:avg", "~people", "~peoplesort"]
+        album = Album(songs[0])
+        album.songs = set(songs)
+        s._check_update(album, keys)
+        for i in range(10):
+            for song in songs[:10]:
+                album.songs.remove(song)
+                album.update(removed=[song])
+                album.get("~#rating:sum")
+                album.get("~#mtime:sum")
+                album.get("~people")
+                album.songs.add(song)
+                album.update(added=[song])
+            s._check_update(album, keys)
+        # all tied, the order they got added in doesn't matter
+        a0 = [song for song in songs if song["artist"] == "a0"]
+        album.songs.difference_update(a0)
+        album.update(removed=a0)
+        s.assertEqual(album.list("~people"), ["a1", "a2", "a3"])
+        album.songs.update(a0)
+        album.update(added=a0)
+        s.assertEqual(album.list("~people"), ["a0", "a1", "a2", "a3"])
+        s._check_update(album, keys)
+
+    def test_update_no_rescan(s):
+        calls = []
+
+        class CountingSong(Fakesong):
+            def list(self, key):
+                calls.append(self)
+                return super(CountingSong, self).list(key)
+
+        songs = [CountingSong({"artist": "a%d" % i, "~#playcount": i})
+                 for i in range(10)]
+        album = Album(songs[0])
+        album.songs = set(songs)
+        s.assertEqual(album.get("~#playcount"), 45)
+        s.assertEqual(sorted(album.list("~people")),
+                      ["a%d" % i for i in range(10)])
+
+        del calls[:]
+        songs[3]["~#playcount"] = 10
+        album.update(changed=[songs[3]])
+        s.assertEqual(album.get("~#playcount"), 52)
+        s.assertEqual(sorted(album.list("~people")),
+                      ["a%d" % i for i in range(10)])
+        s.assertEqual(set(calls), {songs[3]})
+
     def tearDown(self):
         config.quit()
 
 
+class TCollectionCache(TestCase):
+
+    def setUp(self):
+        config.init()
+        self._max_size = collection_cache.max_size
+
+    def tearDown(self):
+        collection_cache.max_size = self._max_size
+        config.quit()
+
+    def _album(self, i):
+        songs = [Fakesong({"album": "album %d" % i, "artist": "artist",
+                           "~#length": 10 + j}) for j in range(3)]
+        album = Album(songs[0])
+        album.songs = set(songs)
+        return album
+
+    def test_size(self):
+        size = collection_cache.size
+        album = self._album(0)
+        self.assertEqual(album("~#length"), 33)
+        self.assertEqual(album("album"), "album 0")
+        assert collection_cache.size > size
+
+        hits = collection_cache.hits
+        self.assertEqual(album("album"), "album 0")
+        self.assertEqual(collection_cache.hits, hits + 1)
+
+        album.finalize()
+        self.assertEqual(collection_cache.size, size)
+
+    def test_collected(self):
+        size = collection_cache.size
+        album = self._album(0)
+        album("~people")
+        assert collection_cache.size > size
+        del album
+        self.assertEqual(collection_cache.size, size)
+
+    def test_max_size(self):
+        # drop the caches of collections from other tests
+        collection_cache.max_size = 0
+        self._album(-1)("album")
+        self.assertEqual(collection_cache.size, 0)
+        collection_cache.max_size = self._max_size
+
+        albums = [self._album(i) for i in range(10)]
+        for album in albums:
+            album("album")
+        collection_cache.max_size = collection_cache.size
+
+        # the least recently used cache has to go
+        album = self._album(10)
+        self.assertEqual(album("album"), "album 10")
+        assert collection_cache.size <= collection_cache.max_size
+
+        misses = collection_cache.misses
+        albums[-1]("album")
+        self.assertEqual(collection_cache.misses, misses)
+        albums[0]("album")
+        self.assertEqual(collection_cache.misses, misses + 1)
+
+    def test_stats(self):
+        stats = collection_cache.stats()
+        self.assertEqual(stats["size"], collection_cache.size)
+        self.assertEqual(stats["max_size"], collection_cache.max_size)
+        for key in ["collections", "hits", "misses"]:
+            assert key in stats
+
+
 class MockPlaylistResource(object):
     def __init__(self, pl):
         self.pl = pl
@@ -482,6 +642,37 @@ class TPlaylist(TestCase):
                 playlists = Playlist.playlists_featuring(NUMERIC_SONGS[0])
                 s.failUnlessEqual(set(playlists), {pl, pl2})
 
+    def test_playlists_featuring_changes(s):
+        song, other = NUMERIC_SONGS[:2]
+
+        def featuring(song):
+            return Playlist.playlists_featuring(song)
+
+        with s.wrap("playlist") as pl:
+            pl.extend([song, song, other])
+            s.failUnlessEqual(featuring(song), [pl])
+            pl.remove_songs([song], leave_dupes=True)
+            s.failUnlessEqual(featuring(song), [pl])
+            pl.remove_songs([song])
+            s.failUnlessEqual(featuring(song), [])
+            pl[:] = iter([song])
+            s.failUnlessEqual(featuring(song), [pl])
+            s.failUnlessEqual(featuring(other), [])
+            pl[0] = other
+            s.failUnlessEqual(featuring(song), [])
+            s.failUnlessEqual(featuring(other), [pl])
+            pl.extend([song])
+            pl.shuffle()
+            s.failUnlessEqual(featuring(song), [pl])
+            s.failUnlessEqual(featuring(other), [pl])
+            pl.clear()
+            s.failUnlessEqual(featuring(other), [])
+
+        with s.wrap("playlist") as pl:
+            pl.append(song)
+            pl.delete()
+            s.failUnlessEqual(featuring(song), [])
+
     def test_playlists_tag(self):
         # Arguably belongs in _audio
         songs = NUMERIC_SONGS
@@ -567,6 +758,139 @@ class TFileBackedPlaylist(TPlaylist):
                 self.assertEqual(len(h.read().splitlines()),
                                  len(NUMERIC_SONGS) + 1)
 
+    def test_write_unchanged(self):
+        with self.wrap("playlist") as pl:
+            pl.extend(NUMERIC_SONGS)
+            pl.write()
+
+            with open(pl.filename, "wb") as h:
+                h.write(b"foo\n")
+            # nothing changed since the last write
+            pl.write()
+            with open(pl.filename, "rb") as h:
+                self.assertEqual(h.read(), b"foo\n")
+
+            pl.append(NUMERIC_SONGS[0])
+            pl.write()
+            with open(pl.filename, "rb") as h:
+                self.assertEqual(len(h.read().splitlines()),
+                                 len(NUMERIC_SONGS) + 1)
+
+    def test_read_unchanged(self):
+        with self.wrap("playlist") as pl:
+            pl.extend(NUMERIC_SONGS)
+            pl.write()
+
+            lib = FileLibrary("foobar")
+            lib.add(NUMERIC_SONGS)
+            pl = self.pl("playlist", lib)
+            self.assertFalse(pl._dirty)
+            pl[:] = reversed(pl[:])
+            self.assertTrue(pl._dirty)
+
+    def test_lazy(self):
+        lib = FileLibrary("foobar")
+        lib.add(NUMERIC_SONGS)
+        with self.wrap("playlist") as pl:
+            pl.extend(NUMERIC_SONGS)
+            pl.write()
+
+            lazy = FileBackedPlaylist(self.temp, "playlist", lib, lazy=True)
+            self.assertFalse(lazy.loaded)
+            self.assertEqual(lazy("~#tracks"), len(NUMERIC_SONGS))
+            self.assertEqual(lazy("~#filesize"), pl("~#filesize"))
+            self.assertEqual(lazy("~length"), pl("~length"))
+            self.assertEqual(lazy("~tracks"), pl("~tracks"))
+            self.assertFalse(lazy.loaded)
+            # playlists with the same name are equal
+            self.assertFalse(any(p is lazy for p in
+                Playlist.playlists_featuring(NUMERIC_SONGS[0], load=False)))
+
+            self.assertEqual(lazy.songs, NUMERIC_SONGS)
+            self.assertTrue(lazy.loaded)
+            self.assertFalse(lazy._dirty)
+            lazy.delete()
+
+    def test_lazy_featuring(self):
+        lib = FileLibrary("foobar")
+        lib.add(NUMERIC_SONGS)
+        with self.wrap("playlist") as pl:
+            pl.extend(NUMERIC_SONGS)
+            pl.write()
+
+            lazy = FileBackedPlaylist(self.temp, "playlist", lib, lazy=True)
+            self.assertTrue(any(p is lazy for p in
+                Playlist.playlists_featuring(NUMERIC_SONGS[0])))
+            self.assertTrue(lazy.loaded)
+            lazy.delete()
+
+    def test_lazy_removed(self):
+        lib = FileLibrary("foobar")
+        lib.add(NUMERIC_SONGS)
+        with self.wrap("playlist") as pl:
+            pl.extend(NUMERIC_SONGS)
+            pl.write()
+
+            lazy = FileBackedPlaylist(self.temp, "playlist", lib, lazy=True)
+            lib.remove([NUMERIC_SONGS[0]])
+            self.assertFalse(any(p is lazy for p in
+                Playlist.playlists_featuring(NUMERIC_SONGS[1], load=False)))
+            self.assertFalse(lazy.loaded)
+            self.assertEqual(lazy.songs, NUMERIC_SONGS[1:])
+            self.assertEqual(lazy("~#tracks"), len(NUMERIC_SONGS) - 1)
+            lazy.delete()
+
+    def test_lazy_outdated_summary(self):
+        lib = FileLibrary("foobar")
+        lib.add(NUMERIC_SONGS)
+        with self.wrap("playlist") as pl:
+            pl.extend(NUMERIC_SONGS)
+            pl.write()
+
+            with open(pl.filename, "rb") as h:
+                first = h.readline()
+            with open(pl.filename, "wb") as h:
+                h.write(first)
+            lazy = FileBackedPlaylist(self.temp, "playlist", lib, lazy=True)
+            self.assertTrue(lazy.loaded)
+            self.assertEqual(lazy("~#tracks"), 1)
+            lazy.delete()
+
+    def test_lazy_rename(self):
+        lib = FileLibrary("foobar")
+        lib.add(NUMERIC_SONGS)
+        with self.wrap("foo") as pl:
+            pl.extend(NUMERIC_SONGS)
+            pl.write()
+
+            lazy = FileBackedPlaylist(self.temp, "foo", lib, lazy=True)
+            lazy.rename("bar")
+            self.assertFalse(os.path.exists(pl.filename))
+            self.assertEqual(lazy.songs, NUMERIC_SONGS)
+
+            reloaded = FileBackedPlaylist(self.temp, "bar", lib, lazy=True)
+            self.assertFalse(reloaded.loaded)
+            self.assertEqual(reloaded("~#tracks"), len(NUMERIC_SONGS))
+            self.assertEqual(reloaded.songs, NUMERIC_SONGS)
+            reloaded.delete()
+            lazy.delete()
+
+    def test_summary_file(self):
+        with self.wrap("foo") as pl:
+            pl.extend(NUMERIC_SONGS)
+            pl.write()
+            summary = pl.filename + FileBackedPlaylist.SUMMARY_SUFFIX
+            self.assertTrue(os.path.exists(summary))
+            self.assertTrue(FileBackedPlaylist.is_summary_file(summary))
+            self.assertFalse(FileBackedPlaylist.is_summary_file(pl.filename))
+
+            pl.rename("bar")
+            self.assertFalse(os.path.exists(summary))
+            summary = pl.filename + FileBackedPlaylist.SUMMARY_SUFFIX
+            self.assertTrue(os.path.exists(summary))
+            pl.delete()
+            self.assertFalse(os.path.exists(summary))
+
     def test_make_dup(self):
         p1 = FileBackedPlaylist.new(self.temp, "Does not exist")
         p2 = FileBackedPlaylist.new(self.temp, "Does not exist")
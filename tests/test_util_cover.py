@@ -7,6 +7,7 @@
 import glob
 import os
 import shutil
+import threading
 
 from gi.repository import Gio
 
@@ -16,11 +17,16 @@ from quodlibet import config
 from quodlibet.ext.covers.artwork_url import ArtworkUrlCover
 from quodlibet.formats import AudioFile
 from quodlibet.plugins import Plugin
+from quodlibet.util.cover.built_in import FilesystemCover, _DirectoryCache, \
+    _Directory, _get_mtimes
 from quodlibet.util.cover.http import escape_query_value
+from quodlibet.util.collection import Album
 from quodlibet.util.cover.manager import CoverManager
 from quodlibet.util.path import normalize_path, path_equal, mkdir
+from quodlibet.util.thumbnails import get_cache_info, has_fresh_thumbnail
 
-from tests import TestCase, mkdtemp
+from tests import TestCase, mkdtemp, get_data_path
+from .helper import capture_output
 
 
 bar_2_1 = AudioFile({
@@ -217,11 +223,97 @@ class TCoverManager(TestCase):
             assert path_equal(
                 actual, f, "\"%s\" should trump \"%s\"" % (f, actual))
 
+    def test_directory_cache(self):
+        cache = FilesystemCover._cache
+        f = self.add_file("cover.jpg")
+        misses = cache.misses
+        assert path_equal(
+            os.path.abspath(self._find_cover(self.song).name), f)
+        self._find_cover(self.an_album_song("other.ogg"))
+        self.assertEqual(cache.misses, misses + 1)
+
+        # new files get noticed
+        mkdir(self.full_path("covers"))
+        f = self.add_file(os.path.join("covers", "folder.jpg"))
+        assert path_equal(
+            os.path.abspath(self._find_cover(self.song).name), f)
+        self.assertEqual(cache.misses, misses + 2)
+
+        self.manager.cover_changed([self.song])
+        self._find_cover(self.song)
+        self.assertEqual(cache.misses, misses + 3)
+
+    def test_directory_cache_no_lock(self):
+        # listing a slow directory doesn't block others
+        cache = _DirectoryCache()
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow(path):
+            started.set()
+            release.wait(10)
+            return _Directory([], _get_mtimes(path, []), [])
+
+        thread = threading.Thread(target=cache.get, args=(self.dir, slow))
+        thread.start()
+        started.wait(10)
+        other = os.path.join(self.dir, "other")
+        mkdir(other)
+        entry = cache.get(
+            other, lambda p: _Directory([], _get_mtimes(p, []), []))
+        release.set()
+        thread.join()
+        self.assertEqual(cache.misses, 2)
+        assert cache.get(other, None) is entry
+        self.assertEqual(cache.hits, 1)
+
     def test_get_thumbnail(self):
         self.assertTrue(self.manager.get_pixbuf(self.song, 10, 10) is None)
         self.assertTrue(
             self.manager.get_pixbuf_many([self.song], 10, 10) is None)
 
+    def test_warm_thumbnails(self):
+        # not in a temp dir, those get skipped
+        path = get_data_path("test.png")
+        self.manager.get_cover_many = lambda songs: open(path, "rb")
+        album = Album(self.song)
+        album.songs = {self.song}
+        list(self.manager.warm_thumbnails([album], workers=1))
+        for size in [128, 256]:
+            self.assertTrue(has_fresh_thumbnail(path, (size, size)))
+            os.remove(get_cache_info(path, (size, size))[0])
+
+    def test_warm_thumbnails_main_loop(self):
+        threads = []
+
+        def get_cover_many(songs):
+            threads.append(threading.current_thread())
+
+        self.manager.get_cover_many = get_cover_many
+        album = Album(self.song)
+        album.songs = {self.song}
+        list(self.manager.warm_thumbnails([album, album], workers=2))
+        self.assertEqual(threads, [threading.current_thread()] * 2)
+
+    def test_warm_thumbnails_broken(self):
+        class Broken(object):
+            name = None
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *args):
+                pass
+
+        covers = [Broken(), None]
+        self.manager.get_cover_many = lambda songs: covers.pop(0)
+        album = Album(self.song)
+        album.songs = {self.song}
+        with capture_output():
+            list(self.manager.warm_thumbnails([album, album], workers=1))
+        # got past the broken one
+        assert not covers
+
     def test_get_many(self):
         songs = [AudioFile({"~filename": os.path.join(self.dir, "song.ogg"),
                             "title": "Ode to Baz"}),
@@ -89,6 +89,23 @@ class TThumb(TestCase):
             self.filename, (50, 60), ignore_temp=False)
         self.assertTrue(thumb)
 
+    def test_ensure_thumbnail(self):
+        self.assertFalse(
+            thumbnails.has_fresh_thumbnail(self.filename, (10, 10)))
+        self.assertTrue(thumbnails.ensure_thumbnail(self.filename, (10, 10)))
+        self.assertTrue(
+            thumbnails.has_fresh_thumbnail(self.filename, (10, 10)))
+        self.assertFalse(thumbnails.ensure_thumbnail(self.filename, (10, 10)))
+
+    def test_ensure_thumbnail_large(self):
+        size = thumbnails.ThumbSize.LARGEST + 1
+        self.assertFalse(
+            thumbnails.ensure_thumbnail(self.filename, (size, size)))
+
+    def test_ensure_thumbnail_temp(self):
+        with NamedTemporaryFile() as h:
+            self.assertFalse(thumbnails.ensure_thumbnail(h.name, (10, 10)))
+
     def test_thumb(s):
         thumb = thumbnails.get_thumbnail(
             s.filename, (50, 60), ignore_temp=False)
@@ -0,0 +1,61 @@
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+
+import os
+import json
+
+from quodlibet.util.tracing import Tracer
+
+from tests import TestCase, mkstemp
+
+
+class TTracer(TestCase):
+
+    def test_disabled(self):
+        tracer = Tracer()
+        with tracer.trace("foo"):
+            pass
+        tracer.mark("bar")
+        self.assertEqual(tracer.events, [])
+
+    def test_trace(self):
+        tracer = Tracer(True)
+        with tracer.trace("foo"):
+            with tracer.trace("bar", "import"):
+                pass
+        tracer.mark("done")
+
+        inner, outer, mark = tracer.events
+        self.assertEqual(outer["name"], "foo")
+        self.assertEqual(outer["cat"], "startup")
+        self.assertEqual(inner["cat"], "import")
+        self.assertEqual(outer["ph"], "X")
+        self.assertTrue(outer["ts"] <= inner["ts"])
+        self.assertTrue(outer["dur"] >= inner["dur"] >= 0)
+        self.assertTrue(outer["args"]["cpu_ms"] >= 0)
+        self.assertEqual(mark["ph"], "i")
+        self.assertTrue(mark["ts"] >= outer["ts"] + outer["dur"])
+
+    def test_trace_error(self):
+        tracer = Tracer(True)
+        with self.assertRaises(ValueError):
+            with tracer.trace("foo"):
+                raise ValueError
+        self.assertEqual(len(tracer.events), 1)
+
+    def test_write(self):
+        tracer = Tracer(True)
+        with tracer.trace("foo"):
+            pass
+        fd, path = mkstemp()
+        os.close(fd)
+        try:
+            tracer.write(path)
+            with open(path, "r", encoding="utf-8") as h:
+                report = json.load(h)
+        finally:
+            os.remove(path)
+        self.assertEqual(report, tracer.get_report())
+        self.assertEqual(report["traceEvents"][0]["name"], "foo")